@@ -1,8 +1,9 @@
 # Web编辑器API
 # app/routes/web_editor.py
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, Response, stream_with_context
 from .. import services
 import os
+import json
 
 # 创建一个名为'web_editor'的蓝图
 # 注意：我们将在app工厂中为它添加url_prefix='/editor'
@@ -180,6 +181,24 @@ def ai_edit_code():
     except Exception as e:
         return jsonify({'error': f'智能体编辑失败: {str(e)}'}), 500
 
+@web_editor_bp.route('/ai-edit-stream', methods=['POST'])
+def ai_edit_code_stream():
+    """智能体编辑代码（SSE流式返回）"""
+    data = request.get_json() or {}
+    original_code = data.get('original_code')
+    edit_request = data.get('edit_request')
+    filename = data.get('filename')
+    
+    if not original_code or not edit_request:
+        return jsonify({'error': '缺少原始代码或修改需求'}), 400
+    
+    def generate():
+        for event in services.ai_edit_code_stream(original_code, edit_request, filename):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @web_editor_bp.route('/page-associations/<process_id>')
 def get_page_associations(process_id):
     """获取页面与视频的关联关系"""
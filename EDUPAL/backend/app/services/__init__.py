@@ -37,6 +37,7 @@ from .main_services import (
     apply_background_to_code,
     search_editor_files,
     ai_edit_code,
+    ai_edit_code_stream,
     get_page_video_associations,
     
     # 别忘了添加您可能自定义的任何其他服务函数
@@ -8,7 +8,7 @@ import concurrent.futures
 import threading
 from bs4 import BeautifulSoup
 from exa_py import Exa
-from ..utils.api_call import process_text
+from ..utils.api_call import process_text, stream_text
 import zipfile # <--- 【新增】在文件顶部导入 zipfile 模块
 import glob # <--- 【新增】导入 glob 模块
 import subprocess
@@ -3617,33 +3617,24 @@ def get_page_video_associations(process_id):
         'video_preview_dir': video_preview_dir
     } 
 
-def ai_edit_code(original_code: str, edit_request: str, filename: str = None) -> dict:
-    """
-    使用AI智能体编辑代码
+def load_ai_edit_config():
+    """读取智能体编辑所需的API配置"""
+    with open('config.json', 'r', encoding='utf-8') as f:
+        config = json.load(f)
     
-    Args:
-        original_code: 原始代码
-        edit_request: 用户的修改需求
-        filename: 文件名（可选）
+    api_key = config.get('api_key')
+    model = config.get('model', 'gpt-4.5-preview')
     
-    Returns:
-        dict: 包含修改后代码的结果
-    """
-    try:
-        # 读取配置
-        with open('config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        api_key = config.get('api_key')
-        model = config.get('model', 'gpt-4.5-preview')
-        
-        if not api_key:
-            raise Exception("未配置API密钥")
-        
-        # 构建提示词
-        file_info = f"文件名: {filename}\n\n" if filename else ""
-        
-        prompt = f"""你是一个专业的代码编辑助手。请根据用户的修改需求，对给定的代码进行修改。
+    if not api_key:
+        raise Exception("未配置API密钥")
+    
+    return api_key, model
+
+def build_ai_edit_prompt(original_code: str, edit_request: str, filename: str = None) -> str:
+    """构建智能体编辑代码的提示词"""
+    file_info = f"文件名: {filename}\n\n" if filename else ""
+    
+    return f"""你是一个专业的代码编辑助手。请根据用户的修改需求，对给定的代码进行修改。
 
 {file_info}用户修改需求：
 {edit_request}
@@ -3661,29 +3652,75 @@ def ai_edit_code(original_code: str, edit_request: str, filename: str = None) ->
 
 修改后的代码："""
 
+def clean_ai_edit_response(ai_response: str) -> str:
+    """清理模型响应，提取代码部分"""
+    modified_code = ai_response.strip()
+    
+    # 如果响应被代码块包裹，提取其中的代码
+    if modified_code.startswith('```'):
+        lines = modified_code.split('\n')
+        # 去掉第一行的```和可能的语言标识
+        if len(lines) > 1:
+            lines = lines[1:]
+        # 去掉最后一行的```
+        if lines and lines[-1].strip() == '```':
+            lines = lines[:-1]
+        modified_code = '\n'.join(lines)
+    
+    return modified_code
+
+def ai_edit_code(original_code: str, edit_request: str, filename: str = None) -> dict:
+    """
+    使用AI智能体编辑代码
+    
+    Args:
+        original_code: 原始代码
+        edit_request: 用户的修改需求
+        filename: 文件名（可选）
+    
+    Returns:
+        dict: 包含修改后代码的结果
+    """
+    try:
+        api_key, model = load_ai_edit_config()
+        prompt = build_ai_edit_prompt(original_code, edit_request, filename)
+
         # 调用API获取修改后的代码
-        ai_response = process_text(prompt, api_key, model)
-        
-        # 清理响应，提取代码部分
-        modified_code = ai_response.strip()
-        
-        # 如果响应被代码块包裹，提取其中的代码
-        if modified_code.startswith('```'):
-            lines = modified_code.split('\n')
-            # 去掉第一行的```和可能的语言标识
-            if len(lines) > 1:
-                lines = lines[1:]
-            # 去掉最后一行的```
-            if lines and lines[-1].strip() == '```':
-                lines = lines[:-1]
-            modified_code = '\n'.join(lines)
+        # 用户重复提交同一需求时希望得到新的结果，不使用响应缓存
+        ai_response = process_text(prompt, api_key, model, use_cache=False)
         
         return {
             'original_code': original_code,
-            'modified_code': modified_code,
+            'modified_code': clean_ai_edit_response(ai_response),
             'edit_request': edit_request,
             'filename': filename
         }
         
     except Exception as e:
-        raise Exception(f"AI编辑代码失败: {str(e)}")
\ No newline at end of file
+        raise Exception(f"AI编辑代码失败: {str(e)}")
+
+def ai_edit_code_stream(original_code: str, edit_request: str, filename: str = None):
+    """
+    使用AI智能体编辑代码（流式版本）
+    
+    逐段产出事件字典：生成过程中为 {'delta': 新增文本}，
+    结束时为 {'done': True, 'modified_code': 清理后的完整代码}，出错时为 {'error': 错误信息}
+    """
+    try:
+        api_key, model = load_ai_edit_config()
+        prompt = build_ai_edit_prompt(original_code, edit_request, filename)
+        
+        chunks = []
+        for delta in stream_text(prompt, api_key, model, use_cache=False):
+            chunks.append(delta)
+            yield {'delta': delta}
+        
+        yield {
+            'done': True,
+            'modified_code': clean_ai_edit_response(''.join(chunks)),
+            'edit_request': edit_request,
+            'filename': filename
+        }
+    
+    except Exception as e:
+        yield {'error': f"AI编辑代码失败: {str(e)}"}
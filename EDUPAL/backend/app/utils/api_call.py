@@ -1,35 +1,286 @@
-import base64
 import time
-from openai import OpenAI
+import asyncio
+from openai import OpenAI, AsyncOpenAI
+import httpx
 import json
 import socket
 import ssl
 import re
 import os
-from typing import List, Dict, Any, Union, Tuple, Optional
-from PIL import Image
+import hashlib
+import sqlite3
+import threading
+from typing import List, Dict, Any, Union, Tuple, Optional, Iterator, AsyncIterator
+
+from . import llm_limiter
+from . import image_payload
 
 # 常量定义
 MAX_RETRIES = 3
 TIMEOUT = 1200
+MAX_TOKENS = 3200
+TEMPERATURE = 1
+
+# HTTP连接池配置（可通过环境变量覆盖）
+BASE_URL = os.environ.get('LLM_BASE_URL', "https://yeysai.com/v1/")
+POOL_MAX_CONNECTIONS = int(os.environ.get('LLM_POOL_MAX_CONNECTIONS', '20'))
+POOL_MAX_KEEPALIVE = int(os.environ.get('LLM_POOL_MAX_KEEPALIVE', '10'))
+POOL_KEEPALIVE_EXPIRY = float(os.environ.get('LLM_POOL_KEEPALIVE_EXPIRY', '120'))
+CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', '10'))
+
+
+class ClientRegistry:
+    """
+    进程内共享的OpenAI客户端注册表
+
+    按 (api_key, base_url, model) 复用同一个 OpenAI 客户端及其底层的 httpx 连接池，
+    避免每次调用都重新建立TLS连接。
+    """
+
+    def __init__(self, max_connections: int = POOL_MAX_CONNECTIONS, max_keepalive: int = POOL_MAX_KEEPALIVE,
+                 keepalive_expiry: float = POOL_KEEPALIVE_EXPIRY, timeout: float = TIMEOUT,
+                 connect_timeout: float = CONNECT_TIMEOUT):
+        self.max_connections = max_connections
+        self.max_keepalive = max_keepalive
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.clients_created = 0
+        self.client_reuses = 0
+        self.requests_sent = 0
+
+    def _on_request(self, request):
+        with self._lock:
+            self.requests_sent += 1
+
+    def get_client(self, api_key: str, model: str, base_url: str = BASE_URL) -> OpenAI:
+        """获取（或创建）与参数对应的共享客户端"""
+        key = (api_key, base_url, model)
+        with self._lock:
+            # 连接池不能跨fork使用，子进程中重新建立
+            if self._pid != os.getpid():
+                self._clients = {}
+                self._pid = os.getpid()
+            client = self._clients.get(key)
+            if client is not None:
+                self.client_reuses += 1
+                return client
+
+            http_client = httpx.Client(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+                event_hooks={'request': [self._on_request]},
+            )
+            # 重试和429退避由 _call_api 配合机器级限流处理，不使用SDK内置的重试
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=0)
+            self._clients[key] = client
+            self.clients_created += 1
+            return client
+
+    def stats(self) -> Dict[str, Any]:
+        """返回客户端复用统计"""
+        with self._lock:
+            return {
+                'clients': len(self._clients),
+                'clients_created': self.clients_created,
+                'client_reuses': self.client_reuses,
+                'requests_sent': self.requests_sent,
+                'max_connections': self.max_connections,
+                'max_keepalive_connections': self.max_keepalive,
+            }
+
+    def close_all(self):
+        """关闭所有客户端及其连接池"""
+        with self._lock:
+            for client in self._clients.values():
+                try:
+                    client.close()
+                except Exception as e:
+                    print(f"关闭API客户端失败: {e}")
+            self._clients = {}
+
+
+_client_registry = ClientRegistry()
+
+
+def get_client_registry() -> ClientRegistry:
+    """返回进程内共享的客户端注册表"""
+    return _client_registry
+
+
+# LLM响应缓存配置（可通过环境变量覆盖）
+CACHE_ENABLED = os.environ.get('LLM_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+CACHE_PATH = os.environ.get(
+    'LLM_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'edupal', 'llm_responses.sqlite3')
+)
+CACHE_MAX_BYTES = int(os.environ.get('LLM_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+CACHE_DEFAULT_TTL = float(os.environ['LLM_CACHE_TTL']) if os.environ.get('LLM_CACHE_TTL') else None
+
+
+class ResponseCache:
+    """
+    基于SQLite的LLM响应缓存，按请求内容哈希寻址
+
+    - 键为 (model, messages(含图片base64数据), max_tokens, temperature) 的SHA-256
+    - 总大小超过 max_bytes 时按最近访问时间淘汰（LRU）
+    - 使用WAL模式和busy timeout，可被流水线派生的多个子进程同时读写
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_bytes: int = CACHE_MAX_BYTES, default_ttl: Optional[float] = CACHE_DEFAULT_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, Any]], max_tokens: int, temperature: float) -> str:
+        """根据请求参数计算缓存键；包含 BASE_URL，切换服务商后不会命中其他服务商的回复"""
+        payload = json.dumps(
+            {'base_url': BASE_URL, 'model': model, 'messages': messages,
+             'max_tokens': max_tokens, 'temperature': temperature},
+            ensure_ascii=False, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork 出来的子进程不能复用父进程的连接
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, model TEXT, response TEXT NOT NULL, size INTEGER NOT NULL, '
+                'created_at REAL NOT NULL, last_access REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)')
+            conn.execute('CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)')
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _bump(self, conn: sqlite3.Connection, name: str):
+        conn.execute(
+            'INSERT INTO counters(name, value) VALUES (?, 1) '
+            'ON CONFLICT(name) DO UPDATE SET value = value + 1',
+            (name,)
+        )
+
+    def get(self, key: str, ttl: Optional[float] = None) -> Optional[str]:
+        """读取缓存，未命中或已过期时返回None"""
+        ttl = self.default_ttl if ttl is None else ttl
+        now = time.time()
+        try:
+            with self._lock:
+                conn = self._connect()
+                row = conn.execute('SELECT response, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is not None and (ttl is None or now - row[1] <= ttl):
+                    conn.execute('UPDATE responses SET last_access = ? WHERE key = ?', (now, key))
+                    self._bump(conn, 'hits')
+                    self.hits += 1
+                    return row[0]
+                self._bump(conn, 'misses')
+                self.misses += 1
+                return None
+        except sqlite3.Error as e:
+            print(f"读取LLM缓存失败: {e}")
+            self.misses += 1
+            return None
+
+    def set(self, key: str, model: str, response: str):
+        """写入缓存，并在超出容量时淘汰最久未访问的条目"""
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        try:
+            with self._lock:
+                conn = self._connect()
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO responses(key, model, response, size, created_at, last_access) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (key, model, response, size, now, now)
+                    )
+                    total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+                    if total > self.max_bytes:
+                        rows = conn.execute('SELECT key, size FROM responses ORDER BY last_access ASC').fetchall()
+                        for old_key, old_size in rows:
+                            if total <= self.max_bytes:
+                                break
+                            conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                            total -= old_size
+                            self._bump(conn, 'evictions')
+                    conn.execute('COMMIT')
+                except Exception:
+                    conn.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as e:
+            print(f"写入LLM缓存失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回当前进程与全局（所有进程累计）的命中统计"""
+        result = {'process_hits': self.hits, 'process_misses': self.misses}
+        try:
+            with self._lock:
+                conn = self._connect()
+                counters = dict(conn.execute('SELECT name, value FROM counters').fetchall())
+                entries, total = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+            result.update({
+                'hits': counters.get('hits', 0),
+                'misses': counters.get('misses', 0),
+                'evictions': counters.get('evictions', 0),
+                'entries': entries,
+                'total_bytes': total,
+                'max_bytes': self.max_bytes,
+            })
+        except sqlite3.Error as e:
+            print(f"读取LLM缓存统计失败: {e}")
+        return result
+
+    def clear(self):
+        """清空缓存条目和计数器"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM responses')
+            conn.execute('DELETE FROM counters')
+
+
+_default_cache = None
+
+
+def get_default_cache() -> Optional[ResponseCache]:
+    """返回进程内共享的默认缓存实例；通过 LLM_CACHE_ENABLED=0 关闭缓存"""
+    global _default_cache
+    if not CACHE_ENABLED:
+        return None
+    if _default_cache is None:
+        _default_cache = ResponseCache()
+    return _default_cache
+
 
 class APIClient:
-    def __init__(self, api_key: str, model: str = "gpt-4o"):
+    def __init__(self, api_key: str, model: str = "gpt-4o", cache: Optional[ResponseCache] = None):
         self.api_key = api_key
         self.model = model
-        # 初始化 OpenAI 客户端
-        self.client = OpenAI(
-            api_key=api_key,
-            base_url="https://yeysai.com/v1/",
-        )
-    
-    def encode_image(self, image_path: str) -> str:
-        """将图片编码为base64格式"""
-        try:
-            with open(image_path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode('utf-8')
-        except Exception as e:
-            raise Exception(f"图片编码失败: {str(e)}")
+        # 未显式传入时使用进程共享的默认缓存（可能为None，即关闭缓存）
+        self.cache = cache if cache is not None else get_default_cache()
+        # 从注册表获取共享的 OpenAI 客户端，复用keep-alive连接
+        self.client = get_client_registry().get_client(api_key, model, BASE_URL)
+        # 机器级限流（可能为None，即关闭限流）
+        self.limiter = llm_limiter.get_rate_limiter()
     
     def extract_images_from_text(self, text: str) -> List[str]:
         """从文本中提取图片路径，格式为 ![](xx/xxx.jpg)，但忽略被引号包裹的情况"""
@@ -64,23 +315,15 @@ class APIClient:
         return matches
     
     def get_image_size(self, image_path: str) -> Tuple[int, int]:
-        """获取图片的尺寸 (width, height)"""
-        with Image.open(image_path) as img:
-            return img.width, img.height
+        """获取图片的尺寸 (width, height)，结果来自图片缓存"""
+        width, height = image_payload.load_image(image_path).size
+        if width is None:
+            raise ValueError("无法读取图片尺寸")
+        return width, height
     
     def get_mime_type(self, file_path: str) -> str:
         """根据文件扩展名获取MIME类型"""
-        ext = os.path.splitext(file_path)[1].lower()
-        mime_types = {
-            '.jpg': 'image/jpeg',
-            '.jpeg': 'image/jpeg',
-            '.png': 'image/png',
-            '.gif': 'image/gif',
-            '.webp': 'image/webp',
-            '.bmp': 'image/bmp',
-            '.svg': 'image/svg+xml'
-        }
-        return mime_types.get(ext, 'application/octet-stream')
+        return image_payload.get_mime_type(file_path)
     
     def resolve_image_path(self, img_path: str, base_path: Optional[str] = None) -> str:
         """
@@ -105,26 +348,34 @@ class APIClient:
             # 如果没有base_path，相对于当前工作目录
             return os.path.abspath(img_path)
 
-    def call_api_with_text_and_images(self, text: str, base_path: Optional[str] = None) -> str:
+    def call_api_with_text_and_images(self, text: str, base_path: Optional[str] = None, use_cache: bool = True, cache_ttl: Optional[float] = None) -> str:
         """
         处理文本中的图片引用并调用API
         
         Args:
             text: 要处理的文本
             base_path: 图片路径的基准目录（通常是markdown文件所在目录）
+            use_cache: 是否读取/写入响应缓存
+            cache_ttl: 缓存有效期（秒），超过则视为未命中
         """
         # 提取图片路径
         image_paths = self.extract_images_from_text(text)
     
         modified_text = text
         offset = 0  # 由于插入新字符，原始索引会发生偏移
+        # 每张图片只处理一次：尺寸和缩小后的 data URL 都来自图片缓存
+        payloads = {}
 
         for match in re.finditer(r"!\[\]\((.+?)\)", text):
             img_path = match.group(1)
             try:
                 # 解析图片路径
                 resolved_img_path = self.resolve_image_path(img_path, base_path)
-                width, height = self.get_image_size(resolved_img_path)
+                if resolved_img_path not in payloads:
+                    payloads[resolved_img_path] = image_payload.load_image(resolved_img_path)
+                width, height = payloads[resolved_img_path].size
+                if width is None:
+                    raise ValueError("无法读取图片尺寸")
                 size_str = f"（尺寸：{width}×{height}）"
                 insert_pos = match.end() + offset
                 modified_text = modified_text[:insert_pos] + size_str + modified_text[insert_pos:]
@@ -143,9 +394,8 @@ class APIClient:
             try:
                 # 解析图片路径
                 resolved_img_path = self.resolve_image_path(img_path, base_path)
-                base64_image = self.encode_image(resolved_img_path)
-                mime_type = self.get_mime_type(resolved_img_path)
-                image_data_url = f"data:{mime_type};base64,{base64_image}"
+                payload = payloads.get(resolved_img_path) or image_payload.load_image(resolved_img_path)
+                image_data_url = payload.data_url
                 
                 content.append({
                     "type": "image_url",
@@ -157,9 +407,9 @@ class APIClient:
                 print(f"处理图片 {img_path} 时出错: {str(e)}")
         
         # 调用API
-        return self._call_api(content)
+        return self._call_api(content, use_cache=use_cache, cache_ttl=cache_ttl)
     
-    def call_api_with_text(self, text: str) -> str:
+    def call_api_with_text(self, text: str, use_cache: bool = True, cache_ttl: Optional[float] = None) -> str:
         """简单的纯文本API调用，不处理图片"""
         content = [
             {
@@ -169,29 +419,109 @@ class APIClient:
         ]
         
         # 调用API
-        return self._call_api(content)
+        return self._call_api(content, use_cache=use_cache, cache_ttl=cache_ttl)
+    
+    def stream_api_with_text(self, text: str, use_cache: bool = True, cache_ttl: Optional[float] = None) -> Iterator[str]:
+        """
+        流式的纯文本API调用，逐段产出模型生成的文本
+
+        命中缓存时一次性产出完整结果；流式生成完成后将完整结果写入缓存。
+        """
+        messages = [
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": text}]
+            }
+        ]
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model, messages, MAX_TOKENS, TEMPERATURE)
+            if use_cache:
+                cached = self.cache.get(cache_key, ttl=cache_ttl)
+                if cached is not None:
+                    yield cached
+                    return
+
+        reserved = llm_limiter.estimate_tokens(messages, MAX_TOKENS)
+        if self.limiter is not None:
+            self.limiter.acquire(self.model, reserved)
+        chunks = []
+        usage = None
+        try:
+            # include_usage: 最后一个chunk带上本次请求的token用量，用于修正限流器预扣的额度
+            stream = self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=MAX_TOKENS,
+                temperature=TEMPERATURE,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for chunk in stream:
+                if getattr(chunk, 'usage', None) is not None:
+                    usage = chunk.usage
+                delta = extract_stream_delta(chunk)
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        except Exception as e:
+            # 429 时暂停该模型在所有进程中的调用
+            block_if_rate_limited(self.limiter, self.model, e)
+            raise
+        finally:
+            # 成功、出错或调用方提前关闭生成器时都按实际用量修正预扣的额度
+            if self.limiter is not None:
+                self.limiter.settle(self.model, reserved, stream_tokens_used(usage, messages, chunks))
+
+        if cache_key is not None and chunks:
+            self.cache.set(cache_key, self.model, ''.join(chunks))
     
-    def _call_api(self, content: List[Dict[str, Any]]) -> str:
-        """发送API请求并处理响应"""
+    def _call_api(self, content: List[Dict[str, Any]], use_cache: bool = True, cache_ttl: Optional[float] = None) -> str:
+        """
+        发送API请求并处理响应
+
+        Args:
+            content: 消息内容
+            use_cache: 为False时跳过缓存，直接请求API（结果仍会写入缓存）
+            cache_ttl: 缓存有效期（秒），None表示使用缓存的默认值
+        """
+        messages = [
+            {
+                "role": "user",
+                "content": content
+            }
+        ]
+
+        cache_key = None
+        if self.cache is not None:
+            cache_key = self.cache.make_key(self.model, messages, MAX_TOKENS, TEMPERATURE)
+            if use_cache:
+                cached = self.cache.get(cache_key, ttl=cache_ttl)
+                if cached is not None:
+                    return cached
+
         retry_count = 0
         response_content = None
+        succeeded = False
+        reserved = llm_limiter.estimate_tokens(messages, MAX_TOKENS)
 
         while retry_count < MAX_RETRIES:
+            if self.limiter is not None:
+                self.limiter.acquire(self.model, reserved)
             try:
                 response = self.client.chat.completions.create(
                     model=self.model,
-                    messages=[
-                        {
-                            "role": "user",
-                            "content": content
-                        }
-                    ],
-                    max_tokens=3200, # 1000
-                    temperature=1
+                    messages=messages,
+                    max_tokens=MAX_TOKENS, # 1000
+                    temperature=TEMPERATURE
                 )
+                if self.limiter is not None:
+                    self.limiter.settle_response(self.model, reserved, response)
                 
                 if response.choices and response.choices[0].message:
                     response_content = response.choices[0].message.content
+                    succeeded = response_content is not None
                 else:
                     response_content = f"错误：响应中未找到预期的'content'。响应: {response}"
                 break  # 成功，跳出重试循环
@@ -199,16 +529,213 @@ class APIClient:
             except Exception as e:
                 retry_count += 1
                 print(f"API调用错误 (尝试 {retry_count}/{MAX_RETRIES}): {e}")
+                delay = after_llm_failure(self.limiter, self.model, e, reserved, retry_count)
                 if retry_count >= MAX_RETRIES:
                     response_content = f"错误：达到最大重试次数后API调用失败。最后错误: {e}"
                     break
-                print(f"等待 {5 * retry_count} 秒后重试...")  # 简单的退避策略
-                time.sleep(5 * retry_count)
+                print(f"等待 {delay:.1f} 秒后重试...")
+                time.sleep(delay)
+
+        # 只缓存成功的响应，错误信息不入缓存
+        if succeeded and cache_key is not None:
+            self.cache.set(cache_key, self.model, response_content)
+
+        return response_content if response_content else "未能获取模型响应"
+
+
+def after_llm_failure(limiter, model: str, error: Exception, reserved: int, attempt: int) -> float:
+    """
+    请求失败后的处理，返回重试前应等待的秒数
+
+    退还预扣的token；429 时按 Retry-After 或指数退避暂停该模型在所有进程中的调用。
+    """
+    delay = llm_limiter.backoff_delay(attempt, llm_limiter.retry_after_seconds(error))
+    if limiter is not None:
+        limiter.settle_response(model, reserved, None)
+        if llm_limiter.is_rate_limited(error):
+            limiter.block(model, delay)
+    return delay
+
+
+def block_if_rate_limited(limiter, model: str, error: Exception):
+    """429 时按 Retry-After 或退避时间暂停该模型在所有进程中的调用（不退还额度）"""
+    if limiter is not None and llm_limiter.is_rate_limited(error):
+        limiter.block(model, llm_limiter.backoff_delay(1, llm_limiter.retry_after_seconds(error)))
+
+
+def stream_tokens_used(usage, messages: List[Dict[str, Any]], chunks: List[str]) -> int:
+    """
+    流式调用实际消耗的token数
+
+    有 usage 时直接取用；中途出错或被关闭而没有 usage 时，按输入和已收到的输出估算；
+    没有收到任何输出时视为未消耗。
+    """
+    total = getattr(usage, 'total_tokens', None)
+    if total is not None:
+        return total
+    if not chunks:
+        return 0
+    output = [{'role': 'assistant', 'content': ''.join(chunks)}]
+    return llm_limiter.estimate_tokens(messages, 0) + llm_limiter.estimate_tokens(output, 0)
+
+
+def extract_stream_delta(chunk) -> str:
+    """从流式响应的一个chunk中取出新增文本"""
+    if not chunk.choices:
+        return ''
+    delta = chunk.choices[0].delta
+    return (delta.content or '') if delta is not None else ''
+
+
+class AsyncAPIClient:
+    """
+    基于asyncio的API客户端，支持流式输出
+
+    用法:
+        client = AsyncAPIClient(api_key, model)
+        text = await client.call_api_with_text(prompt)
+        async for delta in client.call_api_with_text(prompt, stream=True):
+            ...
+    """
+
+    def __init__(self, api_key: str, model: str = "gpt-4o", cache: Optional[ResponseCache] = None):
+        self.api_key = api_key
+        self.model = model
+        self.cache = cache if cache is not None else get_default_cache()
+        self.limiter = llm_limiter.get_rate_limiter()
+        # 异步客户端绑定事件循环，不放入进程级注册表，由调用方负责 close()
+        self.client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=BASE_URL,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    max_keepalive_connections=POOL_MAX_KEEPALIVE,
+                    keepalive_expiry=POOL_KEEPALIVE_EXPIRY,
+                ),
+                timeout=httpx.Timeout(TIMEOUT, connect=CONNECT_TIMEOUT),
+            ),
+        )
+
+    def call_api_with_text(self, text: str, stream: bool = False, use_cache: bool = True, cache_ttl: Optional[float] = None):
+        """
+        纯文本API调用
+
+        Returns:
+            stream为False时返回协程（结果为完整文本）；为True时返回逐段产出文本的异步生成器
+        """
+        messages = [
+            {
+                "role": "user",
+                "content": [{"type": "text", "text": text}]
+            }
+        ]
+        if stream:
+            return self._stream_api(messages, use_cache, cache_ttl)
+        return self._call_api(messages, use_cache, cache_ttl)
+
+    def _lookup_cache(self, messages: List[Dict[str, Any]], use_cache: bool, cache_ttl: Optional[float]):
+        if self.cache is None:
+            return None, None
+        cache_key = self.cache.make_key(self.model, messages, MAX_TOKENS, TEMPERATURE)
+        cached = self.cache.get(cache_key, ttl=cache_ttl) if use_cache else None
+        return cache_key, cached
+
+    async def _call_api(self, messages: List[Dict[str, Any]], use_cache: bool, cache_ttl: Optional[float]) -> str:
+        """发送异步API请求并处理响应，重试策略与 APIClient._call_api 一致"""
+        cache_key, cached = self._lookup_cache(messages, use_cache, cache_ttl)
+        if cached is not None:
+            return cached
+
+        retry_count = 0
+        response_content = None
+        succeeded = False
+        reserved = llm_limiter.estimate_tokens(messages, MAX_TOKENS)
+
+        while retry_count < MAX_RETRIES:
+            if self.limiter is not None:
+                await self.limiter.acquire_async(self.model, reserved)
+            try:
+                response = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    max_tokens=MAX_TOKENS,
+                    temperature=TEMPERATURE
+                )
+                if self.limiter is not None:
+                    self.limiter.settle_response(self.model, reserved, response)
+
+                if response.choices and response.choices[0].message:
+                    response_content = response.choices[0].message.content
+                    succeeded = response_content is not None
+                else:
+                    response_content = f"错误：响应中未找到预期的'content'。响应: {response}"
+                break
+
+            except Exception as e:
+                retry_count += 1
+                print(f"API调用错误 (尝试 {retry_count}/{MAX_RETRIES}): {e}")
+                delay = after_llm_failure(self.limiter, self.model, e, reserved, retry_count)
+                if retry_count >= MAX_RETRIES:
+                    response_content = f"错误：达到最大重试次数后API调用失败。最后错误: {e}"
+                    break
+                print(f"等待 {delay:.1f} 秒后重试...")
+                await asyncio.sleep(delay)
+
+        if succeeded and cache_key is not None:
+            self.cache.set(cache_key, self.model, response_content)
 
         return response_content if response_content else "未能获取模型响应"
 
+    async def _stream_api(self, messages: List[Dict[str, Any]], use_cache: bool, cache_ttl: Optional[float]) -> AsyncIterator[str]:
+        """以流式方式请求API，逐段产出文本；完成后写入缓存"""
+        cache_key, cached = self._lookup_cache(messages, use_cache, cache_ttl)
+        if cached is not None:
+            yield cached
+            return
 
-def process_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-preview", base_path: Optional[str] = None) -> str:
+        reserved = llm_limiter.estimate_tokens(messages, MAX_TOKENS)
+        if self.limiter is not None:
+            await self.limiter.acquire_async(self.model, reserved)
+        chunks = []
+        usage = None
+        try:
+            # include_usage: 最后一个chunk带上本次请求的token用量，用于修正限流器预扣的额度
+            stream = await self.client.chat.completions.create(
+                model=self.model,
+                messages=messages,
+                max_tokens=MAX_TOKENS,
+                temperature=TEMPERATURE,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if getattr(chunk, 'usage', None) is not None:
+                    usage = chunk.usage
+                delta = extract_stream_delta(chunk)
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+        except Exception as e:
+            # 429 时暂停该模型在所有进程中的调用
+            block_if_rate_limited(self.limiter, self.model, e)
+            raise
+        finally:
+            # 成功、出错或调用方提前关闭生成器时都按实际用量修正预扣的额度
+            if self.limiter is not None:
+                self.limiter.settle(self.model, reserved, stream_tokens_used(usage, messages, chunks))
+
+        if cache_key is not None and chunks:
+            self.cache.set(cache_key, self.model, ''.join(chunks))
+
+    async def close(self):
+        """关闭底层连接池"""
+        await self.client.close()
+
+
+
+def process_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-preview", base_path: Optional[str] = None, use_cache: bool = True, cache_ttl: Optional[float] = None) -> str:
     """
     处理包含图片的文本
     
@@ -217,14 +744,18 @@ def process_text_with_images(text: str, api_key: str, model: str = "gpt-4.5-prev
         api_key: API密钥
         model: 使用的模型
         base_path: 图片路径的基准目录（通常是markdown文件所在目录）
+        use_cache: 是否使用响应缓存
+        cache_ttl: 缓存有效期（秒）
     """
     client = APIClient(api_key=api_key, model=model)
-    return client.call_api_with_text_and_images(text, base_path)
+    return client.call_api_with_text_and_images(text, base_path, use_cache=use_cache, cache_ttl=cache_ttl)
 
-def process_text(text: str, api_key: str, model: str = "gpt-4.5-preview") -> str:
+def process_text(text: str, api_key: str, model: str = "gpt-4.5-preview", use_cache: bool = True, cache_ttl: Optional[float] = None) -> str:
     """简单的纯文本处理函数"""
     client = APIClient(api_key=api_key, model=model)
-    return client.call_api_with_text(text)
-
-
+    return client.call_api_with_text(text, use_cache=use_cache, cache_ttl=cache_ttl)
 
+def stream_text(text: str, api_key: str, model: str = "gpt-4.5-preview", use_cache: bool = True, cache_ttl: Optional[float] = None) -> Iterator[str]:
+    """流式的纯文本处理函数，逐段产出模型生成的文本"""
+    client = APIClient(api_key=api_key, model=model)
+    return client.stream_api_with_text(text, use_cache=use_cache, cache_ttl=cache_ttl)
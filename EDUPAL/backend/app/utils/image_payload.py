@@ -0,0 +1,301 @@
+"""
+多模态请求的图片预处理缓存
+
+Coder、Speecher 和章节融合的 prompt 会反复引用同一张 MinerU 图片，原先每次调用都用 PIL 打开图片读取尺寸，
+再把原始文件整体 base64 编码（有的图片有几 MB）。本模块把图片缩小/重新压缩后的 data URL 和原图尺寸
+保存在 SQLite 中（WAL + BEGIN IMMEDIATE，与 LLM 响应缓存相同的跨进程方式）：
+本文件是 Paper2Video/image_payload.py 的副本，默认使用同一个缓存文件，后端与流水线共用处理结果。
+
+- files 表: (路径, mtime, 文件大小) -> 内容哈希和原图尺寸，文件未变化时不必重新读取
+- variants 表: (内容哈希, 最长边, 格式) -> data URL，同一张图片在不同目录下的副本共用一条记录
+- 总大小超过上限时按最近访问时间淘汰（LRU）
+
+prompt 中的尺寸仍是原图尺寸（代码生成按原图比例排版），只是发给模型的图片被缩小。
+处理结果是确定的，相同图片得到相同的 data URL，不影响响应缓存的命中。
+"""
+
+import io
+import os
+import time
+import base64
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image
+
+IMAGE_CACHE_ENABLED = os.environ.get('LLM_IMAGE_CACHE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+IMAGE_CACHE_PATH = os.environ.get(
+    'LLM_IMAGE_CACHE_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'edupal', 'llm_images.sqlite3')
+)
+IMAGE_CACHE_MAX_BYTES = int(os.environ.get('LLM_IMAGE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+# 发送给模型的图片最长边，超过时等比缩小；0 表示不缩小
+IMAGE_MAX_SIDE = int(os.environ.get('LLM_IMAGE_MAX_SIDE', '1536'))
+# 重新压缩的格式: auto（不透明图片用JPEG，带透明通道的用PNG）/ jpeg / png / original（保持原文件）
+IMAGE_FORMAT = os.environ.get('LLM_IMAGE_FORMAT', 'auto').lower()
+IMAGE_JPEG_QUALITY = int(os.environ.get('LLM_IMAGE_JPEG_QUALITY', '85'))
+# 进程内最多保留的 data URL 条数（Flask 服务是长期运行的进程，不能无限增长），其余从 SQLite 读取
+IMAGE_MEMORY_ENTRIES = int(os.environ.get('LLM_IMAGE_MEMORY_ENTRIES', '32'))
+
+MIME_TYPES = {
+    '.jpg': 'image/jpeg',
+    '.jpeg': 'image/jpeg',
+    '.png': 'image/png',
+    '.gif': 'image/gif',
+    '.webp': 'image/webp',
+    '.bmp': 'image/bmp',
+    '.svg': 'image/svg+xml'
+}
+
+
+def get_mime_type(file_path: str) -> str:
+    """根据文件扩展名获取MIME类型"""
+    return MIME_TYPES.get(os.path.splitext(file_path)[1].lower(), 'application/octet-stream')
+
+
+class ImagePayload:
+    """一张图片在请求中的内容：data URL 和原图尺寸（无法读取尺寸时 width/height 为None）"""
+
+    __slots__ = ('data_url', 'width', 'height')
+
+    def __init__(self, data_url: str, width: Optional[int], height: Optional[int]):
+        self.data_url = data_url
+        self.width = width
+        self.height = height
+
+    @property
+    def size(self) -> Tuple[Optional[int], Optional[int]]:
+        return self.width, self.height
+
+
+def _has_alpha(img: Image.Image) -> bool:
+    return img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def render_variant(data: bytes, file_path: str, max_side: int = IMAGE_MAX_SIDE,
+                   image_format: str = IMAGE_FORMAT) -> Tuple[str, Optional[int], Optional[int]]:
+    """
+    把图片缩小并重新压缩，返回 (data URL, 原图宽, 原图高)
+
+    PIL 无法打开的图片（如SVG）或动图按原文件发送；重新压缩后反而更大时也保留原文件。
+    """
+    original = (get_mime_type(file_path), data)
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            width, height = img.width, img.height
+            if image_format == 'original' or getattr(img, 'is_animated', False):
+                mime_type, payload = original
+            else:
+                img.load()
+                needs_resize = max_side > 0 and max(width, height) > max_side
+                target = image_format
+                if target == 'auto':
+                    target = 'png' if _has_alpha(img) else 'jpeg'
+                variant = img
+                if needs_resize:
+                    variant = img.copy()
+                    variant.thumbnail((max_side, max_side), Image.LANCZOS)
+                buffer = io.BytesIO()
+                if target == 'jpeg':
+                    if variant.mode not in ('RGB', 'L'):
+                        variant = variant.convert('RGB')
+                    variant.save(buffer, format='JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True)
+                    mime_type = 'image/jpeg'
+                else:
+                    variant.save(buffer, format='PNG', optimize=True)
+                    mime_type = 'image/png'
+                if needs_resize or buffer.tell() < len(data):
+                    payload = buffer.getvalue()
+                else:
+                    mime_type, payload = original
+    except Exception:
+        width = height = None
+        mime_type, payload = original
+    return f"data:{mime_type};base64,{base64.b64encode(payload).decode('utf-8')}", width, height
+
+
+class ImagePayloadCache:
+    """基于SQLite的图片 data URL 缓存，可被流水线派生的多个子进程同时读写"""
+
+    def __init__(self, path: str = IMAGE_CACHE_PATH, max_bytes: int = IMAGE_CACHE_MAX_BYTES,
+                 max_side: int = IMAGE_MAX_SIDE, image_format: str = IMAGE_FORMAT,
+                 memory_entries: int = IMAGE_MEMORY_ENTRIES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.image_format = image_format
+        self.hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.memory_entries = memory_entries
+        self._memory = OrderedDict()   # 进程内LRU: (路径, mtime, 大小) -> ImagePayload
+        self._memory_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork 出来的子进程不能复用父进程的连接
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT NOT NULL, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, '
+                'digest TEXT NOT NULL, width INTEGER, height INTEGER, PRIMARY KEY (path, mtime_ns, size))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS variants ('
+                'digest TEXT NOT NULL, max_side INTEGER NOT NULL, format TEXT NOT NULL, '
+                'data_url TEXT NOT NULL, width INTEGER, height INTEGER, original_size INTEGER NOT NULL, '
+                'size INTEGER NOT NULL, last_access REAL NOT NULL, PRIMARY KEY (digest, max_side, format))'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_variants_last_access ON variants(last_access)')
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _lookup(self, file_key) -> Optional[ImagePayload]:
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT v.data_url, v.width, v.height, v.original_size, v.size, v.digest FROM files f '
+                'JOIN variants v ON v.digest = f.digest AND v.max_side = ? AND v.format = ? '
+                'WHERE f.path = ? AND f.mtime_ns = ? AND f.size = ?',
+                (self.max_side, self.image_format) + file_key
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE variants SET last_access = ? WHERE digest = ? AND max_side = ? AND format = ?',
+                         (time.time(), row[5], self.max_side, self.image_format))
+        self.bytes_saved += max(0, row[3] - row[4])
+        return ImagePayload(row[0], row[1], row[2])
+
+    def _store(self, file_key, data: bytes) -> ImagePayload:
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute(
+                'SELECT data_url, width, height FROM variants WHERE digest = ? AND max_side = ? AND format = ?',
+                (digest, self.max_side, self.image_format)
+            ).fetchone()
+        if row is not None:
+            # 相同内容的图片（如复制到另一个目录）已处理过
+            payload = ImagePayload(*row)
+        else:
+            payload = ImagePayload(*render_variant(data, file_key[0], self.max_side, self.image_format))
+        size = len(payload.data_url)
+        self.bytes_saved += max(0, len(data) - size)
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO files(path, mtime_ns, size, digest, width, height) VALUES (?, ?, ?, ?, ?, ?)',
+                    file_key + (digest, payload.width, payload.height)
+                )
+                conn.execute(
+                    'INSERT OR REPLACE INTO variants(digest, max_side, format, data_url, width, height, '
+                    'original_size, size, last_access) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (digest, self.max_side, self.image_format, payload.data_url, payload.width, payload.height,
+                     len(data), size, now)
+                )
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM variants').fetchone()[0]
+                if total > self.max_bytes:
+                    rows = conn.execute(
+                        'SELECT digest, max_side, format, size FROM variants ORDER BY last_access ASC'
+                    ).fetchall()
+                    for old_digest, old_side, old_format, old_size in rows:
+                        if total <= self.max_bytes:
+                            break
+                        conn.execute('DELETE FROM variants WHERE digest = ? AND max_side = ? AND format = ?',
+                                     (old_digest, old_side, old_format))
+                        total -= old_size
+                    conn.execute('DELETE FROM files WHERE digest NOT IN (SELECT digest FROM variants)')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        return payload
+
+    def get(self, image_path: str) -> ImagePayload:
+        """返回图片的 data URL 和原图尺寸；文件无法读取时抛出 OSError"""
+        path = os.path.abspath(image_path)
+        st = os.stat(path)
+        file_key = (path, st.st_mtime_ns, st.st_size)
+        with self._memory_lock:
+            payload = self._memory.get(file_key)
+            if payload is not None:
+                self._memory.move_to_end(file_key)
+                self.hits += 1
+                return payload
+        try:
+            payload = self._lookup(file_key)
+        except sqlite3.Error as e:
+            print(f"读取图片缓存失败: {e}")
+        if payload is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            with open(path, 'rb') as f:
+                data = f.read()
+            try:
+                payload = self._store(file_key, data)
+            except sqlite3.Error as e:
+                print(f"写入图片缓存失败: {e}")
+                payload = ImagePayload(*render_variant(data, path, self.max_side, self.image_format))
+        self._remember(file_key, payload)
+        return payload
+
+    def _remember(self, file_key, payload: ImagePayload):
+        if self.memory_entries <= 0:
+            return
+        with self._memory_lock:
+            self._memory[file_key] = payload
+            self._memory.move_to_end(file_key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回当前进程的命中情况和缓存总体大小"""
+        result = {'process_hits': self.hits, 'process_misses': self.misses, 'process_bytes_saved': self.bytes_saved,
+                  'max_side': self.max_side, 'format': self.image_format}
+        try:
+            with self._lock:
+                conn = self._connect()
+                entries, total, original = conn.execute(
+                    'SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(original_size), 0) FROM variants'
+                ).fetchone()
+            result.update({'entries': entries, 'total_bytes': total, 'original_bytes': original,
+                           'max_bytes': self.max_bytes})
+        except sqlite3.Error as e:
+            print(f"读取图片缓存统计失败: {e}")
+        return result
+
+
+_default_image_cache = None
+
+
+def get_image_cache() -> Optional[ImagePayloadCache]:
+    """返回进程内共享的图片缓存；通过 LLM_IMAGE_CACHE_ENABLED=0 关闭"""
+    global _default_image_cache
+    if not IMAGE_CACHE_ENABLED:
+        return None
+    if _default_image_cache is None:
+        _default_image_cache = ImagePayloadCache()
+    return _default_image_cache
+
+
+def load_image(image_path: str) -> ImagePayload:
+    """取得图片的请求内容；关闭缓存时每次重新处理（仍会缩小图片）"""
+    cache = get_image_cache()
+    if cache is not None:
+        return cache.get(image_path)
+    with open(image_path, 'rb') as f:
+        return ImagePayload(*render_variant(f.read(), image_path))
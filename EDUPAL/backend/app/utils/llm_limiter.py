@@ -0,0 +1,322 @@
+"""
+机器级的 LLM 调用限流
+
+流水线会同时运行多个 Chapter_Coder / Chapter_Speecher / Chapter_Brain 子进程，各自调用模型服务。
+本文件是 Paper2Video/llm_limiter.py 的副本，默认使用同一个状态文件，后端与流水线的调用共享同一份额度。
+本模块把每个模型的令牌桶保存在 SQLite 中（WAL + BEGIN IMMEDIATE，与 LLM 响应缓存相同的跨进程方式），
+同一台机器上的所有进程共享同一份额度：
+
+- 按模型限制每分钟请求数 (rpm) 和每分钟 token 数 (tpm)，桶容量为一分钟的额度
+- 调用前按 prompt 长度和 max_tokens 预估 token 数并预扣，调用结束后按实际用量多退少补
+- 收到 429 时按 Retry-After（没有时按带抖动的指数退避）暂停该模型在所有进程中的调用
+- waiters 表记录正在等待额度的调用，stats() 返回各模型的排队数
+
+限流库不可用时（如文件无法写入）直接放行，不影响调用本身。
+"""
+
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import sqlite3
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional
+
+LIMITER_ENABLED = os.environ.get('LLM_LIMITER_ENABLED', '1').lower() not in ('0', 'false', 'no')
+LIMITER_PATH = os.environ.get(
+    'LLM_LIMITER_PATH',
+    os.path.join(os.path.expanduser('~'), '.cache', 'edupal', 'llm_limiter.sqlite3')
+)
+# 默认额度；按模型覆盖，例如 LLM_RATE_LIMITS='{"gpt-4o": {"rpm": 500, "tpm": 300000}}'
+DEFAULT_RPM = float(os.environ.get('LLM_RPM', '60'))
+DEFAULT_TPM = float(os.environ.get('LLM_TPM', '150000'))
+# 预估 token 数时每张图片按此计算
+IMAGE_TOKEN_ESTIMATE = int(os.environ.get('LLM_IMAGE_TOKEN_ESTIMATE', '1000'))
+# 指数退避: 第 n 次重试等待 min(BACKOFF_MAX, BACKOFF_BASE * 2**n) 的一半到全部
+BACKOFF_BASE = float(os.environ.get('LLM_BACKOFF_BASE', '2'))
+BACKOFF_MAX = float(os.environ.get('LLM_BACKOFF_MAX', '60'))
+# 等待额度时单次休眠的上限，便于及时响应其他进程退还的额度
+MAX_POLL_INTERVAL = 2.0
+
+
+def _load_model_limits() -> Dict[str, Dict[str, float]]:
+    raw = os.environ.get('LLM_RATE_LIMITS')
+    if not raw:
+        return {}
+    try:
+        return json.loads(raw)
+    except ValueError as e:
+        print(f"LLM_RATE_LIMITS 格式错误，使用默认额度: {e}")
+        return {}
+
+
+def estimate_tokens(messages: List[Dict[str, Any]], max_tokens: int) -> int:
+    """粗略预估一次调用消耗的 token 数：ASCII 约4个字符一个token，其他字符按1个计，再加上 max_tokens"""
+    tokens = 0
+    for message in messages:
+        content = message.get('content')
+        parts = content if isinstance(content, list) else [{'type': 'text', 'text': content or ''}]
+        for part in parts:
+            if part.get('type') == 'image_url':
+                tokens += IMAGE_TOKEN_ESTIMATE
+            else:
+                text = part.get('text') or ''
+                ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+                tokens += ascii_chars // 4 + (len(text) - ascii_chars)
+    return tokens + max_tokens
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """判断异常是否为 429 限流"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 429
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """读取异常响应中的 Retry-After（秒数或HTTP日期）/ retry-after-ms，没有时返回None"""
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if not headers:
+        return None
+    try:
+        if headers.get('retry-after-ms'):
+            return max(0.0, float(headers['retry-after-ms']) / 1000)
+        value = headers.get('retry-after')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """第 attempt 次重试前的等待时间：有 Retry-After 时以它为准，否则为带抖动的指数退避"""
+    if retry_after is not None:
+        return retry_after + random.uniform(0, 1)
+    ceiling = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+    return ceiling / 2 + random.uniform(0, ceiling / 2)
+
+
+class RateLimiter:
+    """按模型的令牌桶限流器，状态保存在 SQLite 中，可被多个进程同时使用"""
+
+    def __init__(self, path: str = LIMITER_PATH, limits: Optional[Dict[str, Dict[str, float]]] = None,
+                 default_rpm: float = DEFAULT_RPM, default_tpm: float = DEFAULT_TPM):
+        self.path = path
+        self.limits = limits if limits is not None else _load_model_limits()
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def limits_for(self, model: str):
+        """返回模型的 (rpm, tpm)"""
+        limits = self.limits.get(model) or self.limits.get('default') or {}
+        return float(limits.get('rpm', self.default_rpm)), float(limits.get('tpm', self.default_tpm))
+
+    def _connect(self) -> sqlite3.Connection:
+        # fork 出来的子进程不能复用父进程的连接
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS buckets ('
+                'model TEXT PRIMARY KEY, requests REAL NOT NULL, tokens REAL NOT NULL, '
+                'updated_at REAL NOT NULL, blocked_until REAL NOT NULL DEFAULT 0)'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS waiters ('
+                'id TEXT PRIMARY KEY, pid INTEGER NOT NULL, model TEXT NOT NULL, since REAL NOT NULL)'
+            )
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _transaction(self, func):
+        """在 BEGIN IMMEDIATE 事务中执行 func(conn, now)，写锁保证多进程间读-改-写的原子性"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(conn, time.time())
+                conn.execute('COMMIT')
+                return result
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+
+    def _refilled(self, conn, model: str, now: float):
+        """读取并补充令牌桶，返回 (requests, tokens, blocked_until)"""
+        rpm, tpm = self.limits_for(model)
+        row = conn.execute('SELECT requests, tokens, updated_at, blocked_until FROM buckets WHERE model = ?',
+                           (model,)).fetchone()
+        if row is None:
+            return rpm, tpm, 0.0
+        requests, tokens, updated_at, blocked_until = row
+        elapsed = max(0.0, now - updated_at)
+        return (min(rpm, requests + elapsed * rpm / 60), min(tpm, tokens + elapsed * tpm / 60), blocked_until)
+
+    def _save(self, conn, model, requests, tokens, now, blocked_until):
+        conn.execute(
+            'INSERT OR REPLACE INTO buckets(model, requests, tokens, updated_at, blocked_until) VALUES (?, ?, ?, ?, ?)',
+            (model, requests, tokens, now, blocked_until)
+        )
+
+    def _try_acquire(self, model: str, tokens: int, waiter_id: Optional[str]) -> float:
+        """尝试取得一次调用的额度；成功返回0，否则返回建议的等待秒数（并登记为等待者）"""
+        rpm, tpm = self.limits_for(model)
+
+        def attempt(conn, now):
+            requests, available, blocked_until = self._refilled(conn, model, now)
+            # 单次调用超过整个 tpm 额度时，等桶满后放行，避免永远等待
+            needed = min(tokens, tpm)
+            if now >= blocked_until and requests >= 1 and available >= needed:
+                self._save(conn, model, requests - 1, available - tokens, now, blocked_until)
+                if waiter_id:
+                    conn.execute('DELETE FROM waiters WHERE id = ?', (waiter_id,))
+                return 0.0
+            self._save(conn, model, requests, available, now, blocked_until)
+            if waiter_id:
+                conn.execute('INSERT OR IGNORE INTO waiters(id, pid, model, since) VALUES (?, ?, ?, ?)',
+                             (waiter_id, os.getpid(), model, now))
+            wait = max(blocked_until - now,
+                       (1 - requests) * 60 / rpm if requests < 1 else 0.0,
+                       (needed - available) * 60 / tpm if available < needed else 0.0)
+            return max(wait, 0.05)
+
+        return self._transaction(attempt)
+
+    def _leave_queue(self, waiter_id: str):
+        try:
+            self._transaction(lambda conn, now: conn.execute('DELETE FROM waiters WHERE id = ?', (waiter_id,)))
+        except sqlite3.Error:
+            pass
+
+    def acquire(self, model: str, tokens: int) -> float:
+        """阻塞直到取得额度，返回等待的秒数"""
+        waiter_id = uuid.uuid4().hex
+        started = time.time()
+        try:
+            while True:
+                try:
+                    wait = self._try_acquire(model, tokens, waiter_id)
+                except sqlite3.Error as e:
+                    print(f"LLM限流状态不可用，直接放行: {e}")
+                    return time.time() - started
+                if wait == 0:
+                    return time.time() - started
+                time.sleep(min(wait, MAX_POLL_INTERVAL) + random.uniform(0, 0.05))
+        except BaseException:
+            self._leave_queue(waiter_id)
+            raise
+
+    async def acquire_async(self, model: str, tokens: int) -> float:
+        """acquire 的异步版本，等待期间不阻塞事件循环"""
+        waiter_id = uuid.uuid4().hex
+        started = time.time()
+        try:
+            while True:
+                try:
+                    wait = self._try_acquire(model, tokens, waiter_id)
+                except sqlite3.Error as e:
+                    print(f"LLM限流状态不可用，直接放行: {e}")
+                    return time.time() - started
+                if wait == 0:
+                    return time.time() - started
+                await asyncio.sleep(min(wait, MAX_POLL_INTERVAL) + random.uniform(0, 0.05))
+        except BaseException:
+            self._leave_queue(waiter_id)
+            raise
+
+    def settle(self, model: str, reserved: int, used: Optional[int]):
+        """调用结束后按实际 token 用量修正预扣的额度；used 为None时保留预估值"""
+        if used is None or used == reserved:
+            return
+
+        def adjust(conn, now):
+            requests, available, blocked_until = self._refilled(conn, model, now)
+            _, tpm = self.limits_for(model)
+            self._save(conn, model, requests, min(tpm, available + reserved - used), now, blocked_until)
+
+        try:
+            self._transaction(adjust)
+        except sqlite3.Error as e:
+            print(f"更新LLM限流状态失败: {e}")
+
+    def settle_response(self, model: str, reserved: int, response):
+        """按响应中的 usage.total_tokens 修正预扣的额度；response 为None（请求失败）时全部退还"""
+        if response is None:
+            self.settle(model, reserved, 0)
+            return
+        usage = getattr(response, 'usage', None)
+        self.settle(model, reserved, getattr(usage, 'total_tokens', None))
+
+    def block(self, model: str, seconds: float):
+        """暂停该模型在所有进程中的调用 seconds 秒（收到 429 时调用）"""
+        def set_blocked(conn, now):
+            requests, available, blocked_until = self._refilled(conn, model, now)
+            self._save(conn, model, requests, available, now, max(blocked_until, now + seconds))
+
+        try:
+            self._transaction(set_blocked)
+        except sqlite3.Error as e:
+            print(f"更新LLM限流状态失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """返回各模型的剩余额度、暂停截止时间和排队中的调用数"""
+        def collect(conn, now):
+            # 清理已退出进程留下的等待记录
+            for waiter_id, pid in conn.execute('SELECT id, pid FROM waiters').fetchall():
+                if not _pid_alive(pid):
+                    conn.execute('DELETE FROM waiters WHERE id = ?', (waiter_id,))
+            queued = dict(conn.execute('SELECT model, COUNT(*) FROM waiters GROUP BY model').fetchall())
+            models = {}
+            for (model,) in conn.execute('SELECT model FROM buckets').fetchall():
+                requests, available, blocked_until = self._refilled(conn, model, now)
+                rpm, tpm = self.limits_for(model)
+                models[model] = {
+                    'rpm': rpm, 'tpm': tpm,
+                    'available_requests': round(requests, 2), 'available_tokens': round(available),
+                    'blocked_for_seconds': round(max(0.0, blocked_until - now), 1),
+                    'queued': queued.get(model, 0),
+                }
+            return {'models': models, 'queue_depth': sum(queued.values())}
+
+        try:
+            return self._transaction(collect)
+        except sqlite3.Error as e:
+            print(f"读取LLM限流状态失败: {e}")
+            return {'models': {}, 'queue_depth': None}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+_default_limiter = None
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """返回进程内共享的限流器；通过 LLM_LIMITER_ENABLED=0 关闭限流"""
+    global _default_limiter
+    if not LIMITER_ENABLED:
+        return None
+    if _default_limiter is None:
+        _default_limiter = RateLimiter()
+    return _default_limiter
@@ -2,10 +2,11 @@ import os
 import json
 import argparse
 import sys
+import threading
 
 # 添加根目录到Python路径，以便导入根目录的api_call
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_call import process_text_with_images
+from api_call import APIClient
 
 
 def load_config(config_path: str = None) -> dict:
@@ -120,16 +121,114 @@ def save_result(result: str, markdown_path: str, model: str, output_dir: str = N
     except Exception as e:
         raise Exception(f"保存代码到文件失败: {str(e)}")
 
+DEFAULT_PROMPT_TEMPLATE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompt_template", "Method_Coder.txt"
+)
+
+
+class CodeGenerator:
+    """
+    页面代码生成器
+
+    配置、提示词模板和API客户端只在创建时加载一次，之后逐页调用 generate_code()，
+    供 batch_coder 在同一进程中批量生成（多个线程可共用同一个实例）。
+    """
+
+    def __init__(self, prompt_template_path: str = None, api_key: str = None, model: str = None):
+        if api_key is None or model is None:
+            config = load_config()
+            api_key = api_key or config['api_key']
+            model = model or config['model']
+        self.model = model
+        self.prompt_template_path = prompt_template_path or DEFAULT_PROMPT_TEMPLATE
+        self.prompt = load_prompt_template(self.prompt_template_path)
+        self.client = APIClient(api_key=api_key, model=model)
+
+    def generate_code(self, markdown_path: str, output_dir: str = None):
+        """
+        处理 Markdown 文件内容并生成对应的Python代码
+        1. 加载 Markdown 内容
+        2. 组合提示词和内容
+        3. 调用 API 处理
+        4. 清理代码结果
+        5. 保存代码到文件
+
+        Returns:
+            (清理后的代码, 输出文件路径)
+        """
+        from datetime import datetime
+
+        page_name = os.path.basename(markdown_path)
+
+        def print_progress(step, message):
+            timestamp = datetime.now().strftime("%H:%M:%S")
+            print(f"[{timestamp}] [{page_name}] [STEP {step}] {message}")
+            sys.stdout.flush()
+
+        try:
+            # 加载 Markdown 内容
+            print_progress(1, f"加载 Markdown 内容: {page_name}")
+            content = load_markdown_content(markdown_path)
+
+            # 组合提示词和内容
+            print_progress(2, "组合提示词和内容")
+            combined_text = f"{self.prompt}\n\n以下是需要转换为代码的文本：\n\n{content}"
+
+            # 获取markdown文件所在目录作为图片路径基准
+            markdown_dir = os.path.dirname(os.path.abspath(markdown_path))
+
+            # 调用 API 处理文本，传递正确的base_path
+            print_progress(3, f"调用 {self.model} API 生成代码...")
+            print("      注意：此步骤通常需要30-90秒，请耐心等待...")
+            sys.stdout.flush()
+
+            result = self.client.call_api_with_text_and_images(combined_text, base_path=markdown_dir)
+
+            # 清理代码结果
+            print_progress(4, "清理和验证生成的代码")
+            clean_result = clean_code_result(result)
+
+            # 保存结果到文件
+            print_progress(5, "保存代码到文件")
+            output_file = save_result(clean_result, markdown_path, self.model, output_dir)
+
+            print_progress("✓", f"代码生成完成，已保存到: {output_file}")
+
+            return clean_result, output_file
+
+        except Exception as e:
+            print_progress("✗", f"处理失败: {str(e)}")
+            raise Exception(f"处理 Markdown 文件生成代码失败: {str(e)}")
+
+
+# 进程内共享的生成器，按提示词模板区分
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_code_generator(prompt_template_path: str = None) -> CodeGenerator:
+    """返回进程内共享的代码生成器，同一模板只加载一次配置、模板和API客户端"""
+    key = os.path.abspath(prompt_template_path or DEFAULT_PROMPT_TEMPLATE)
+    with _generators_lock:
+        if key not in _generators:
+            _generators[key] = CodeGenerator(key)
+        return _generators[key]
+
+
+def generate_code(page: str, output_dir: str = None, prompt_template_path: str = None):
+    """
+    在当前进程中为一个页面（markdown文件）生成代码
+
+    Returns:
+        (清理后的代码, 输出文件路径)
+    """
+    return get_code_generator(prompt_template_path).generate_code(page, output_dir)
+
+
 def process_markdown_to_code(markdown_path: str, prompt_template_path: str, api_key: str, model: str = "gpt-4.5-preview", output_dir: str = None) -> str:
     """
-    处理 Markdown 文件内容并生成对应的Python代码
-    1. 加载提示词模板
-    2. 加载 Markdown 内容
-    3. 组合提示词和内容
-    4. 调用 API 处理
-    5. 清理代码结果
-    6. 保存代码到文件
-    
+    使用指定的提示词模板、API密钥和模型处理单个 Markdown 文件并生成代码
+
     Args:
         markdown_path: markdown文件路径
         prompt_template_path: 提示词模板路径
@@ -137,56 +236,12 @@ def process_markdown_to_code(markdown_path: str, prompt_template_path: str, api_
         model: 使用的模型名称
         output_dir: 输出目录路径
     """
-    import sys
-    from datetime import datetime
-    
-    def print_progress(step, message):
-        timestamp = datetime.now().strftime("%H:%M:%S")
-        print(f"[{timestamp}] [STEP {step}] {message}")
-        sys.stdout.flush()
-    
-    try:
-        # 加载提示词模板
-        print_progress(1, f"加载提示词模板: {prompt_template_path}")
-        prompt = load_prompt_template(prompt_template_path)
-        
-        # 加载 Markdown 内容
-        print_progress(2, f"加载 Markdown 内容: {os.path.basename(markdown_path)}")
-        content = load_markdown_content(markdown_path)
-        
-        # 组合提示词和内容
-        print_progress(3, "组合提示词和内容")
-        combined_text = f"{prompt}\n\n以下是需要转换为代码的文本：\n\n{content}"
-        
-        # 获取markdown文件所在目录作为图片路径基准
-        markdown_dir = os.path.dirname(os.path.abspath(markdown_path))
-        
-        # 调用 API 处理文本，传递正确的base_path
-        print_progress(4, f"调用 {model} API 生成代码...")
-        print("      注意：此步骤通常需要30-90秒，请耐心等待...")
-        sys.stdout.flush()
-        
-        result = process_text_with_images(combined_text, api_key, model, base_path=markdown_dir)
-        
-        # 清理代码结果
-        print_progress(5, "清理和验证生成的代码")
-        clean_result = clean_code_result(result)
-        
-        # 保存结果到文件
-        print_progress(6, "保存代码到文件")
-        output_file = save_result(clean_result, markdown_path, model, output_dir)
-        
-        print_progress("✓", f"代码生成完成，已保存到: {output_file}")
-        
-        return clean_result, output_file
-    
-    except Exception as e:
-        print_progress("✗", f"处理失败: {str(e)}")
-        raise Exception(f"处理 Markdown 文件生成代码失败: {str(e)}")
+    generator = CodeGenerator(prompt_template_path, api_key=api_key, model=model)
+    return generator.generate_code(markdown_path, output_dir)
 
 def main():
     """
-    主函数，用于测试
+    命令行入口：为单个Markdown文件生成代码
     """
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='将Markdown文件转换为Python代码')
@@ -195,25 +250,12 @@ def main():
     parser.add_argument('--prompt-template', help='提示词模板路径', default=None)
     args = parser.parse_args()
     
-    # 如果没有提供提示词模板路径，则使用默认路径
-    if args.prompt_template is None:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)  # 上一级目录（根目录）
-        prompt_template_path = os.path.join(parent_dir, "prompt_template", "Method_Coder.txt")
-    else:
-        prompt_template_path = args.prompt_template
-    
-    # 从配置文件加载API key和model
-    config = load_config()
-    api_key = config['api_key']
-    model = config['model']
-    
     try:
-        # 处理文件
-        result, output_file = process_markdown_to_code(args.markdown_path, prompt_template_path, api_key, model, output_dir=args.output_dir)
+        # 处理文件（未提供提示词模板时使用 prompt_template/Method_Coder.txt）
+        result, output_file = generate_code(args.markdown_path, args.output_dir, args.prompt_template)
         print(f"\n代码已保存到文件：{output_file}")
     except Exception as e:
         print(f"错误：{str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
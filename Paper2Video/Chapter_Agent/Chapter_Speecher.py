@@ -2,10 +2,11 @@ import os
 import json
 import argparse
 import sys
+import threading
 
 # 添加根目录到Python路径，以便导入根目录的api_call
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api_call import process_text_with_images
+from api_call import APIClient
 
 
 def load_config(config_path: str = None) -> dict:
@@ -90,81 +91,142 @@ def save_result(result: str, markdown_path: str, python_path: str, model: str, o
     except Exception as e:
         raise Exception(f"保存演讲稿到文件失败: {str(e)}")
 
+PROMPT_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "prompt_template")
+DEFAULT_PROMPT_TEMPLATE = os.path.join(PROMPT_TEMPLATE_DIR, "Method_Speecher.txt")
+# 第一个页面没有上一页讲稿时使用的上下文
+DEFAULT_PREVIOUS_SPEECH = os.path.join(PROMPT_TEMPLATE_DIR, "Speecher-1.txt")
+
+
+class SpeechGenerator:
+    """
+    页面演讲稿生成器
+
+    配置、提示词模板、默认上下文和API客户端只在创建时加载一次，之后逐页调用 generate_speech()，
+    供 batch_speecher 在同一进程中批量生成。
+    """
+
+    def __init__(self, prompt_template_path: str = None, api_key: str = None, model: str = None):
+        if api_key is None or model is None:
+            config = load_config()
+            api_key = api_key or config['api_key']
+            model = model or config['model']
+        self.model = model
+        self.prompt_template_path = prompt_template_path or DEFAULT_PROMPT_TEMPLATE
+        self.prompt = load_prompt_template(self.prompt_template_path)
+        self.default_previous_speech = load_previous_speech(DEFAULT_PREVIOUS_SPEECH)
+        self.client = APIClient(api_key=api_key, model=model)
+
+    def generate_speech(self, markdown_path: str, python_path: str, previous_speech: str = None, output_dir: str = None):
+        """
+        处理 Markdown 和 Python 文件内容并生成演讲稿
+        1. 加载 Markdown 内容
+        2. 加载 Python 代码
+        3. 组合提示词、上一个页面的讲稿和内容
+        4. 调用 API 处理
+        5. 保存演讲稿到文件
+
+        Args:
+            previous_speech: 上一个页面的讲稿内容，为None时使用默认上下文
+
+        Returns:
+            (演讲稿, 输出文件路径)
+        """
+        import time
+
+        def print_step(step_num, step_name, description=""):
+            """打印带时间戳的步骤信息"""
+            timestamp = time.strftime("%H:%M:%S")
+            print(f"[{timestamp}] 步骤 {step_num}: {step_name}")
+            if description:
+                print(f"         {description}")
+            sys.stdout.flush()
+
+        try:
+            print_step(1, "加载论文内容", f"从 {os.path.basename(markdown_path)}")
+            # 加载 Markdown 内容
+            content = load_markdown_content(markdown_path)
+
+            print_step(2, "加载Manim代码", f"从 {os.path.basename(python_path)}")
+            # 加载 Python 代码内容
+            code_content = load_python_content(python_path)
+
+            if previous_speech is None:
+                previous_speech = self.default_previous_speech
+
+            print_step(3, "组合提示词内容", "准备API请求数据")
+            # 组合提示词和内容
+            combined_text = f"{self.prompt}\n\n上一个页面的讲稿内容如下：\n\n{previous_speech}\n\n论文原文的内容如下：\n\n{content}\n\n其对应的manim脚本内容如下：\n\n{code_content}"
+
+            # 获取markdown文件所在目录作为图片路径基准
+            markdown_dir = os.path.dirname(os.path.abspath(markdown_path))
+
+            print_step(4, "🤖 调用AI API生成演讲稿", f"⚠️ 此步骤需要30-90秒，请耐心等待...")
+            print(f"         使用模型: {self.model}")
+            print(f"         API调用开始...")
+            sys.stdout.flush()
+
+            start_time = time.time()
+            # 调用 API 处理文本，传递正确的base_path
+            result = self.client.call_api_with_text_and_images(combined_text, base_path=markdown_dir)
+            end_time = time.time()
+
+            print(f"         ✅ API调用完成！耗时: {end_time - start_time:.1f}秒")
+
+            print_step(5, "保存演讲稿文件", f"准备写入文件...")
+            # 保存结果到文件
+            output_file = save_result(result, markdown_path, python_path, self.model, output_dir)
+
+            print(f"         ✅ 演讲稿已保存: {os.path.basename(output_file)}")
+            print(f"         📊 生成内容长度: {len(result)} 字符")
+
+            return result, output_file
+
+        except Exception as e:
+            print(f"         ❌ 错误: {str(e)}")
+            sys.stdout.flush()
+            raise Exception(f"处理文件生成演讲稿失败: {str(e)}")
+
+
+# 进程内共享的生成器，按提示词模板区分
+_generators = {}
+_generators_lock = threading.Lock()
+
+
+def get_speech_generator(prompt_template_path: str = None) -> SpeechGenerator:
+    """返回进程内共享的演讲稿生成器，同一模板只加载一次配置、模板和API客户端"""
+    key = os.path.abspath(prompt_template_path or DEFAULT_PROMPT_TEMPLATE)
+    with _generators_lock:
+        if key not in _generators:
+            _generators[key] = SpeechGenerator(key)
+        return _generators[key]
+
+
+def generate_speech(page, previous: str = None, output_dir: str = None, prompt_template_path: str = None):
+    """
+    在当前进程中为一个页面生成演讲稿
+
+    Args:
+        page: (markdown文件路径, 对应的Python代码文件路径)
+        previous: 上一个页面的讲稿内容，为None时使用默认上下文
+
+    Returns:
+        (演讲稿, 输出文件路径)
+    """
+    markdown_path, python_path = page
+    return get_speech_generator(prompt_template_path).generate_speech(markdown_path, python_path, previous, output_dir)
+
+
 def process_content_to_speech(markdown_path: str, python_path: str, previous_speech_path: str, prompt_template_path: str, api_key: str, model: str = "gpt-4.5-preview", output_dir: str = None) -> str:
     """
-    处理 Markdown 和 Python 文件内容并生成演讲稿
-    1. 加载提示词模板
-    2. 加载 Markdown 内容
-    3. 加载 Python 代码
-    4. 加载上一个页面的讲稿
-    5. 组合提示词和内容
-    6. 调用 API 处理
-    7. 保存演讲稿到文件
-    """
-    import sys
-    import time
-    
-    def print_step(step_num, step_name, description=""):
-        """打印带时间戳的步骤信息"""
-        timestamp = time.strftime("%H:%M:%S")
-        print(f"[{timestamp}] 步骤 {step_num}: {step_name}")
-        if description:
-            print(f"         {description}")
-        sys.stdout.flush()
-    
-    try:
-        print_step(1, "加载提示词模板", f"从 {prompt_template_path}")
-        # 加载提示词模板
-        prompt = load_prompt_template(prompt_template_path)
-        
-        print_step(2, "加载论文内容", f"从 {os.path.basename(markdown_path)}")
-        # 加载 Markdown 内容
-        content = load_markdown_content(markdown_path)
-        
-        print_step(3, "加载Manim代码", f"从 {os.path.basename(python_path)}")
-        # 加载 Python 代码内容
-        code_content = load_python_content(python_path)
-        
-        print_step(4, "加载上下文信息", f"从 {os.path.basename(previous_speech_path)}")
-        # 加载上一个页面的讲稿内容
-        previous_speech = load_previous_speech(previous_speech_path)
-        
-        print_step(5, "组合提示词内容", "准备API请求数据")
-        # 组合提示词和内容
-        combined_text = f"{prompt}\n\n上一个页面的讲稿内容如下：\n\n{previous_speech}\n\n论文原文的内容如下：\n\n{content}\n\n其对应的manim脚本内容如下：\n\n{code_content}"
-        
-        # 获取markdown文件所在目录作为图片路径基准
-        markdown_dir = os.path.dirname(os.path.abspath(markdown_path))
-        
-        print_step(6, "🤖 调用AI API生成演讲稿", f"⚠️ 此步骤需要30-90秒，请耐心等待...")
-        print(f"         使用模型: {model}")
-        print(f"         API调用开始...")
-        sys.stdout.flush()
-        
-        start_time = time.time()
-        # 调用 API 处理文本，传递正确的base_path
-        result = process_text_with_images(combined_text, api_key, model, base_path=markdown_dir)
-        end_time = time.time()
-        
-        print(f"         ✅ API调用完成！耗时: {end_time - start_time:.1f}秒")
-        
-        print_step(7, "保存演讲稿文件", f"准备写入文件...")
-        # 保存结果到文件
-        output_file = save_result(result, markdown_path, python_path, model, output_dir)
-        
-        print(f"         ✅ 演讲稿已保存: {os.path.basename(output_file)}")
-        print(f"         📊 生成内容长度: {len(result)} 字符")
-        
-        return result, output_file
-    
-    except Exception as e:
-        print(f"         ❌ 错误: {str(e)}")
-        sys.stdout.flush()
-        raise Exception(f"处理文件生成演讲稿失败: {str(e)}")
+    使用指定的提示词模板、上一页讲稿文件、API密钥和模型为单个页面生成演讲稿
+    """
+    generator = SpeechGenerator(prompt_template_path, api_key=api_key, model=model)
+    previous_speech = load_previous_speech(previous_speech_path)
+    return generator.generate_speech(markdown_path, python_path, previous_speech, output_dir)
 
 def main():
     """
-    主函数，用于测试
+    命令行入口：为单个页面生成演讲稿
     """
     # 创建命令行参数解析器
     parser = argparse.ArgumentParser(description='将Markdown和Python文件转换为演讲稿')
@@ -176,21 +238,9 @@ def main():
     
     args = parser.parse_args()
     
-    # 设置提示词模板路径
-    if args.prompt_template is None:
-        # 使用默认路径（从上一级目录的prompt_template读取）
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(current_dir)  # 上一级目录（根目录）
-        prompt_template_path = os.path.join(parent_dir, "prompt_template", "Method_Speecher.txt")
-    else:
-        prompt_template_path = args.prompt_template
-    
-    # 如果没有提供上一个页面的讲稿路径，使用默认文件（从上一级目录读取）
+    # 如果没有提供上一个页面的讲稿路径，使用默认文件
     if args.previous_speech_path is None:
-        previous_speech_path = os.path.join(parent_dir, "prompt_template", "Speecher-1.txt")
-        print(f"未提供上一个页面的讲稿文件，使用默认文件: {previous_speech_path}")
-    else:
-        previous_speech_path = args.previous_speech_path
+        print(f"未提供上一个页面的讲稿文件，使用默认文件: {DEFAULT_PREVIOUS_SPEECH}")
     
     # 输出目录（可选）
     output_dir = args.output_dir
@@ -199,14 +249,10 @@ def main():
     else:
         print(f"使用默认输出目录: MASLab_generated_speech")
     
-    # 从配置文件加载API key和model
-    config = load_config()
-    api_key = config['api_key']
-    model = config['model']
-    
     try:
-        # 处理文件
-        result, output_file = process_content_to_speech(args.markdown_path, args.python_path, previous_speech_path, prompt_template_path, api_key, model, output_dir=output_dir)
+        previous = load_previous_speech(args.previous_speech_path) if args.previous_speech_path else None
+        # 处理文件（未提供提示词模板时使用 prompt_template/Method_Speecher.txt）
+        result, output_file = generate_speech((args.markdown_path, args.python_path), previous, output_dir, args.prompt_template)
         print("生成的演讲稿：")
         print(result)
         print(f"\n演讲稿已保存到文件：{output_file}")
@@ -214,4 +260,4 @@ def main():
         print(f"错误：{str(e)}")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,11 +1,19 @@
 import os
 import sys
 import glob
-import subprocess
 import re
 import time
+import threading
+import concurrent.futures
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline_progress
+from Chapter_Coder import CodeGenerator, get_code_generator
+
+# 并发模式下多个线程共享stdout，用锁保证每行输出完整
+print_lock = threading.Lock()
+
 def print_separator(char="=", length=50):
     """打印分隔线"""
     print(char * length)
@@ -32,7 +40,72 @@ def format_duration(seconds):
         minutes = (seconds % 3600) // 60
         return f"{hours:.0f}小时{minutes:.0f}分"
 
-def process_markdown_folder(input_folder: str, output_dir: str, prompt_template: str = None):
+def process_markdown_files_concurrently(markdown_files: list, input_folder: str, output_dir: str, generator: CodeGenerator, workers: int = 4):
+    """
+    使用线程池并发处理markdown文件，各线程共用同一个代码生成器（配置、模板和API客户端）
+    
+    Args:
+        markdown_files: 已排序的markdown文件列表
+        input_folder: 输入文件夹路径
+        output_dir: 输出目录路径
+        generator: 代码生成器
+        workers: 最大并发数
+    
+    Returns:
+        按原始页面顺序排列的结果列表，每项为 (相对路径, 是否成功, 耗时, 错误信息)
+    """
+    total_files = len(markdown_files)
+    results = [None] * total_files
+    completed = 0
+    start_time = time.time()
+    
+    def process_one(index, markdown_file):
+        relative_path = os.path.relpath(markdown_file, input_folder)
+        file_start_time = time.time()
+        try:
+            generator.generate_code(markdown_file, output_dir)
+            return relative_path, True, time.time() - file_start_time, None
+        except Exception as e:
+            return relative_path, False, time.time() - file_start_time, str(e)
+    
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        # 提交所有页面任务
+        future_to_index = {
+            executor.submit(process_one, index, markdown_file): index
+            for index, markdown_file in enumerate(markdown_files)
+        }
+        
+        # 按完成顺序汇报每个页面的结果
+        for future in concurrent.futures.as_completed(future_to_index):
+            index = future_to_index[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                relative_path = os.path.relpath(markdown_files[index], input_folder)
+                result = (relative_path, False, 0, str(e))
+            results[index] = result
+            completed += 1
+            pipeline_progress.advance("coder", completed, total_files, unit="page", scope=input_folder)
+            
+            relative_path, success, file_duration, error = result
+            elapsed_time = time.time() - start_time
+            remaining_files = total_files - completed
+            # 并发模式下按吞吐量估算剩余时间
+            estimated_remaining = elapsed_time / completed * remaining_files
+            
+            with print_lock:
+                if success:
+                    print(f"\n[OK] {relative_path} 完成！耗时: {format_duration(file_duration)}")
+                else:
+                    print(f"\n[ERR] {relative_path} 处理失败 (耗时: {format_duration(file_duration)})")
+                    print(f"   错误信息: {error}")
+                print_progress_bar(completed, total_files, prefix="总体进度")
+                print(f" - 剩余: {remaining_files}个文件, 预估时间: {format_duration(estimated_remaining)}")
+                sys.stdout.flush()
+    
+    return results
+
+def process_markdown_folder(input_folder: str, output_dir: str, prompt_template: str = None, workers: int = 1):
     """
     处理指定文件夹下的所有markdown文件
     
@@ -40,6 +113,7 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
         input_folder: 输入文件夹路径
         output_dir: 输出目录路径
         prompt_template: 提示词模板路径
+        workers: 并发处理的页面数，1表示逐页顺序处理
     """
     print_separator()
     print(f"[{format_time()}] 开始批量处理任务")
@@ -82,107 +156,90 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
     
     total_files = len(markdown_files)
     print(f"\n 找到 {total_files} 个markdown文件待处理")
-    print(f"[TIME]  预估总时长: {total_files * 60}~{total_files * 90} 秒 (每个文件约60-90秒)")
+    workers = max(1, min(workers, total_files))
+    if workers > 1:
+        print(f"[PROC] 并发模式: 同时处理 {workers} 个页面")
+    batches = (total_files + workers - 1) // workers
+    print(f"[TIME]  预估总时长: {batches * 60}~{batches * 90} 秒 (每个文件约60-90秒)")
     print("\n[LIST] 处理顺序：")
     for i, file in enumerate(markdown_files, 1):
         relative_path = os.path.relpath(file, input_folder)
         print(f"   {i}. {relative_path}")
     print_separator("-")
     
-    # 获取当前脚本所在目录
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-    method_coder_path = os.path.join(current_dir, 'Chapter_Coder.py')
+    # 配置、提示词模板和API客户端只加载一次，所有页面在本进程内生成
+    try:
+        generator = get_code_generator(prompt_template)
+    except Exception as e:
+        print(f"\n[ERR] 初始化代码生成器失败: {e}")
+        return
     
     # 处理统计
     success_count = 0
     failed_files = []
+    page_results = []
     start_time = time.time()
     
     print(f"\n 开始批量代码生成...")
+    pipeline_progress.start("coder", total=total_files, unit="page", scope=input_folder)
     
-    # 处理每个markdown文件
-    for index, markdown_file in enumerate(markdown_files, 1):
-        relative_path = os.path.relpath(markdown_file, input_folder)
+    if workers > 1:
+        results = process_markdown_files_concurrently(
+            markdown_files, input_folder, output_dir, generator, workers
+        )
+        # 按原始页面顺序汇总
+        page_results = results
+        for relative_path, success, _, _ in results:
+            if success:
+                success_count += 1
+            else:
+                failed_files.append(relative_path)
+    else:
+        # 顺序模式：逐个处理每个markdown文件
+        for index, markdown_file in enumerate(markdown_files, 1):
+            relative_path = os.path.relpath(markdown_file, input_folder)
         
-        # 显示当前文件信息
-        print(f"\n[FILE] 正在处理: {relative_path}")
-        print(f" 进度: {index}/{total_files}")
+            # 显示当前文件信息
+            print(f"\n[FILE] 正在处理: {relative_path}")
+            print(f" 进度: {index}/{total_files}")
         
-        # 显示进度条
-        print_progress_bar(index-1, total_files, prefix="总体进度")
-        print()  # 换行
+            # 显示进度条
+            print_progress_bar(index-1, total_files, prefix="总体进度")
+            print()  # 换行
         
-        file_start_time = time.time()
+            file_start_time = time.time()
         
-        try:
-            print(f"[PROC] 启动PPT代码生成器...")
-            cmd_args = [
-                sys.executable,
-                method_coder_path,
-                markdown_file,
-                '--output-dir', output_dir
-            ]
+            try:
+                print(f"[PROC] 生成PPT代码...")
+                generator.generate_code(markdown_file, output_dir)
             
-            # 如果提供了prompt_template参数，添加到命令中
-            if prompt_template:
-                cmd_args.extend(['--prompt-template', prompt_template])
+                file_duration = time.time() - file_start_time
+                success_count += 1
+                print(f"[OK] 完成！耗时: {format_duration(file_duration)}")
             
-            # 使用实时输出的方式调用subprocess
-            env = os.environ.copy()
-            env['PYTHONUNBUFFERED'] = '1'
-            env['PYTHONIOENCODING'] = 'utf-8'
-            
-            print(f"[CMD] 执行命令: {' '.join(cmd_args)}")
-            
-            process = subprocess.Popen(
-                cmd_args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                universal_newlines=True,
-                bufsize=0,  # 完全无缓冲
-                env=env
-            )
-            
-            # 实时读取并输出
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    clean_output = output.rstrip()
-                    if clean_output:
-                        print(f"[PROG] {clean_output}")
-                        sys.stdout.flush()
-            
-            # 等待进程完成
-            return_code = process.poll()
-            if return_code != 0:
-                raise subprocess.CalledProcessError(return_code, cmd_args)
-            
-            file_duration = time.time() - file_start_time
-            success_count += 1
-            print(f"[OK] 完成！耗时: {format_duration(file_duration)}")
-            
-        except subprocess.CalledProcessError as e:
-            file_duration = time.time() - file_start_time
-            failed_files.append(relative_path)
-            print(f"[ERR] 处理失败 (耗时: {format_duration(file_duration)})")
-            print(f"   错误信息: {str(e)}")
-            continue
+            except Exception as e:
+                file_duration = time.time() - file_start_time
+                failed_files.append(relative_path)
+                print(f"[ERR] 处理失败 (耗时: {format_duration(file_duration)})")
+                print(f"   错误信息: {str(e)}")
+                continue
+            finally:
+                pipeline_progress.advance("coder", index, total_files, unit="page", scope=input_folder)
         
-        # 计算预估剩余时间
-        elapsed_time = time.time() - start_time
-        avg_time_per_file = elapsed_time / index
-        remaining_files = total_files - index
-        estimated_remaining = avg_time_per_file * remaining_files
+            # 计算预估剩余时间
+            elapsed_time = time.time() - start_time
+            avg_time_per_file = elapsed_time / index
+            remaining_files = total_files - index
+            estimated_remaining = avg_time_per_file * remaining_files
         
-        # 更新完成的进度条
-        print_progress_bar(index, total_files, prefix="总体进度")
-        print(f" - 剩余: {remaining_files}个文件, 预估时间: {format_duration(estimated_remaining)}")
+            # 更新完成的进度条
+            print_progress_bar(index, total_files, prefix="总体进度")
+            print(f" - 剩余: {remaining_files}个文件, 预估时间: {format_duration(estimated_remaining)}")
         
-        if index < total_files:  # 不是最后一个文件
-            print_separator("-")
+            if index < total_files:  # 不是最后一个文件
+                print_separator("-")
+    
+    pipeline_progress.end("coder", scope=input_folder)
     
     # 计算总耗时
     total_duration = time.time() - start_time
@@ -204,6 +261,12 @@ def process_markdown_folder(input_folder: str, output_dir: str, prompt_template:
     print(f"   • 总耗时: {format_duration(total_duration)}")
     print(f"   • 平均耗时: {format_duration(avg_time)}/文件")
     
+    if page_results:
+        print(f"\n[LIST] 各页面结果 (按页面顺序):")
+        for i, (relative_path, success, file_duration, _) in enumerate(page_results, 1):
+            status = "[OK]" if success else "[ERR]"
+            print(f"   {i}. {status} {relative_path} ({format_duration(file_duration)})")
+    
     if failed_files:
         print(f"\n[ERR] 以下 {len(failed_files)} 个文件处理失败:")
         for file in failed_files:
@@ -223,11 +286,12 @@ def main():
     parser.add_argument('input_folder', help='包含markdown文件的输入文件夹路径')
     parser.add_argument('output_dir', help='代码输出目录路径')
     parser.add_argument('--prompt-template', help='提示词模板路径', default=None)
+    parser.add_argument('--workers', type=int, default=1, help='并发处理的页面数 (默认: 1，即顺序处理)')
     
     args = parser.parse_args()
     
     # 处理文件夹
-    process_markdown_folder(args.input_folder, args.output_dir, args.prompt_template)
+    process_markdown_folder(args.input_folder, args.output_dir, args.prompt_template, args.workers)
 
 if __name__ == "__main__":
     main() 
\ No newline at end of file
@@ -1,11 +1,14 @@
 import os
 import sys
 import glob
-import subprocess
 import re
 import time
 from datetime import datetime
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline_progress
+from Chapter_Speecher import DEFAULT_PREVIOUS_SPEECH, get_speech_generator
+
 def print_separator(char="=", length=50):
     """打印分隔线"""
     print(char * length)
@@ -146,19 +149,25 @@ def process_file_pairs(markdown_folder: str, python_folder: str, output_dir: str
     
     # 获取当前脚本所在目录
     current_dir = os.path.dirname(os.path.abspath(__file__))
-    method_speecher_path = os.path.join(current_dir, 'Chapter_Speecher.py')
     
-    # 默认的previous_speech文件路径（用于第一个文件，从上一级目录读取）
-    parent_dir = os.path.dirname(current_dir)  # 上一级目录（根目录）
-    default_previous_speech = os.path.join(parent_dir, "prompt_template", "Speecher-1.txt")
+    # 配置、提示词模板和API客户端只加载一次，所有页面在本进程内生成
+    try:
+        generator = get_speech_generator(prompt_template)
+    except Exception as e:
+        print(f"\n[ERR] 初始化演讲稿生成器失败: {e}")
+        return
     
     # 处理统计
     success_count = 0
     failed_pairs = []
-    previous_speech_path = default_previous_speech  # 第一个文件使用默认路径
+    # 上一个页面的讲稿直接在内存中传给下一页；第一个文件使用默认上下文(Speecher-1.txt)
+    previous_speech = None
+    previous_speech_path = DEFAULT_PREVIOUS_SPEECH
     start_time = time.time()
     
     print(f"\n 开始批量演讲稿生成...")
+    progress_scope = os.path.abspath(markdown_folder)
+    pipeline_progress.start("speecher", total=total_pairs, unit="page", scope=progress_scope)
     
     # 处理每对文件
     for index, (md_file, py_file) in enumerate(matched_pairs, 1):
@@ -179,78 +188,27 @@ def process_file_pairs(markdown_folder: str, python_folder: str, output_dir: str
         pair_start_time = time.time()
         
         try:
-            print(f"启动演讲稿生成器...")
-            
-            # 构建命令参数，包含输出目录
-            cmd_args = [
-                sys.executable,
-                method_speecher_path,
-                md_file,
-                py_file,
-                previous_speech_path,  # 上一个页面的讲稿路径
-                output_dir            # 输出目录
-            ]
-            
-            # 如果提供了prompt_template参数，添加到命令中
-            if prompt_template:
-                cmd_args.extend(['--prompt-template', prompt_template])
-            
-            print(f"执行命令: {' '.join(cmd_args)}")
-            
-            # 使用实时输出的方式调用subprocess，就像batch_coder.py中的修改
-            env = os.environ.copy()
-            env['PYTHONUNBUFFERED'] = '1'
-            env['PYTHONIOENCODING'] = 'utf-8'
-            
-            process = subprocess.Popen(
-                cmd_args,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.STDOUT,
-                text=True,
-                universal_newlines=True,
-                bufsize=0,  # 完全无缓冲
-                env=env
-            )
-            
-            # 实时读取并输出
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    clean_output = output.rstrip()
-                    if clean_output:
-                        print(f"[SPEECH] {clean_output}")
-                        sys.stdout.flush()
-            
-            # 等待进程完成
-            return_code = process.poll()
-            if return_code != 0:
-                raise subprocess.CalledProcessError(return_code, cmd_args)
+            print(f"生成演讲稿...")
+            speech, current_speech_path = generator.generate_speech(md_file, py_file, previous_speech, output_dir)
             
             pair_duration = time.time() - pair_start_time
             success_count += 1
             print(f"完成！耗时: {format_duration(pair_duration)}")
             
-            # 计算当前文件生成的演讲稿路径，作为下一个文件的previous_speech_path
-            md_base_name = os.path.splitext(os.path.basename(md_file))[0]
-            current_speech_path = os.path.join(output_dir, f"{md_base_name}_speech.txt")
+            # 当前页面的讲稿作为下一个页面的上下文
+            previous_speech = speech.strip()
+            previous_speech_path = current_speech_path
+            print(f"已为下一页面准备上下文: {os.path.basename(current_speech_path)}")
             
-            # 检查生成的演讲稿文件是否存在
-            if os.path.exists(current_speech_path):
-                previous_speech_path = current_speech_path  # 更新为下一次使用
-                print(f"已为下一页面准备上下文: {os.path.basename(current_speech_path)}")
-            else:
-                print(f"警告：未找到生成的演讲稿文件 {current_speech_path}")
-                print(f"下一个文件将继续使用: {os.path.relpath(previous_speech_path, current_dir)}")
-            
-        except subprocess.CalledProcessError as e:
+        except Exception as e:
             pair_duration = time.time() - pair_start_time
             failed_pairs.append((md_relative, py_relative))
             print(f"处理失败 (耗时: {format_duration(pair_duration)})")
             print(f"错误信息: {str(e)}")
             print(f"下一个文件将继续使用: {os.path.relpath(previous_speech_path, current_dir)}")
             continue
+        finally:
+            pipeline_progress.advance("speecher", index, total_pairs, unit="page", scope=progress_scope)
         
         # 计算预估剩余时间
         elapsed_time = time.time() - start_time
@@ -265,6 +223,8 @@ def process_file_pairs(markdown_folder: str, python_folder: str, output_dir: str
         if index < total_pairs:  # 不是最后一对文件
             print_separator("-")
     
+    pipeline_progress.end("speecher", scope=progress_scope)
+    
     # 计算总耗时
     total_duration = time.time() - start_time
     avg_time = total_duration / total_pairs if total_pairs > 0 else 0
@@ -22,6 +22,12 @@ import shutil
 from datetime import datetime
 from pathlib import Path
 
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pipeline_progress
+
+# batch_coder 同时处理的页面数；LLM调用频率由 api_call 中的 llm_limiter 统一控制
+BATCH_CODER_WORKERS = int(os.environ.get('BATCH_CODER_WORKERS', '4'))
+
 def print_separator(char="=", length=80):
     """打印分隔线"""
     print(char * length)
@@ -198,7 +204,10 @@ def step1_brain_segmentation(paper_path, segmentation_dir, chapter_type):
     
     command = [sys.executable, brain_script, paper_path, segmentation_dir, "--prompt-template", brain_template]
     
+    brain_scope = os.path.abspath(paper_path)
+    pipeline_progress.start("brain", scope=brain_scope)
     success = run_command(command, "AI分析论文结构并生成分割版本")
+    pipeline_progress.end("brain", scope=brain_scope, ok=success)
     if not success:
         raise RuntimeError("AI智能分割失败")
     
@@ -246,6 +255,7 @@ def step3_batch_coding(split_pages_dir, generated_code_dir, chapter_type):
     print("   • 自动处理图片引用和尺寸适配")
     print("   • 处理时间: 每页约30-90秒")
     print(f"   • 使用 {chapter_type}_Coder.txt 模板")
+    print(f"   • 同时处理 {BATCH_CODER_WORKERS} 个页面 (BATCH_CODER_WORKERS)")
     print()
     
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -254,7 +264,8 @@ def step3_batch_coding(split_pages_dir, generated_code_dir, chapter_type):
     #coder_template = os.path.join(parent_dir, "prompt_template", f"{chapter_type}_Coder_ppt.txt")
     coder_template = os.path.join(parent_dir, "prompt_template", f"Experiment_Coder_ppt.txt")
     
-    command = [sys.executable, batch_coder_script, split_pages_dir, generated_code_dir, "--prompt-template", coder_template]
+    command = [sys.executable, batch_coder_script, split_pages_dir, generated_code_dir, "--prompt-template", coder_template,
+               "--workers", str(BATCH_CODER_WORKERS)]
     
     print("[PROC] 开始批量代码生成，将实时显示每个文件的处理进度...")
     success = run_command(command, "为每个页面生成对应的PPT Python代码", real_time_output=True)
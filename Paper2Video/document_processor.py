@@ -9,8 +9,8 @@
 import os
 import sys
 import json
-import re
 from api_call import process_text
+from markdown_outline import MarkdownOutline
 
 def load_config():
     """从config.json加载配置"""
@@ -52,7 +52,7 @@ def load_prompt_template() -> str:
     
     if not os.path.exists(template_file):
         # 创建默认的prompt模板文件（使用Central.txt的内容）
-        default_prompt = """你是一名学术写作助理，请你阅读以下完整文章内容，识别出其中属于以下四个部分的章节标题：
+        default_prompt = """你是一名学术写作助理，请你阅读以下文章的标题大纲（按原文顺序列出全部标题，# 的数量表示标题级别，括号内为该章节的字数），识别出其中属于以下四个部分的章节标题：
 
 1.Introduction
 
@@ -62,14 +62,14 @@ def load_prompt_template() -> str:
 
 4.结论（Conclusion / Discussion / Summary）
 
-请你以如下格式输出每个部分对应的章节标题（只给出大标题即可哦～）：
+请你以如下格式输出每个部分对应的章节标题（只给出大标题即可哦～，标题请照抄大纲中的原文，不要带 # 和字数）：
 
 Introduction: <对应章节标题>
 Methods: <对应章节标题>
 Experiments: <对应章节标题>
 Conclusion: <对应章节标题>
 
-以下是文章内容："""
+以下是文章的标题大纲："""
         
         with open(template_file, 'w', encoding='utf-8') as f:
             f.write(default_prompt)
@@ -109,122 +109,23 @@ def parse_section_mapping(model_output: str) -> dict:
     
     return sections
 
-def extract_section_number(title_line: str) -> str:
-    """从标题行中提取章节编号"""
-    # 移除开头的#号和空格
-    title_text = re.sub(r'^#+\s*', '', title_line).strip()
-    # 提取开头的数字部分（可能包含小数点）
-    match = re.match(r'^(\d+(?:\.\d+)*)', title_text)
-    return match.group(1) if match else ""
-
-def is_subsection(parent_num: str, current_num: str) -> bool:
-    """判断current_num是否是parent_num的子章节"""
-    if not parent_num or not current_num:
-        return False
-    
-    # 如果current_num以parent_num开头且后面跟着小数点，则是子章节
-    return current_num.startswith(parent_num + ".")
-
-def find_section_content(markdown_content: str, section_identifier: str) -> str:
-    """在markdown中找到指定章节的内容"""
-    lines = markdown_content.split('\n')
-    content_lines = []
-    in_section = False
-    found_line = None
-    
-    print(f"  正在搜索章节: '{section_identifier}'")
-    
-    # 创建多种可能的标题模式
-    # 1. 直接匹配：# 1 Introduction
-    pattern1 = rf'^#+\s*{re.escape(section_identifier)}\s*$'
-    # 2. 包含匹配：# 任何内容 1 Introduction 任何内容
-    pattern2 = rf'^#+\s*.*{re.escape(section_identifier)}.*$'
-    # 3. 如果有数字开头，也尝试只匹配后面的文字部分
-    section_text_only = re.sub(r'^\d+\s+', '', section_identifier).strip()
-    pattern3 = rf'^#+\s*\d+\s+{re.escape(section_text_only)}\s*$' if section_text_only != section_identifier else None
-    
-    patterns = [pattern1, pattern2]
-    if pattern3:
-        patterns.append(pattern3)
-    
-    print(f"  使用的匹配模式:")
-    for i, pattern in enumerate(patterns, 1):
-        print(f"    模式{i}: {pattern}")
-    
-    # 搜索匹配的标题行
-    for i, line in enumerate(lines):
-        line_stripped = line.strip()
-        if line_stripped.startswith('#'):
-            print(f"  检查第{i+1}行标题: '{line_stripped}'")
-            
-            # 检查是否匹配任何模式
-            for j, pattern in enumerate(patterns):
-                if re.match(pattern, line_stripped, re.IGNORECASE):
-                    print(f"    ✓ 匹配成功 (模式{j+1})")
-                    found_line = i
-                    in_section = True
-                    content_lines.append(line)
-                    break
-            
-            if found_line is not None:
-                break
-    
-    if found_line is None:
+def find_section_content(outline: MarkdownOutline, section_identifier: str) -> str:
+    """按标题索引取出指定章节的内容（含子章节）"""
+    print(f"  正在查找章节: '{section_identifier}'")
+    heading = outline.find(section_identifier)
+    if heading is None:
         print(f"  ✗ 未找到匹配的标题行")
         return ""
     
-    print(f"  ✓ 找到起始行: 第{found_line+1}行")
-    
-    # 获取起始标题的级别和章节号
-    start_title_level = len(re.match(r'^(#+)', lines[found_line]).group(1))
-    start_section_number = extract_section_number(lines[found_line])
-    print(f"  章节级别: {start_title_level} 级标题")
-    print(f"  章节编号: '{start_section_number}'")
+    print(f"  ✓ 找到起始行: 第{heading.line+1}行 '{'#' * heading.level} {heading.title}'")
+    print(f"  章节级别: {heading.level} 级标题")
+    print(f"  章节编号: '{heading.number}'")
     
-    # 从找到的行开始，收集内容直到下一个非子章节标题
-    for i in range(found_line + 1, len(lines)):
-        line = lines[i]
-        
-        # 检查是否是标题行
-        if re.match(r'^#+\s*\S', line):  # # 后面可以没有空格，但必须有内容
-            current_level = len(re.match(r'^(#+)', line).group(1))
-            current_section_number = extract_section_number(line)
-            print(f"    发现第{i+1}行标题: '{line.strip()}' (级别: {current_level}, 编号: '{current_section_number}')")
-            
-            # 判断是否应该停止收集
-            should_stop = False
-            
-            if current_level < start_title_level:
-                # 遇到更高级标题，停止
-                should_stop = True
-                print(f"    遇到更高级标题({current_level}级 < {start_title_level}级)，停止收集")
-            elif current_level == start_title_level:
-                # 同级标题，检查是否是子章节
-                if start_section_number and current_section_number:
-                    if is_subsection(start_section_number, current_section_number):
-                        print(f"    这是子章节({current_section_number} 是 {start_section_number} 的子章节)，继续收集")
-                    else:
-                        should_stop = True
-                        print(f"    这是同级或其他章节({current_section_number} 不是 {start_section_number} 的子章节)，停止收集")
-                else:
-                    # 无法判断章节号，按原逻辑处理
-                    should_stop = True
-                    print(f"    无法判断章节关系，按同级标题处理，停止收集")
-            else:
-                # 更低级标题，继续收集
-                print(f"    这是更低级标题({current_level}级 > {start_title_level}级)，继续收集")
-            
-            if should_stop:
-                print(f"  章节结束于第{i+1}行: '{line.strip()}'")
-                break
-        
-        content_lines.append(line)
-    
-    result = '\n'.join(content_lines)
-    print(f"  提取了 {len(content_lines)} 行内容")
+    result = outline.section_text(heading)
+    print(f"  提取了 {result.count(chr(10)) + 1} 行内容，包含 {len(heading.children)} 个子标题")
     return result
 
-def save_sections(sections: dict, markdown_content: str, output_dir: str, base_filename: str):
+def save_sections(sections: dict, outline: MarkdownOutline, output_dir: str, base_filename: str):
     """保存切分的章节到指定目录"""
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
@@ -236,7 +137,7 @@ def save_sections(sections: dict, markdown_content: str, output_dir: str, base_f
         print(f"\n正在提取章节: {section_type} -> {section_identifier}")
         
         # 在markdown中找到对应的内容
-        section_content = find_section_content(markdown_content, section_identifier)
+        section_content = find_section_content(outline, section_identifier)
         
         if section_content:
             # 构建文件名
@@ -269,8 +170,13 @@ def process_document(markdown_path: str, output_dir: str, config: dict) -> str:
     print(f"正在加载prompt模板: prompt_template/Central.txt")
     prompt_template = load_prompt_template()
     
+    # 建立标题索引，只把标题大纲发给大模型
+    outline = MarkdownOutline(document_content)
+    outline_text = outline.outline()
+    print(f"标题大纲: {len(outline.headings)} 个标题，{len(outline_text)} 字符（全文 {len(document_content)} 字符）")
+    
     # 构建完整的prompt
-    full_prompt = f"{prompt_template}\n\n\n{document_content}"
+    full_prompt = f"{prompt_template}\n\n\n{outline_text}"
     
     # 调用API处理
     print(f"正在使用模型 {config['model']} 处理文档...")
@@ -296,7 +202,7 @@ def process_document(markdown_path: str, output_dir: str, config: dict) -> str:
         base_filename = os.path.splitext(os.path.basename(markdown_path))[0]
         
         print(f"\n正在切分文档到目录: {output_dir}")
-        saved_sections = save_sections(sections, document_content, output_dir, base_filename)
+        saved_sections = save_sections(sections, outline, output_dir, base_filename)
         
         print(f"\n章节切分完成，共保存 {len(saved_sections)} 个文件")
     else:
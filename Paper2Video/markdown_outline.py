@@ -0,0 +1,146 @@
+"""
+Markdown 标题索引
+
+一次遍历 MinerU 输出的 markdown，建立标题树：每个标题记录级别、章节编号、在文本中的偏移，
+以及整个章节（含子章节）的结束位置。
+
+章节识别只需要把标题大纲（而不是全文）发给大模型；按大模型返回的标题取章节内容时，
+直接按偏移切片，不再逐行用正则重新扫描全文。
+
+章节的结束规则与原 find_section_content 一致：遇到更高级（# 数量更少）的标题时结束；
+遇到同级标题时也结束，但编号是起始章节子编号的同级标题（如 "3 Method" 之后的 "3.1 ..."，
+MinerU 常把它们都输出为一级标题）仍属于本章节。
+"""
+
+import re
+
+# 与原 find_section_content 按 line.strip() 查找标题一致，允许标题行前有缩进
+HEADING_PATTERN = re.compile(r'^\s*(#+)\s*(\S.*?)\s*$')
+SECTION_NUMBER_PATTERN = re.compile(r'^(\d+(?:\.\d+)*)')
+
+
+def extract_section_number(title: str) -> str:
+    """从标题文字中提取章节编号，如 '3.1 Setup' -> '3.1'"""
+    match = SECTION_NUMBER_PATTERN.match(title)
+    return match.group(1) if match else ""
+
+
+def is_subsection(parent_num: str, current_num: str) -> bool:
+    """判断current_num是否是parent_num的子章节"""
+    if not parent_num or not current_num:
+        return False
+    return current_num.startswith(parent_num + ".")
+
+
+def strip_section_number(title: str) -> str:
+    """去掉标题开头的编号，如 '3. Method' -> 'Method'"""
+    return re.sub(r'^\d+(?:\.\d+)*\.?\s*', '', title).strip()
+
+
+def _normalize(title: str) -> str:
+    return ' '.join(title.split()).casefold()
+
+
+class Heading:
+    """一个标题及其章节范围；start 为标题行的起始偏移，end 为章节（含子章节）的结束偏移"""
+
+    __slots__ = ('level', 'title', 'number', 'line', 'start', 'end', 'parent', 'children')
+
+    def __init__(self, level, title, line, start):
+        self.level = level
+        self.title = title
+        self.number = extract_section_number(title)
+        self.line = line
+        self.start = start
+        self.end = None
+        self.parent = None
+        self.children = []
+
+    def ends_before(self, other):
+        """other 是否结束本章节：更高级的标题一定结束本章节，同级标题除非是本章节的子编号"""
+        return other.level < self.level or (other.level == self.level and not is_subsection(self.number, other.number))
+
+    def __repr__(self):
+        return f"Heading({'#' * self.level} {self.title!r}, line={self.line + 1}, {self.start}:{self.end})"
+
+
+class MarkdownOutline:
+    """markdown 文本的标题索引"""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.headings = []
+        self.roots = []
+        self._by_title = {}
+        self._by_text_only = {}
+        self._build()
+
+    def _build(self):
+        open_headings = []
+        offset = 0
+        for line_number, line in enumerate(self.text.split('\n')):
+            match = HEADING_PATTERN.match(line)
+            if match:
+                heading = Heading(len(match.group(1)), match.group(2), line_number, offset)
+                # 章节内容不含下一个标题前的换行符
+                boundary = max(offset - 1, 0)
+                still_open = []
+                for previous in open_headings:
+                    if previous.ends_before(heading):
+                        previous.end = boundary
+                    else:
+                        still_open.append(previous)
+                open_headings = still_open
+                if open_headings:
+                    heading.parent = open_headings[-1]
+                    heading.parent.children.append(heading)
+                else:
+                    self.roots.append(heading)
+                open_headings.append(heading)
+                self.headings.append(heading)
+                self._by_title.setdefault(_normalize(heading.title), heading)
+                self._by_text_only.setdefault(_normalize(strip_section_number(heading.title)), heading)
+            offset += len(line) + 1
+        for heading in open_headings:
+            heading.end = len(self.text)
+
+    def find(self, identifier: str):
+        """
+        按大模型返回的标题找到对应的标题，找不到时返回None
+
+        依次尝试：完整标题、去掉编号后的标题、按文档顺序第一个包含该文字的标题。
+        """
+        # 大模型可能把大纲中的 # 和字数一并抄回来
+        identifier = re.sub(r'（\d+字）$', '', re.sub(r'^#+\s*', '', identifier.strip())).strip()
+        key = _normalize(identifier)
+        if not key:
+            return None
+        heading = self._by_title.get(key)
+        if heading is None:
+            text_only = _normalize(strip_section_number(identifier))
+            heading = self._by_text_only.get(text_only) if text_only else None
+        if heading is None:
+            heading = next((h for h in self.headings if key in _normalize(h.title)), None)
+        return heading
+
+    def section_text(self, heading) -> str:
+        """章节内容（含标题行和所有子章节）"""
+        return self.text[heading.start:heading.end]
+
+    def section_content(self, identifier: str) -> str:
+        """按标题取章节内容，找不到时返回空字符串"""
+        heading = self.find(identifier)
+        return self.section_text(heading) if heading is not None else ""
+
+    def outline(self, max_level=None) -> str:
+        """
+        标题大纲：每行一个标题，保留原文的 # 级别，并附上章节字数
+
+        大纲按文档顺序排列，大模型只需从中选出标题原文。
+        """
+        lines = []
+        for heading in self.headings:
+            if max_level is not None and heading.level > max_level:
+                continue
+            lines.append(f"{'#' * heading.level} {heading.title}（{heading.end - heading.start}字）")
+        return '\n'.join(lines)
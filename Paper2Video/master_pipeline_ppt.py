@@ -8,7 +8,7 @@ python master_pipeline.py path/to/paper.md path/to/images [--output-base-dir out
 
 流程:
 1. 调用document_processor.py切分论文为四个章节
-2. 依次调用各个Agent的pipeline处理对应章节
+2. 依次（或使用 --parallel-agents 并行）调用各个Agent的pipeline处理对应章节
 3. 收集整理生成的文件
 """
 
@@ -19,9 +19,14 @@ import argparse
 import time
 import shutil
 import json
+import threading
+import concurrent.futures
 from datetime import datetime
 from pathlib import Path
 
+# 并行执行多个Agent时共享stdout，用锁保证每行输出完整
+print_lock = threading.Lock()
+
 def print_separator(char="=", length=100):
     """打印分隔线"""
     print(char * length)
@@ -45,8 +50,16 @@ def run_command(command, description="", cwd=None, capture_output=False):
     """执行命令并处理错误"""
     return run_command_with_env(command, description, cwd, capture_output, None)
 
-def run_command_with_env(command, description="", cwd=None, capture_output=False, env=None):
-    """执行命令并处理错误，支持自定义环境变量"""
+def run_command_with_env(command, description="", cwd=None, capture_output=False, env=None, log_prefix=None):
+    """
+    执行命令并处理错误，支持自定义环境变量
+    
+    log_prefix 不为空时，子进程的每行输出都会加上该前缀并整行打印（不使用回车覆盖的进度条），
+    以便多个命令并行执行时输出仍然可读
+    """
+    if log_prefix:
+        return run_prefixed_command(command, description, cwd, env, log_prefix)
+    
     print(f"[PROC] 执行命令: {' '.join(command)}")
     if description:
         print(f"   {description}")
@@ -152,6 +165,63 @@ def run_command_with_env(command, description="", cwd=None, capture_output=False
         print(f"[ERR] 命令执行出现异常: {e}")
         return False
 
+def run_prefixed_command(command, description, cwd, env, log_prefix):
+    """执行命令，将输出逐行加上前缀后打印，供并行模式使用"""
+    def log(message):
+        with print_lock:
+            print(f"{log_prefix} {message}")
+            sys.stdout.flush()
+    
+    log(f"[PROC] 执行命令: {' '.join(command)}")
+    if description:
+        log(f"   {description}")
+    if cwd:
+        log(f"   工作目录: {cwd}")
+    
+    base_env = os.environ.copy()
+    if env is not None:
+        base_env.update(env)
+    base_env['PYTHONUNBUFFERED'] = '1'
+    base_env['PYTHONIOENCODING'] = 'utf-8'
+    
+    try:
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            universal_newlines=True,
+            bufsize=0,
+            env=base_env,
+            cwd=cwd
+        )
+        
+        if process.stdout is None:
+            log("[ERR] 无法获取子进程输出")
+            return False
+        
+        while True:
+            output = process.stdout.readline()
+            if output == '' and process.poll() is not None:
+                break
+            if output:
+                # 进度条中的回车会打乱其他Agent的输出，统一去掉
+                clean_output = output.rstrip().lstrip('\r')
+                if clean_output:
+                    log(f"   {clean_output}")
+        
+        return_code = process.poll()
+        if return_code == 0:
+            log("[OK] 命令执行成功")
+            return True
+        else:
+            log(f"[ERR] 命令执行失败，返回码: {return_code}")
+            return False
+    
+    except Exception as e:
+        log(f"[ERR] 命令执行出现异常: {e}")
+        return False
+
 def validate_inputs(paper_path, images_dir):
     """验证输入参数"""
     print("[FIND] 验证输入参数...")
@@ -230,9 +300,89 @@ def step1_section_splitting(paper_path, sections_dir):
     
     return section_files
 
-def step2_process_agents(section_files, images_dir, dirs):
-    """步骤2: 依次调用Chapter_Agent处理对应章节"""
-    print_step(2, "Chapter_Agent处理流程", "使用Chapter_Agent分别处理Introduction、Methods、Experiments、Conclusion章节")
+def run_single_agent(agent_config, section_files, images_dir, index, total, log_prefix=None):
+    """
+    调用Chapter_Agent处理单个章节
+    
+    Returns:
+        处理结果字典；章节文件或Agent目录缺失而跳过时返回None
+    """
+    def log(message):
+        with print_lock:
+            print(f"{log_prefix} {message.lstrip()}" if log_prefix else message)
+    
+    agent_name = agent_config['name']
+    agent_folder = agent_config['folder']
+    output_dir = agent_config['output_dir']
+    section_key = agent_config['section_key']
+    chapter_type = agent_config['chapter_type']
+    
+    log(f"\n[BOT] 处理 {agent_name} Agent ({index}/{total})")
+    log(f"   章节类型: {chapter_type}")
+    
+    # 检查章节文件是否存在
+    if section_key not in section_files:
+        log(f"[WARN]  跳过 {agent_name} Agent: 未找到对应的章节文件")
+        return None
+        
+    section_file = section_files[section_key]
+    
+    # 检查Agent目录是否存在
+    if not os.path.exists(agent_folder):
+        log(f"[WARN]  跳过 {agent_name} Agent: 目录不存在 {agent_folder}")
+        return None
+        
+    pipeline_path = os.path.join(agent_folder, "pipeline_ppt.py")
+    if not os.path.exists(pipeline_path):
+        log(f"[WARN]  跳过 {agent_name} Agent: pipeline_ppt.py不存在")
+        return None
+    
+    # 构建命令（添加章节参数）
+    command = [
+        sys.executable, "pipeline_ppt.py", 
+        os.path.abspath(section_file),
+        "--chapter", chapter_type,
+        "--output-base-dir", os.path.abspath(output_dir),
+        "--images-dir", os.path.abspath(images_dir)
+    ]
+    
+    log(f"[OPEN] 输入文件: {section_file}")
+    log(f"[DIR] 输出目录: {output_dir}")
+    log(f"[IMG] 图片目录: {images_dir}")
+    
+    # 设置环境变量跳过交互式编辑
+    env = os.environ.copy()
+    env['SKIP_INTERACTIVE'] = '1'
+    
+    # 执行Agent pipeline，传递修改后的环境变量
+    success = run_command_with_env(
+        command, 
+        f"处理{agent_name}章节",
+        cwd=agent_folder,
+        env=env,
+        log_prefix=log_prefix
+    )
+    
+    if success:
+        log(f"[OK] {agent_name} Agent 处理完成")
+    else:
+        log(f"[ERR] {agent_name} Agent 处理失败")
+    
+    return {
+        'section_file': section_file,
+        'output_dir': output_dir,
+        'status': 'success' if success else 'failed'
+    }
+
+def step2_process_agents(section_files, images_dir, dirs, parallel=False):
+    """
+    步骤2: 调用Chapter_Agent处理对应章节
+    
+    四个章节之间没有共享状态，parallel为True时同时运行四个章节的pipeline，
+    每个章节的输出加上 [章节名] 前缀；结果仍按章节顺序合并
+    """
+    mode_desc = "并行" if parallel else "依次"
+    print_step(2, "Chapter_Agent处理流程", f"使用Chapter_Agent{mode_desc}处理Introduction、Methods、Experiments、Conclusion章节")
     
     # Agent配置
     agents_config = [
@@ -266,74 +416,39 @@ def step2_process_agents(section_files, images_dir, dirs):
         }
     ]
     
-    processed_results = {}
-    
-    for i, agent_config in enumerate(agents_config, 1):
-        agent_name = agent_config['name']
-        agent_folder = agent_config['folder']
-        output_dir = agent_config['output_dir']
-        section_key = agent_config['section_key']
-        chapter_type = agent_config['chapter_type']
-        
-        print(f"\n[BOT] 处理 {agent_name} Agent ({i}/4)")
-        print(f"   章节类型: {chapter_type}")
-        
-        # 检查章节文件是否存在
-        if section_key not in section_files:
-            print(f"[WARN]  跳过 {agent_name} Agent: 未找到对应的章节文件")
-            continue
-            
-        section_file = section_files[section_key]
-        
-        # 检查Agent目录是否存在
-        if not os.path.exists(agent_folder):
-            print(f"[WARN]  跳过 {agent_name} Agent: 目录不存在 {agent_folder}")
-            continue
-            
-        pipeline_path = os.path.join(agent_folder, "pipeline_ppt.py")
-        if not os.path.exists(pipeline_path):
-            print(f"[WARN]  跳过 {agent_name} Agent: pipeline_ppt.py不存在")
-            continue
-        
-        # 构建命令（添加章节参数）
-        command = [
-            sys.executable, "pipeline_ppt.py", 
-            os.path.abspath(section_file),
-            "--chapter", chapter_type,
-            "--output-base-dir", os.path.abspath(output_dir),
-            "--images-dir", os.path.abspath(images_dir)
-        ]
-        
-        print(f"[OPEN] 输入文件: {section_file}")
-        print(f"[DIR] 输出目录: {output_dir}")
-        print(f"[IMG] 图片目录: {images_dir}")
-        
-        # 设置环境变量跳过交互式编辑
-        env = os.environ.copy()
-        env['SKIP_INTERACTIVE'] = '1'
-        
-        # 执行Agent pipeline，传递修改后的环境变量
-        success = run_command_with_env(
-            command, 
-            f"处理{agent_name}章节",
-            cwd=agent_folder,
-            env=env
-        )
-        
-        if success:
-            processed_results[agent_name] = {
-                'section_file': section_file,
-                'output_dir': output_dir,
-                'status': 'success'
+    total = len(agents_config)
+    agent_results = [None] * total
+    
+    if parallel:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=total) as executor:
+            future_to_index = {
+                executor.submit(
+                    run_single_agent, agent_config, section_files, images_dir, i + 1, total,
+                    f"[{agent_config['name']}]"
+                ): i
+                for i, agent_config in enumerate(agents_config)
             }
-            print(f"[OK] {agent_name} Agent 处理完成")
-        else:
-            processed_results[agent_name] = {
-                'section_file': section_file,
-                'output_dir': output_dir,
-                'status': 'failed'
-            }
-            print(f"[ERR] {agent_name} Agent 处理失败")
+            for completed, future in enumerate(concurrent.futures.as_completed(future_to_index), 1):
+                index = future_to_index[future]
+                try:
+                    agent_results[index] = future.result()
+                except Exception as e:
+                    agent_config = agents_config[index]
+                    print(f"[ERR] {agent_config['name']} Agent 执行异常: {e}")
+                    agent_results[index] = {
+                        'section_file': section_files.get(agent_config['section_key']),
+                        'output_dir': agent_config['output_dir'],
+                        'status': 'failed'
+                    }
+    else:
+        for i, agent_config in enumerate(agents_config):
+            agent_results[i] = run_single_agent(agent_config, section_files, images_dir, i + 1, total)
+    
+    # 按章节顺序合并结果，保证与顺序执行时一致
+    processed_results = {}
+    for agent_config, result in zip(agents_config, agent_results):
+        if result is not None:
+            processed_results[agent_config['name']] = result
     
     return processed_results
 
@@ -508,7 +623,13 @@ def main():
         default=999, # 默认一个很大的数，表示执行所有步骤
         help='执行到指定的步骤后停止 (例如: 1 表示只执行章节切分)'
     )
-    
+
+    parser.add_argument(
+        '--parallel-agents',
+        action='store_true',
+        help='并行运行四个章节的Chapter_Agent pipeline (默认: 依次执行)'
+    )
+
     args = parser.parse_args()
     
     start_time = time.time()
@@ -567,7 +688,7 @@ def main():
         
         # 执行主流程
         section_files = step1_section_splitting(args.paper_path, dirs['sections'])
-        processed_results = step2_process_agents(section_files, args.images_dir, dirs)
+        processed_results = step2_process_agents(section_files, args.images_dir, dirs, parallel=args.parallel_agents)
         # collected_files = step3_collect_results(processed_results, dirs['final_results'])
         
         # v-- 修改代码开始 --v
@@ -9,7 +9,10 @@
 3.  (Phase 2) 对分割后的章节进行物理拼接，并智能处理图片路径，为融合做准备。
 4.  (Phase 3) 调用大模型对拼接后的章节进行智能融合，输出最终的四个核心章节。
 
-使用方法: python multi_paper_document_processor.py <待处理论文总目录> <最终输出目录>
+Phase 1 的各篇论文、Phase 3 的各个章节分别并发处理，同时进行的LLM调用数不超过 --workers；
+每分钟调用数和token数由 api_call 中的机器级限流器（llm_limiter，LLM_RPM / LLM_TPM）统一控制。
+
+使用方法: python multi_paper_document_processor.py <待处理论文总目录> <最终输出目录> [--workers N]
 python multi_paper_document_processor.py ../MinerU/outputs_clean/muti_paper_inputs01 test_sections
 """
 
@@ -19,6 +22,9 @@ import json
 import re
 import shutil
 import glob
+import argparse
+import threading
+import concurrent.futures
 from pathlib import Path
 
 # <--- CHANGE HERE: 导入两个函数
@@ -27,6 +33,7 @@ try:
 except ImportError:
     print("错误: 未找到 'api_call.py' 文件。请确保它与本脚本在同一目录下。")
     sys.exit(1)
+from markdown_outline import MarkdownOutline
 
 # --- 全局配置 ---
 SECTIONS_TO_SPLIT = ["Abstract", "Introduction", "Methods", "Experiments", "Conclusion"]
@@ -37,6 +44,8 @@ FUSION_PROMPT_MAP = {
     'Experiments': 'Experiment_Integration.txt',
     'Conclusion': 'Conclusion_Integration.txt',
 }
+# 并发处理的论文/章节数（可通过环境变量或命令行参数覆盖）
+DEFAULT_WORKERS = int(os.environ.get('MULTI_PAPER_WORKERS', '4'))
 
 
 # --- 1. 配置与模板加载 ---
@@ -71,7 +80,7 @@ def prepare_prompt_templates():
     # 1. 分割用的模板
     split_prompt_path = prompt_dir / "Central.txt"
     if not split_prompt_path.exists():
-        split_prompt_content = """你是一名学术写作助理，请你阅读以下完整文章内容，识别出其中属于以下五个部分的章节标题：
+        split_prompt_content = """你是一名学术写作助理，请你阅读以下文章的标题大纲（按原文顺序列出全部标题，# 的数量表示标题级别，括号内为该章节的字数），识别出其中属于以下五个部分的章节标题：
 
 1. Abstract
 2. Introduction
@@ -79,7 +88,7 @@ def prepare_prompt_templates():
 4. 实验 (Experiments / Experimental Setup / Evaluation)
 5. 结论 (Conclusion / Discussion / Summary)
 
-请你以如下格式输出每个部分对应的章节标题（只给出大标题即可）：
+请你以如下格式输出每个部分对应的章节标题（只给出大标题即可，标题请照抄大纲中的原文，不要带 # 和字数）：
 
 Abstract: <对应章节标题>
 Introduction: <对应章节标题>
@@ -87,7 +96,7 @@ Methods: <对应章节标题>
 Experiments: <对应章节标题>
 Conclusion: <对应章节标题>
 
-以下是文章内容："""
+以下是文章的标题大纲："""
         split_prompt_path.write_text(split_prompt_content, encoding='utf-8')
         print(f"已创建分割prompt模板: {split_prompt_path}")
 
@@ -145,104 +154,17 @@ def parse_section_mapping(model_output: str) -> dict:
                 sections[parts[0].strip()] = parts[1].strip()
     return sections
 
-# v-- 代码移植开始 --v
-# 注释：以下三个函数 (extract_section_number, is_subsection, find_section_content) 
-# 从能够正确处理子章节的 "document_processor.py" 脚本中完整移植而来，
-# 以替换原有脚本中功能不完善的 find_section_content 函数。
-def extract_section_number(title_line: str) -> str:
-    """从标题行中提取章节编号"""
-    # 移除开头的#号和空格
-    title_text = re.sub(r'^#+\s*', '', title_line).strip()
-    # 提取开头的数字部分（可能包含小数点）
-    match = re.match(r'^(\d+(?:\.\d+)*)', title_text)
-    return match.group(1) if match else ""
-
-def is_subsection(parent_num: str, current_num: str) -> bool:
-    """判断current_num是否是parent_num的子章节"""
-    if not parent_num or not current_num:
-        return False
-    
-    # 如果current_num以parent_num开头且后面跟着小数点，则是子章节
-    return current_num.startswith(parent_num + ".")
-
-def find_section_content(markdown_content: str, section_identifier: str) -> str:
-    """在markdown中找到指定章节的内容（移植自单篇处理脚本的完善版本）"""
-    lines = markdown_content.split('\n')
-    content_lines = []
-    in_section = False
-    found_line = None
-    
-    # 不再打印详细搜索过程，以保持多论文处理流程的输出整洁
-    # print(f"  正在搜索章节: '{section_identifier}'")
-    
-    # 创建多种可能的标题模式
-    pattern1 = rf'^#+\s*{re.escape(section_identifier)}\s*$'
-    pattern2 = rf'^#+\s*.*{re.escape(section_identifier)}.*$'
-    section_text_only = re.sub(r'^\d+(\.\d+)*\s*', '', section_identifier).strip()
-    pattern3 = rf'^#+\s*[\d.]*\s*{re.escape(section_text_only)}\s*$' if section_text_only else None
-    
-    patterns = [p for p in [pattern1, pattern2, pattern3] if p]
-    
-    # 搜索匹配的标题行
-    for i, line in enumerate(lines):
-        line_stripped = line.strip()
-        if line_stripped.startswith('#'):
-            for pattern in patterns:
-                if re.match(pattern, line_stripped, re.IGNORECASE):
-                    found_line = i
-                    in_section = True
-                    content_lines.append(line)
-                    break
-            if found_line is not None:
-                break
-    
-    if found_line is None:
+def find_section_content(outline: MarkdownOutline, section_identifier: str) -> str:
+    """按标题索引取出指定章节的内容（含子章节），章节的结束规则见 markdown_outline.py"""
+    heading = outline.find(section_identifier)
+    if heading is None:
         print(f"  [警告] 未能找到章节标题: '{section_identifier}'")
         return ""
-    
-    # 获取起始标题的级别和章节号
-    start_title_level_match = re.match(r'^(#+)', lines[found_line])
-    if not start_title_level_match:
-        # 如果匹配的行不是有效的标题行（虽然理论上不会发生），则返回空
-        return ""
-    start_title_level = len(start_title_level_match.group(1))
-    start_section_number = extract_section_number(lines[found_line])
-    
-    # 从找到的行开始，收集内容直到下一个非子章节标题
-    for i in range(found_line + 1, len(lines)):
-        line = lines[i]
-        
-        # 检查是否是标题行
-        if re.match(r'^#+\s*\S', line):
-            current_level_match = re.match(r'^(#+)', line)
-            if not current_level_match: continue
-            
-            current_level = len(current_level_match.group(1))
-            current_section_number = extract_section_number(line)
-            
-            # 判断是否应该停止收集
-            should_stop = False
-            if current_level <= start_title_level:
-                # 遇到同级或更高级标题
-                if start_section_number and current_section_number and is_subsection(start_section_number, current_section_number):
-                    # 是子章节的特殊情况（例如 2. vs 2.1），虽然级别相同但应继续
-                    pass
-                else:
-                    # 不是子章节，停止
-                    should_stop = True
-
-            if should_stop:
-                break
-        
-        content_lines.append(line)
-    
-    result = '\n'.join(content_lines)
-    return result.strip()
-# ^-- 代码移植结束 --^
+    return outline.section_text(heading).strip()
 
 
 # --- Phase 1: 物理分割 ---
-def split_single_paper(paper_dir: Path, temp_split_dir: Path, config: dict):
+def split_single_paper(paper_dir: Path, temp_split_dir: Path, config: dict, llm_slots: threading.BoundedSemaphore):
     paper_name = paper_dir.name
     print(f"\n--- [Phase 1] 正在分割论文: {paper_name} ---")
     
@@ -253,18 +175,23 @@ def split_single_paper(paper_dir: Path, temp_split_dir: Path, config: dict):
 
     markdown_path = md_files[0]
     paper_content = read_file_content(markdown_path)
+    # 建立标题索引，只把标题大纲发给大模型
+    outline = MarkdownOutline(paper_content)
+    outline_text = outline.outline()
+    print(f"  标题大纲: {len(outline.headings)} 个标题，{len(outline_text)} 字符（全文 {len(paper_content)} 字符）")
     
     split_prompt_template = load_prompt_template("Central.txt")
-    full_prompt = f"{split_prompt_template}\n\n{paper_content}"
+    full_prompt = f"{split_prompt_template}\n\n{outline_text}"
     
     print("  正在调用LLM分析章节结构...")
     sections_map = {}
     try:
-        mapping_result = process_text(
-            full_prompt, 
-            config["api_key"], 
-            config["model"]
-        )
+        with llm_slots:
+            mapping_result = process_text(
+                full_prompt, 
+                config["api_key"], 
+                config["model"]
+            )
         sections_map = parse_section_mapping(mapping_result)
         print("  LLM章节映射解析完成:")
         for sec, title in sections_map.items():
@@ -278,12 +205,13 @@ def split_single_paper(paper_dir: Path, temp_split_dir: Path, config: dict):
     # ++++++++++++++++++++++++++++++++
     if 'Abstract' not in sections_map:
         print("  [信息] LLM未返回Abstract，启动启发式规则进行查找...")
-        # 使用正则表达式查找 '# ABSTRACT' (不区分大小写, 独占一行)
-        abstract_match = re.search(r'^#\s+ABSTRACT\s*$', paper_content, re.IGNORECASE | re.MULTILINE)
+        # 在标题索引中查找一级标题 'ABSTRACT' (不区分大小写)
+        abstract_heading = next(
+            (h for h in outline.headings if h.level == 1 and h.title.casefold() == 'abstract'), None
+        )
         
-        if abstract_match:
-            # 从匹配到的文本中提取出干净的标题 (例如 "ABSTRACT")
-            found_title = abstract_match.group(0).strip('#').strip()
+        if abstract_heading:
+            found_title = abstract_heading.title
             sections_map['Abstract'] = found_title
             print(f"  [成功] 启发式规则找到Abstract，标题为: '{found_title}'")
         else:
@@ -306,7 +234,7 @@ def split_single_paper(paper_dir: Path, temp_split_dir: Path, config: dict):
     for section_name in SECTIONS_TO_SPLIT:
         if section_name in sections_map:
             section_title = sections_map[section_name]
-            content = find_section_content(paper_content, section_title)
+            content = find_section_content(outline, section_title)
             if content:
                 out_path = paper_output_dir / f"{paper_name}_{section_name}.md"
                 out_path.write_text(content, encoding='utf-8')
@@ -318,6 +246,20 @@ def split_single_paper(paper_dir: Path, temp_split_dir: Path, config: dict):
                 out_path.write_text(f"# {section_name}\n\n(未能提取到内容)", encoding='utf-8')
     return True
 
+def split_papers(paper_dirs: list, temp_split_dir: Path, config: dict, llm_slots: threading.BoundedSemaphore, workers: int) -> list:
+    """并发分割所有论文，按输入顺序返回分割成功的论文目录"""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [executor.submit(split_single_paper, paper_dir, temp_split_dir, config, llm_slots)
+                   for paper_dir in paper_dirs]
+        results = []
+        for paper_dir, future in zip(paper_dirs, futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                print(f"  [错误] 分割论文 {paper_dir.name} 时出错: {e}")
+                results.append(False)
+    return [paper_dir for paper_dir, success in zip(paper_dirs, results) if success]
+
 # ... (后续原代码concatenate_sections, fuse_all_sections, main 等保持不变) ...
 # --- Phase 2: 物理拼接 ---
 def concatenate_sections(paper_dirs: list, temp_split_dir: Path, temp_concat_dir: Path):
@@ -361,7 +303,51 @@ def concatenate_sections(paper_dirs: list, temp_split_dir: Path, temp_concat_dir
             print(f"  已拼接保存至: {concat_filepath.name}")
 
 # --- Phase 3: 智能融合 ---
-def fuse_all_sections(paper_names: list, temp_concat_dir: Path, final_output_dir: Path, config: dict):
+def fuse_section(section_name: str, paper_names: list, full_abstracts_context: str, temp_concat_dir: Path,
+                 final_output_dir: Path, config: dict, llm_slots: threading.BoundedSemaphore):
+    """融合单个章节，返回是否成功"""
+    print(f"  正在融合章节: {section_name}")
+    
+    concat_filename = f"{'+'.join(paper_names)}_{section_name}_CONCAT.md"
+    concat_filepath = temp_concat_dir / concat_filename
+    
+    if not concat_filepath.exists():
+        print(f"    [警告] 找不到拼接文件 {concat_filename}，跳过融合。")
+        return False
+        
+    section_content = concat_filepath.read_text(encoding='utf-8')
+    
+    prompt_filename = FUSION_PROMPT_MAP.get(section_name)
+    if not prompt_filename:
+        print(f"    [警告] 找不到 {section_name} 的融合prompt，跳过。")
+        return False
+        
+    fusion_prompt_template = load_prompt_template(prompt_filename)
+    final_prompt = fusion_prompt_template.replace("{abstracts_content}", full_abstracts_context)
+    final_prompt = final_prompt.replace("{section_content}", section_content)
+    
+    print(f"    [{section_name}] 调用 {config['model']} (多模态) 进行融合...")
+    try:
+        with llm_slots:
+            fused_content = process_text_with_images(
+                text=final_prompt,
+                api_key=config["api_key"],
+                model=config["model"],
+                base_path=str(temp_concat_dir) 
+            )
+        
+        final_filename = f"{'+'.join(paper_names)}_{section_name}.md"
+        final_filepath = final_output_dir / final_filename
+        final_filepath.write_text(fused_content, encoding='utf-8')
+        print(f"  🎉 融合成功! 已保存至: {final_filepath}")
+        return True
+
+    except Exception as e:
+        print(f"    [错误] {section_name} 融合API调用失败: {e}")
+        return False
+
+def fuse_all_sections(paper_names: list, temp_concat_dir: Path, final_output_dir: Path, config: dict,
+                      llm_slots: threading.BoundedSemaphore, workers: int):
     print(f"\n--- [Phase 3] 正在智能融合章节 ---")
     
     temp_split_dir = temp_concat_dir.parent / "temp_split_sections"
@@ -373,44 +359,15 @@ def fuse_all_sections(paper_names: list, temp_concat_dir: Path, final_output_dir
     
     full_abstracts_context = "---\n".join(abstracts_content)
 
-    for section_name in SECTIONS_TO_FUSE:
-        print(f"  正在融合章节: {section_name}")
-        
-        concat_filename = f"{'+'.join(paper_names)}_{section_name}_CONCAT.md"
-        concat_filepath = temp_concat_dir / concat_filename
-        
-        if not concat_filepath.exists():
-            print(f"    [警告] 找不到拼接文件 {concat_filename}，跳过融合。")
-            continue
-            
-        section_content = concat_filepath.read_text(encoding='utf-8')
-        
-        prompt_filename = FUSION_PROMPT_MAP.get(section_name)
-        if not prompt_filename:
-            print(f"    [警告] 找不到 {section_name} 的融合prompt，跳过。")
-            continue
-            
-        fusion_prompt_template = load_prompt_template(prompt_filename)
-        final_prompt = fusion_prompt_template.replace("{abstracts_content}", full_abstracts_context)
-        final_prompt = final_prompt.replace("{section_content}", section_content)
-        
-        print(f"    调用 {config['model']} (多模态) 进行融合...")
-        try:
-            fused_content = process_text_with_images(
-                text=final_prompt,
-                api_key=config["api_key"],
-                model=config["model"],
-                base_path=str(temp_concat_dir) 
-            )
-            
-            final_filename = f"{'+'.join(paper_names)}_{section_name}.md"
-            final_filepath = final_output_dir / final_filename
-            final_filepath.write_text(fused_content, encoding='utf-8')
-            print(f"  🎉 融合成功! 已保存至: {final_filepath}")
+    # 各章节互不依赖，并发融合
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = [
+            executor.submit(fuse_section, section_name, paper_names, full_abstracts_context,
+                            temp_concat_dir, final_output_dir, config, llm_slots)
+            for section_name in SECTIONS_TO_FUSE
+        ]
+        concurrent.futures.wait(futures)
 
-        except Exception as e:
-            print(f"    [错误] 融合API调用失败: {e}")
-            
     combined_images_dir = temp_concat_dir / "combined_images"
     if combined_images_dir.exists():
         final_images_dir = final_output_dir / combined_images_dir.name
@@ -421,13 +378,20 @@ def fuse_all_sections(paper_names: list, temp_concat_dir: Path, final_output_dir
 
 # --- 主函数 ---
 def main():
-    if len(sys.argv) != 3:
-        print("使用方法: python multi_paper_document_processor.py <待处理论文总目录> <最终输出目录>")
+    if len(sys.argv) < 3:
+        print("使用方法: python multi_paper_document_processor.py <待处理论文总目录> <最终输出目录> [--workers N]")
         print("示例: python multi_paper_document_processor.py ../MinerU/outputs_clean/muti_paper_inputs01 ./fused_sections")
         sys.exit(1)
+    
+    parser = argparse.ArgumentParser(description="多文档智能处理与融合")
+    parser.add_argument("input_dir", help="待处理论文总目录")
+    parser.add_argument("output_dir", help="最终输出目录")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"并发分割的论文数/并发融合的章节数，同时也是LLM调用的并发上限 (默认: {DEFAULT_WORKERS})")
+    args = parser.parse_args()
         
-    input_dir = Path(sys.argv[1])
-    output_dir = Path(sys.argv[2])
+    input_dir = Path(args.input_dir)
+    output_dir = Path(args.output_dir)
     
     if not input_dir.is_dir():
         print(f"错误: 输入目录 '{input_dir}' 不存在或不是一个目录。")
@@ -452,10 +416,9 @@ def main():
         temp_split_dir.mkdir(parents=True, exist_ok=True)
         temp_concat_dir.mkdir(parents=True, exist_ok=True)
         
-        successful_splits = []
-        for paper_dir in paper_dirs:
-            if split_single_paper(paper_dir, temp_split_dir, config):
-                successful_splits.append(paper_dir)
+        # Phase 1 和 Phase 3 的所有LLM调用共享同一组并发名额
+        llm_slots = threading.BoundedSemaphore(max(1, args.workers))
+        successful_splits = split_papers(paper_dirs, temp_split_dir, config, llm_slots, args.workers)
         
         if not successful_splits:
             print("\n所有论文分割失败，程序终止。")
@@ -468,7 +431,9 @@ def main():
             [p.name for p in successful_splits], 
             temp_concat_dir, 
             output_dir, 
-            config
+            config,
+            llm_slots,
+            args.workers
         )
 
         print(f"\n处理完成！临时文件保留在 {temp_dir} 供调试。可手动删除。")
@@ -0,0 +1,110 @@
+"""
+流水线进度事件
+
+各流水线脚本通过 emit() 发送机器可读的进度事件，Flask 服务据此计算准确的进度、
+剩余时间和各阶段耗时，不再从 stdout 文本中猜测进度。
+
+事件以 JSON 数据报发送到环境变量 EDUPAL_PROGRESS_SOCKET 指定的 Unix 套接字，
+子进程（包括经 bash 或 subprocess 多级调用的脚本）继承环境变量即可上报；
+没有设置该变量时（例如在命令行手动运行）emit() 什么也不做。
+
+事件字段:
+    stage   阶段名 (mineru / sections / agents / coder / speecher / render ...)
+    event   start / progress / end
+    done    已完成的单元数     total  单元总数     unit  单元名称 (page / scene ...)
+    scope   同一阶段被多个进程并行执行时用于区分（如章节名），服务端按 scope 汇总
+    ts      发送时间 (time.time())
+
+end 事件同时是一个性能区间 (span)：附带 duration（墙钟耗时）和 cpu_seconds（本进程及已回收子进程的
+CPU 时间）。span() 把一段代码包装为 start/end；llm_call() 上报单次 LLM 调用的延迟和 token 数（event 为 llm）。
+服务端据此为每个任务生成 perf.json（见 job_perf.py）。
+"""
+
+import os
+import json
+import time
+import socket
+import threading
+from contextlib import contextmanager
+
+PROGRESS_SOCKET_ENV = "EDUPAL_PROGRESS_SOCKET"
+
+_sock = None
+# 已开始未结束的阶段: (stage, scope) -> (开始时间, 开始时的CPU时间)
+_open_spans = {}
+_open_lock = threading.Lock()
+
+
+def enabled():
+    return bool(os.environ.get(PROGRESS_SOCKET_ENV))
+
+
+def emit(stage, event="progress", done=None, total=None, unit=None, scope=None, **extra):
+    """发送一个进度事件；发送失败不影响流水线本身"""
+    global _sock
+    path = os.environ.get(PROGRESS_SOCKET_ENV)
+    if not path:
+        return
+    payload = {'stage': stage, 'event': event, 'ts': time.time(), 'pid': os.getpid()}
+    for key, value in (('done', done), ('total', total), ('unit', unit), ('scope', scope)):
+        if value is not None:
+            payload[key] = value
+    payload.update(extra)
+    try:
+        if _sock is None:
+            _sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            _sock.setblocking(False)
+        _sock.sendto(json.dumps(payload, ensure_ascii=False).encode("utf-8"), path)
+    except OSError:
+        pass
+
+
+def cpu_time():
+    """本进程及已回收子进程的CPU时间（秒）"""
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def start(stage, total=None, unit=None, scope=None):
+    if not enabled():
+        return
+    with _open_lock:
+        _open_spans[(stage, scope)] = (time.time(), cpu_time())
+    emit(stage, "start", done=0 if total is not None else None, total=total, unit=unit, scope=scope)
+
+
+def advance(stage, done, total, unit=None, scope=None):
+    emit(stage, "progress", done=done, total=total, unit=unit, scope=scope)
+
+
+def end(stage, scope=None, ok=True, **extra):
+    if not enabled():
+        return
+    with _open_lock:
+        opened = _open_spans.pop((stage, scope), None)
+    if opened is not None:
+        extra['duration'] = round(time.time() - opened[0], 3)
+        extra['cpu_seconds'] = round(cpu_time() - opened[1], 3)
+    emit(stage, "end", scope=scope, ok=ok, **extra)
+
+
+@contextmanager
+def span(stage, total=None, unit=None, scope=None):
+    """把一段代码作为一个阶段上报；代码抛出异常时 end 事件的 ok 为 False"""
+    start(stage, total=total, unit=unit, scope=scope)
+    ok = False
+    try:
+        yield
+        ok = True
+    except SystemExit as e:
+        # 脚本以 sys.exit(0) 正常结束时不算失败
+        ok = not e.code
+        raise
+    finally:
+        end(stage, scope=scope, ok=ok)
+
+
+def llm_call(model, latency, prompt_tokens=None, completion_tokens=None, cached=False, ok=True):
+    """上报一次 LLM 调用"""
+    emit("llm", "llm", model=model, latency=round(latency, 3), prompt_tokens=prompt_tokens,
+         completion_tokens=completion_tokens, cached=cached, ok=ok)
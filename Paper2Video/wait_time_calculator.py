@@ -1,6 +1,6 @@
-import re
 import sys
 import ast
+from concurrent.futures import ThreadPoolExecutor
 
 def get_indentation(file_path):
     """
@@ -19,9 +19,308 @@ def get_indentation(file_path):
     except Exception:
         return 0
 
+# Manim 的默认时长参数
+DEFAULT_WAIT_TIME = 1.0       # self.wait() 不带参数
+DEFAULT_RUN_TIME = 1.0        # 单个动画的默认 run_time
+# 动画组的默认 lag_ratio：AnimationGroup 同时播放，LaggedStart 依次错开，Succession 首尾相接
+DEFAULT_LAG_RATIOS = {
+    'AnimationGroup': 0.0,
+    'LaggedStart': 0.05,
+    'LaggedStartMap': 0.05,
+    'Succession': 1.0,
+}
+# 循环次数无法静态确定时按一次计算
+MAX_STATIC_LOOP = 10000
+
+
+class SceneDurationEstimator:
+    """
+    基于 ast 静态估算 Manim 场景时长
+
+    - self.wait(t) / self.wait(duration=t)，无参数时为 1 秒
+    - self.play(...)：优先使用 play 的 run_time；否则取各动画 run_time 的最大值（未指定时 1 秒），
+      AnimationGroup/LaggedStart/Succession 按 lag_ratio 计算组时长
+    - for 循环：range(常量) 或字面量列表/元组按次数累加，其他循环按一次计算
+    - if/else 取耗时较长的分支；self.<方法>() 调用同类中定义的方法时展开计算
+    - 常量表达式和函数内简单的常量赋值（如 t = 2 / 3）可以参与计算
+    """
+
+    def __init__(self, class_node):
+        self.methods = {
+            node.name: node for node in class_node.body
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+        }
+        self.warnings = []
+        self._call_stack = []
+
+    # ---------- 常量求值 ----------
+    def const_value(self, node, env):
+        """对常量表达式求值，无法静态确定时返回 None"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+            return float(node.value)
+        if isinstance(node, ast.Name):
+            return env.get(node.id)
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.UAdd, ast.USub)):
+            value = self.const_value(node.operand, env)
+            if value is None:
+                return None
+            return value if isinstance(node.op, ast.UAdd) else -value
+        if isinstance(node, ast.BinOp):
+            left, right = self.const_value(node.left, env), self.const_value(node.right, env)
+            if left is None or right is None:
+                return None
+            try:
+                if isinstance(node.op, ast.Add):
+                    return left + right
+                if isinstance(node.op, ast.Sub):
+                    return left - right
+                if isinstance(node.op, ast.Mult):
+                    return left * right
+                if isinstance(node.op, ast.Div):
+                    return left / right
+                if isinstance(node.op, ast.FloorDiv):
+                    return float(left // right)
+                if isinstance(node.op, ast.Mod):
+                    return left % right
+                if isinstance(node.op, ast.Pow):
+                    return float(left ** right)
+            except (ZeroDivisionError, OverflowError):
+                return None
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ('max', 'min') \
+                and node.args and not node.keywords:
+            values = [self.const_value(arg, env) for arg in node.args]
+            if None not in values:
+                return max(values) if node.func.id == 'max' else min(values)
+        return None
+
+    def loop_count(self, node, env):
+        """for 循环的静态迭代次数，无法确定时返回 None"""
+        iterable = node.iter
+        if isinstance(iterable, (ast.List, ast.Tuple, ast.Set)):
+            if not any(isinstance(e, ast.Starred) for e in iterable.elts):
+                return len(iterable.elts)
+            return None
+        if isinstance(iterable, ast.Constant) and isinstance(iterable.value, str):
+            return len(iterable.value)
+        if isinstance(iterable, ast.Call) and isinstance(iterable.func, ast.Name) and not iterable.keywords:
+            name = iterable.func.id
+            if name == 'range' and 1 <= len(iterable.args) <= 3:
+                values = [self.const_value(arg, env) for arg in iterable.args]
+                if None in values or any(v != int(v) for v in values):
+                    return None
+                try:
+                    return len(range(*[int(v) for v in values]))
+                except ValueError:
+                    return None
+            if name in ('enumerate', 'reversed', 'list', 'tuple') and len(iterable.args) == 1:
+                return self.loop_count(ast.For(target=node.target, iter=iterable.args[0], body=[], orelse=[]), env)
+            if name == 'zip' and iterable.args:
+                counts = [self.loop_count(ast.For(target=node.target, iter=arg, body=[], orelse=[]), env)
+                          for arg in iterable.args]
+                return None if None in counts else min(counts)
+        return None
+
+    # ---------- 动画时长 ----------
+    @staticmethod
+    def keyword(call, name):
+        for kw in call.keywords:
+            if kw.arg == name:
+                return kw.value
+        return None
+
+    @staticmethod
+    def call_name(call):
+        func = call.func
+        if isinstance(func, ast.Name):
+            return func.id
+        if isinstance(func, ast.Attribute):
+            return func.attr
+        return None
+
+    def animation_time(self, node, env):
+        """单个动画表达式的时长"""
+        if isinstance(node, ast.Starred):
+            node = node.value
+        if not isinstance(node, ast.Call):
+            return DEFAULT_RUN_TIME
+
+        run_time_node = self.keyword(node, 'run_time')
+        if run_time_node is not None:
+            run_time = self.const_value(run_time_node, env)
+            if run_time is not None:
+                return run_time
+            self.warnings.append(f"无法静态计算 run_time（第{node.lineno}行），按 {DEFAULT_RUN_TIME} 秒计算")
+
+        name = self.call_name(node)
+        if name in DEFAULT_LAG_RATIOS:
+            return self.group_time(node, name, env)
+        # obj.animate.xxx(...).set_run_time(...) 之类的链式写法
+        if isinstance(node.func, ast.Attribute) and isinstance(node.func.value, ast.Call):
+            if node.func.attr == 'set_run_time' and node.args:
+                run_time = self.const_value(node.args[0], env)
+                if run_time is not None:
+                    return run_time
+        return DEFAULT_RUN_TIME
+
+    def group_time(self, call, name, env):
+        """
+        动画组时长：第 i 个子动画在前一个开始后 lag_ratio * 前一个时长处开始，
+        组时长为最后结束的子动画的结束时间
+        """
+        lag_node = self.keyword(call, 'lag_ratio')
+        lag_ratio = self.const_value(lag_node, env) if lag_node is not None else None
+        if lag_ratio is None:
+            lag_ratio = DEFAULT_LAG_RATIOS[name]
+
+        # LaggedStartMap(AnimClass, group) 的子动画个数无法静态确定，按单个动画计算
+        children = [] if name == 'LaggedStartMap' else call.args
+        if len(children) == 1 and isinstance(children[0], ast.Starred):
+            count = self.starred_count(children[0].value, env)
+            elt = self.comprehension_element(children[0].value)
+            child_time = self.animation_time(elt, env) if elt is not None else DEFAULT_RUN_TIME
+            times = [child_time] * (count or 1)
+        else:
+            times = [self.animation_time(child, env) for child in children] or [DEFAULT_RUN_TIME]
+
+        start, end = 0.0, 0.0
+        for i, t in enumerate(times):
+            if i > 0:
+                start += lag_ratio * times[i - 1]
+            end = max(end, start + t)
+        return end
+
+    def comprehension_element(self, node):
+        if isinstance(node, (ast.ListComp, ast.GeneratorExp)):
+            return node.elt
+        return None
+
+    def starred_count(self, node, env):
+        """*[... for x in <常量可迭代对象>] 的元素个数"""
+        if isinstance(node, (ast.List, ast.Tuple)):
+            return len(node.elts)
+        if isinstance(node, (ast.ListComp, ast.GeneratorExp)) and len(node.generators) == 1 \
+                and not node.generators[0].ifs:
+            gen = node.generators[0]
+            return self.loop_count(ast.For(target=gen.target, iter=gen.iter, body=[], orelse=[]), env)
+        return None
+
+    def play_time(self, call, env):
+        run_time_node = self.keyword(call, 'run_time')
+        if run_time_node is not None:
+            run_time = self.const_value(run_time_node, env)
+            if run_time is not None:
+                return run_time
+            self.warnings.append(f"无法静态计算 run_time（第{call.lineno}行），按各动画时长计算")
+        times = [self.animation_time(arg, env) for arg in call.args]
+        return max(times) if times else DEFAULT_RUN_TIME
+
+    def wait_time(self, call, env):
+        arg = call.args[0] if call.args else self.keyword(call, 'duration')
+        if arg is None:
+            return DEFAULT_WAIT_TIME
+        value = self.const_value(arg, env)
+        if value is None:
+            self.warnings.append(f"无法解析等待时间参数（第{call.lineno}行）: {ast.unparse(arg)}")
+            return 0.0
+        return value
+
+    # ---------- 语句遍历 ----------
+    def self_call(self, node):
+        """若 node 是 self.<name>(...) 调用，返回 (name, call)"""
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                and isinstance(node.func.value, ast.Name) and node.func.value.id == 'self':
+            return node.func.attr, node
+        return None, None
+
+    def expr_time(self, node, env):
+        """表达式中 self.play/self.wait/self.<方法> 调用的总时长"""
+        total = 0.0
+        for sub in ast.walk(node):
+            name, call = self.self_call(sub)
+            if name == 'play':
+                total += self.play_time(call, env)
+            elif name == 'wait':
+                total += self.wait_time(call, env)
+            elif name in self.methods and name not in self._call_stack:
+                total += self.method_time(name)
+        return total
+
+    def block_time(self, statements, env):
+        total = 0.0
+        for stmt in statements:
+            total += self.stmt_time(stmt, env)
+        return total
+
+    def stmt_time(self, stmt, env):
+        if isinstance(stmt, ast.Assign):
+            value = self.const_value(stmt.value, env)
+            for target in stmt.targets:
+                if isinstance(target, ast.Name):
+                    if value is not None:
+                        env[target.id] = value
+                    else:
+                        env.pop(target.id, None)
+            return self.expr_time(stmt.value, env)
+        if isinstance(stmt, ast.For):
+            count = self.loop_count(stmt, env)
+            if count is None or count > MAX_STATIC_LOOP:
+                self.warnings.append(f"循环次数无法静态确定（第{stmt.lineno}行），按一次计算")
+                count = 1
+            return count * self.block_time(stmt.body, dict(env)) + self.block_time(stmt.orelse, env)
+        if isinstance(stmt, ast.While):
+            self.warnings.append(f"while 循环（第{stmt.lineno}行）按一次计算")
+            return self.block_time(stmt.body, dict(env))
+        if isinstance(stmt, ast.If):
+            return max(self.block_time(stmt.body, dict(env)), self.block_time(stmt.orelse, dict(env)))
+        if isinstance(stmt, (ast.With, ast.AsyncWith)):
+            return self.block_time(stmt.body, env)
+        if isinstance(stmt, ast.Try):
+            return self.block_time(stmt.body, env) + self.block_time(stmt.finalbody, env)
+        if isinstance(stmt, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            return 0.0
+        return self.expr_time(stmt, env)
+
+    def method_time(self, name):
+        self._call_stack.append(name)
+        try:
+            return self.block_time(self.methods[name].body, {})
+        finally:
+            self._call_stack.pop()
+
+    def estimate(self):
+        if 'construct' not in self.methods:
+            return None
+        return self.method_time('construct')
+
+
+def find_scene_class(tree):
+    """返回定义了 construct 方法的第一个类"""
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and any(
+            isinstance(item, ast.FunctionDef) and item.name == 'construct' for item in node.body
+        ):
+            return node
+    return None
+
+
+def estimate_scene_duration(source, filename="<scene>"):
+    """
+    估算场景源码的时长
+
+    Returns:
+        (时长秒数, 警告列表)；找不到场景类时时长为 None
+    """
+    tree = ast.parse(source, filename=filename)
+    scene_class = find_scene_class(tree)
+    if scene_class is None:
+        return None, ["未找到包含 construct 方法的场景类"]
+    estimator = SceneDurationEstimator(scene_class)
+    return estimator.estimate(), estimator.warnings
+
+
 def extract_animation_times(file_path):
     """
-    从manim代码文件中提取所有self.wait()和self.play()调用的时间总和
+    从manim代码文件中计算所有self.wait()和self.play()调用的时间总和
     
     Args:
         file_path (str): manim代码文件的路径
@@ -33,29 +332,9 @@ def extract_animation_times(file_path):
         with open(file_path, 'r', encoding='utf-8') as f:
             content = f.read()
         
-        total_time = 0
-        
-        # 计算wait时间
-        wait_pattern = r'self\.wait\((.*?)\)'
-        wait_calls = re.findall(wait_pattern, content)
-        
-        for wait_arg in wait_calls:
-            if not wait_arg:  # 如果wait()没有参数
-                total_time += 1  # 默认等待时间为1秒
-            else:
-                try:
-                    # 尝试评估参数（处理数字表达式）
-                    wait_time = eval(wait_arg)
-                    total_time += float(wait_time)
-                except:
-                    print(f"警告：无法解析等待时间参数: {wait_arg}")
-                    continue
-        
-        # 计算play次数
-        play_pattern = r'self\.play\('
-        play_calls = re.findall(play_pattern, content)
-        total_time += len(play_calls)  # 每个play算作1秒
-        
+        total_time, warnings = estimate_scene_duration(content, file_path)
+        for warning in warnings:
+            print(f"警告：{warning}")
         return total_time
     
     except FileNotFoundError:
@@ -65,30 +344,115 @@ def extract_animation_times(file_path):
         print(f"错误：处理文件时发生错误: {str(e)}")
         return None
 
-def add_wait_time(file_path, additional_time):
-    """
-    在文件末尾添加额外的wait时间和FadeOut效果
-    """
+def _append_wait(file_path, additional_time):
+    """在文件末尾追加 wait 和淡出语句"""
     try:
         # 获取当前文件的缩进
         indent = get_indentation(file_path)
         indent_str = " " * indent
         
         # 在文件末尾添加wait语句和FadeOut效果
-        with open(file_path, 'a') as f:
+        with open(file_path, 'a', encoding='utf-8') as f:
             f.write(f"\n{indent_str}self.wait({additional_time:.2f})")
             f.write(f"\n{indent_str}to_fade = [m for m in self.mobjects if m != bg]")
             f.write(f"\n{indent_str}self.play(FadeOut(*to_fade))")
-        
-        print(f"已在文件末尾添加：")
-        print(f"1. self.wait({additional_time:.2f})")
-        print(f"2. to_fade = [m for m in self.mobjects if m != bg]")
-        print(f"3. self.play(FadeOut(*to_fade))")
         return True
     except Exception as e:
         print(f"错误：添加动画效果时发生错误: {str(e)}")
         return False
 
+def add_wait_time(file_path, additional_time):
+    """
+    在文件末尾添加额外的wait时间和FadeOut效果
+    """
+    if not _append_wait(file_path, additional_time):
+        return False
+    print(f"已在文件末尾添加：")
+    print(f"1. self.wait({additional_time:.2f})")
+    print(f"2. to_fade = [m for m in self.mobjects if m != bg]")
+    print(f"3. self.play(FadeOut(*to_fade))")
+    return True
+
+def adjust_scene_duration(file_path, target_duration, verbose=True):
+    """
+    计算场景时长，与目标时长对比，不足时在末尾补 wait 和淡出
+
+    末尾追加的 FadeOut 本身占 1 秒，因此需要补的等待时间为 目标 - 当前 - 1。
+
+    Returns:
+        dict: {'file', 'target', 'estimated', 'difference', 'added_wait', 'status', 'warnings'}，
+        status 为 'padded' / 'too_long' / 'exact' / 'error'
+    """
+    result = {
+        'file': file_path,
+        'target': target_duration,
+        'estimated': None,
+        'difference': None,
+        'added_wait': 0.0,
+        'status': 'error',
+        'warnings': [],
+    }
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        total_time, result['warnings'] = estimate_scene_duration(content, file_path)
+    except (OSError, SyntaxError) as e:
+        result['warnings'].append(str(e))
+        if verbose:
+            print(f"错误：处理文件时发生错误: {str(e)}")
+        return result
+    if total_time is None:
+        if verbose:
+            print(f"错误：{file_path} 中{result['warnings'][0]}")
+        return result
+
+    difference = target_duration - total_time - 1
+    result.update({'estimated': total_time, 'difference': difference})
+    if verbose:
+        for warning in result['warnings']:
+            print(f"警告：{warning}")
+        print(f"\n分析结果：")
+        print(f"总时长 (wait + play): {total_time:.2f} 秒")
+        print(f"目标时长: {target_duration:.2f} 秒")
+        print(f"时间差值: {difference:.2f} 秒")
+
+    if difference > 0:
+        if verbose:
+            print(f"建议：需要增加 {difference:.2f} 秒的时间")
+        # 自动添加额外的wait时间和FadeOut效果
+        appended = add_wait_time(file_path, difference) if verbose else _append_wait(file_path, difference)
+        if appended:
+            result.update({'status': 'padded', 'added_wait': difference})
+            if verbose:
+                print("✓ 已自动添加所需的等待时间和淡出效果")
+    elif difference < 0:
+        result['status'] = 'too_long'
+        if verbose:
+            print(f"建议：需要减少 {abs(difference):.2f} 秒的时间")
+    else:
+        result['status'] = 'exact'
+        if verbose:
+            print("完美匹配！当前总时长正好达到目标时长")
+    return result
+
+
+def adjust_all_scenes(targets, verbose=False, workers=1):
+    """
+    在同一进程内批量调整场景文件
+
+    Args:
+        targets: [(代码文件路径, 目标时长秒数), ...]
+        workers: 大于1时用线程池并行处理不同文件（verbose 输出会交错，建议并行时关闭）
+
+    Returns:
+        list: 与 targets 顺序一致的 adjust_scene_duration 结果
+    """
+    if workers > 1 and len(targets) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(lambda t: adjust_scene_duration(t[0], t[1], verbose=verbose), targets))
+    return [adjust_scene_duration(file_path, duration, verbose=verbose) for file_path, duration in targets]
+
+
 def main():
     if len(sys.argv) != 3:
         print("用法: python wait_time_calculator.py <目标时长（秒）> <manim文件路径>")
@@ -96,30 +460,11 @@ def main():
     
     try:
         target_duration = float(sys.argv[1])
-        file_path = sys.argv[2]
-        
-        total_time = extract_animation_times(file_path)
-        
-        if total_time is not None:
-            print(f"\n分析结果：")
-            print(f"总时长 (wait + play): {total_time:.2f} 秒")
-            print(f"目标时长: {target_duration:.2f} 秒")
-            difference = target_duration - total_time - 1  
-            print(f"时间差值: {difference:.2f} 秒")
-            
-            if difference > 0:
-                print(f"建议：需要增加 {difference:.2f} 秒的时间")
-                # 自动添加额外的wait时间和FadeOut效果
-                if add_wait_time(file_path, difference):
-                    print("✓ 已自动添加所需的等待时间和淡出效果")
-            elif difference < 0:
-                print(f"建议：需要减少 {abs(difference):.2f} 秒的时间")
-            else:
-                print("完美匹配！当前总时长正好达到目标时长")
-    
     except ValueError:
         print("错误：目标时长必须是一个有效的数字")
         sys.exit(1)
+    
+    adjust_scene_duration(sys.argv[2], target_duration)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -6,6 +6,8 @@ import sys
 import subprocess
 import argparse
 
+from Paper2Video import pipeline_progress
+
 # <--- 新增代码块 开始 --->
 # 通过此脚本的位置反向推断出项目的根目录
 # 假设此脚本位于 project_root/ 目录下
@@ -15,6 +17,9 @@ except NameError:
     PROJECT_ROOT = os.getcwd() # 作为后备方案
 # <--- 新增代码块 结束 --->
 
+# 是否并行运行四个章节的Chapter_Agent pipeline (设置 PARALLEL_AGENTS=0 改为依次执行)
+PARALLEL_AGENTS = os.environ.get('PARALLEL_AGENTS', '1').lower() in ['1', 'true', 'yes']
+
 
 def print_step(title):
     print(f"\n{'='*60}")
@@ -84,7 +89,9 @@ def run_single_file_workflow(input_pdf_path, output_dir=None):
     mineru_script_path = os.path.join(PROJECT_ROOT, "services", "mineru", "run_mineru.py")
     
     # 2. 直接调用脚本，不再需要计算相对路径和使用 cwd
+    pipeline_progress.start("mineru")
     run_command_live_output(["python3", mineru_script_path, input_pdf_path])
+    pipeline_progress.end("mineru")
 
     # 3. 从新的、规范化的路径构建下一步所需的输入路径
     #    单文件输出路径与批量不同，保持简单： outputs/mineru_clean/<文件名>
@@ -100,6 +107,8 @@ def run_single_file_workflow(input_pdf_path, output_dir=None):
     command = ["python3", "master_pipeline.py", md_path, image_output_dir]
     if output_dir:
         command.extend(["--output-base-dir", output_dir])
+    if PARALLEL_AGENTS:
+        command.append("--parallel-agents")
         
     # <--- 修改: 移除 cwd 参数 --->
     run_command_live_output(command, cwd=os.path.join(PROJECT_ROOT, "Paper2Video"))
@@ -128,7 +137,9 @@ def run_multi_file_workflow(input_dir_path, output_dir=None):
     mineru_batch_script_path = os.path.join(PROJECT_ROOT, "services", "mineru", "run_mineru_batch.py")
 
     # 2. 直接调用脚本，不再需要计算相对路径和使用 cwd
+    pipeline_progress.start("mineru")
     run_command_live_output(["python3", mineru_batch_script_path, input_dir_path])
+    pipeline_progress.end("mineru")
 
     # 3. 构建下一步所需的输入路径，精确匹配 run_mineru_batch.py 的新输出位置
     mineru_clean_output_dir = os.path.join(PROJECT_ROOT, "outputs", "mineru", "outputs_clean", dir_name)
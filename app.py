@@ -1,7 +1,8 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 import os
 from werkzeug.utils import secure_filename
 import services
+import api_call
 import uuid
 from datetime import datetime
 import sys
@@ -51,6 +52,12 @@ def _handle_api_generation_request(output_format):
         if mode not in ['single', 'batch']:
             return jsonify({'error': "参数 'options' 中必须包含 'mode' 字段，其值为 'single' 或 'batch'"}), 400
 
+        # 可选的调度优先级，数值越大越先执行
+        try:
+            priority = int(options.get('priority', 0))
+        except (TypeError, ValueError):
+            return jsonify({'error': "参数 'priority' 必须是整数"}), 400
+
         result = {}
         
         # --- 情况A: 单文件处理逻辑 ---
@@ -76,7 +83,8 @@ def _handle_api_generation_request(output_format):
                 voice_type=options.get('voice_type', 'female'),
                 # background_choice=options.get('background_choice', 'default'),
                 background_choice=options.get('background_choice', 'background.png'),
-                auto_continue=True # 如果是false就可以不写这一行,仅仅在企业配置接口的时候需要
+                auto_continue=True, # 如果是false就可以不写这一行,仅仅在企业配置接口的时候需要
+                priority=priority
             )
 
         # --- 情况B: 批量/文件夹处理逻辑 ---
@@ -101,7 +109,8 @@ def _handle_api_generation_request(output_format):
                 voice_type=options.get('voice_type', 'female'),
                 # background_choice=options.get('background_choice', 'default),
                 background_choice=options.get('background_choice', 'background.png'),
-                auto_continue=True # 如果是false就可以不写这一行
+                auto_continue=True, # 如果是false就可以不写这一行
+                priority=priority
             )
 
         # 3. 返回标准响应
@@ -112,8 +121,10 @@ def _handle_api_generation_request(output_format):
         return jsonify({
             "task_id": task_id,
             "status": "queued",
+            "queue_position": result.get('queue_position'),
             "message": f"{output_format.capitalize()} ({mode} mode) 任务已创建。",
-            "status_url": f"/api/v1/status/{task_id}"
+            "status_url": f"/api/v1/status/{task_id}",
+            "cancel_url": f"/api/v1/cancel/{task_id}"
         }), 202
 
     except Exception as e:
@@ -143,7 +154,7 @@ def api_paper_to_ppt():
 @app.route('/api/v1/status/<task_id>', methods=['GET'])
 def api_get_status(task_id):
     """【API状态查询】根据任务ID，返回任务的当前状态、进度和结果。"""
-    with services.processing_lock:
+    with services.job_lock(task_id):
         if task_id not in services.processing_jobs:
             return jsonify({'error': '未找到指定的任务ID'}), 404
         
@@ -151,6 +162,15 @@ def api_get_status(task_id):
 
         if job['status'] == 'failed':
             response = { "task_id": task_id, "status": "failed", "error": job.get('error', '未知错误') }
+        elif job['status'] == 'cancelled':
+            response = { "task_id": task_id, "status": "cancelled" }
+        elif job['status'] == 'queued':
+            response = {
+                "task_id": task_id,
+                "status": "queued",
+                "queue_position": services.job_scheduler.queue_position(task_id),
+                "details": job.get('current_step', '排队等待执行')
+            }
         elif job['stage'] == 'completed':
             response = {
                 "task_id": task_id,
@@ -172,10 +192,63 @@ def api_get_status(task_id):
     return jsonify(response)
 
 
+# SSE 连接空闲时发送心跳的间隔（秒），防止代理断开连接
+SSE_KEEPALIVE_SECONDS = 15
+
+
+def _sse_message(event_type, data, event_id=None):
+    message = f"event: {event_type}\n"
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"data: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.route('/api/v1/events/<task_id>', methods=['GET'])
+def api_job_events(task_id):
+    """【API实时进度】以 Server-Sent Events 推送任务的进度、阶段变化和新增日志，替代轮询状态接口。"""
+    # 先订阅再取快照，快照之后发生的变化都不会漏掉
+    subscription = services.job_events.subscribe(task_id)
+    snapshot = services.get_processing_status(task_id)
+    if 'error' in snapshot:
+        subscription.close()
+        return jsonify({'error': '未找到指定的任务ID'}), 404
+
+    def generate():
+        with subscription:
+            # snapshot: 完整状态（与 /processing-status 相同）；update: 变化的字段；log: 新增日志；end: 任务结束
+            yield _sse_message('snapshot', snapshot)
+            if snapshot['status'] in services.TERMINAL_STATUSES:
+                yield _sse_message('end', {'status': snapshot['status']})
+                return
+            while True:
+                event = subscription.get(timeout=SSE_KEEPALIVE_SECONDS)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event['type'] == 'resync':
+                    yield _sse_message('snapshot', services.get_processing_status(task_id))
+                    continue
+                yield _sse_message(event['type'], event['data'], event['id'])
+                if event['type'] == 'end':
+                    return
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+@app.route('/api/v1/cancel/<task_id>', methods=['POST'])
+def api_cancel_task(task_id):
+    """【API取消任务】取消排队中或运行中的任务。"""
+    result = services.cancel_processing(task_id)
+    if 'error' in result:
+        return jsonify(result), 404 if result['error'] == '处理任务不存在' else 409
+    return jsonify(result)
+
+
 @app.route('/api/v1/result/<task_id>', methods=['GET'])
 def api_get_result(task_id):
     """【API结果下载】根据任务ID，提供最终生成文件的下载。"""
-    with services.processing_lock:
+    with services.job_lock(task_id):
         if task_id not in services.processing_jobs:
             return jsonify({'error': '未找到指定的任务ID'}), 404
         
@@ -191,6 +264,47 @@ def api_get_result(task_id):
     return send_file(file_path, as_attachment=True)
 
 
+@app.route('/api/v1/sync-report/<task_id>', methods=['GET'])
+def api_get_sync_report(task_id):
+    """【API对齐报告】返回各场景目标时长（音频）与计算出的动画时长。"""
+    result = services.get_sync_report(task_id)
+    if 'error' in result:
+        return jsonify(result), 404
+    return jsonify(result)
+
+
+@app.route('/api/v1/scheduler-stats', methods=['GET'])
+def api_get_scheduler_stats():
+    """【API调度统计】返回正在运行的任务、排队顺序和各阶段名额占用情况。"""
+    return jsonify(services.get_scheduler_stats())
+
+
+@app.route('/api/v1/perf-stats', methods=['GET'])
+def api_get_perf_stats():
+    """【API性能统计】汇总最近任务的 perf.json，返回各阶段耗时、CPU时间、写入量和LLM调用的分位数。"""
+    try:
+        limit = int(request.args.get('limit', 50))
+    except ValueError:
+        return jsonify({'error': "参数 'limit' 必须是整数"}), 400
+    if limit <= 0:
+        return jsonify({'error': "参数 'limit' 必须大于0"}), 400
+    return jsonify(services.get_perf_summary(limit))
+
+
+@app.route('/api/v1/llm-stats', methods=['GET'])
+def api_get_llm_stats():
+    """【API运行统计】返回本进程LLM客户端连接复用情况、响应缓存命中情况、机器级限流状态和图片缓存情况。"""
+    cache = api_call.get_default_cache()
+    limiter = api_call.llm_limiter.get_rate_limiter()
+    image_cache = api_call.image_payload.get_image_cache()
+    return jsonify({
+        'clients': api_call.get_client_registry().stats(),
+        'cache': cache.stats() if cache is not None else None,
+        'rate_limit': limiter.stats() if limiter is not None else None,
+        'images': image_cache.stats() if image_cache is not None else None
+    })
+
+
 
 # ========================= 核心功能API =========================
 @app.route('/')
@@ -997,7 +1111,7 @@ def preview_page_video(process_id, filename):
     # 为Web编辑器提供分页视频的预览功能，根据任务ID和文件名安全地返回视频流。
     try:
         # 获取处理任务信息
-        with services.processing_lock:
+        with services.job_lock(process_id):
             if process_id not in services.processing_jobs:
                 return jsonify({'error': '处理任务不存在'}), 404
             
@@ -1055,6 +1169,26 @@ def ai_edit_code():
     except Exception as e:
         return jsonify({'error': f'智能体编辑失败: {str(e)}'}), 500
 
+@app.route('/editor/ai-edit-stream', methods=['POST'])
+def ai_edit_code_stream():
+    """智能体编辑代码（SSE流式返回）"""
+    # 与 /editor/ai-edit 参数相同，但以 text/event-stream 边生成边推送代码片段，
+    # 最后一条事件带有 done=true 和清理后的完整代码。
+    data = request.get_json() or {}
+    original_code = data.get('original_code')
+    edit_request = data.get('edit_request')
+    filename = data.get('filename')
+    
+    if not original_code or not edit_request:
+        return jsonify({'error': '缺少原始代码或修改需求'}), 400
+    
+    def generate():
+        for event in services.ai_edit_code_stream(original_code, edit_request, filename):
+            yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/editor/page-associations/<process_id>')
 def get_page_associations(process_id):
     """获取页面与视频的关联关系"""
@@ -1082,7 +1216,8 @@ def preview_markdown(process_id):
     import re
     
     try:
-        with services.processing_lock:
+        # 只在任务锁内读取结果路径，解压和图片编码在锁外进行，避免阻塞状态查询
+        with services.job_lock(process_id):
             if process_id not in services.processing_jobs:
                 return jsonify({
                     'success': False,
@@ -1097,103 +1232,103 @@ def preview_markdown(process_id):
                 }), 404
             
             zip_path = job['final_output_path']
-            if not os.path.exists(zip_path):
+        if not os.path.exists(zip_path):
+            return jsonify({
+                'success': False,
+                'error': 'Markdown文档文件不存在'
+            }), 404
+        
+        # 提取zip文件并读取markdown内容
+        markdown_content = ""
+        images = []
+        image_mapping = {}  # 用于存储原始图片路径到base64数据的映射
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                zip_ref.extractall(temp_dir)
+            
+            # 查找markdown文件
+            md_path = None
+            for root, dirs, files in os.walk(temp_dir):
+                for file in files:
+                    if file.endswith('.md'):
+                        md_path = os.path.join(root, file)
+                        with open(md_path, 'r', encoding='utf-8') as f:
+                            markdown_content = f.read()
+                        break
+                if markdown_content:
+                    break
+            
+            if not md_path:
                 return jsonify({
                     'success': False,
-                    'error': 'Markdown文档文件不存在'
+                    'error': 'Markdown文件未找到'
                 }), 404
             
-            # 提取zip文件并读取markdown内容
-            markdown_content = ""
-            images = []
-            image_mapping = {}  # 用于存储原始图片路径到base64数据的映射
+            # 查找并处理所有图片文件
+            for root, dirs, files in os.walk(temp_dir):
+                for file in files:
+                    if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg')):
+                        # 将图片转换为base64编码
+                        img_path = os.path.join(root, file)
+                        try:
+                            with open(img_path, 'rb') as img_file:
+                                img_data = base64.b64encode(img_file.read()).decode()
+                                ext = os.path.splitext(file)[1][1:].lower()
+                                if ext == 'svg':
+                                    mime_type = 'image/svg+xml'
+                                else:
+                                    mime_type = f'image/{ext}'
+                                
+                                # 存储图片信息
+                                image_data = f'data:{mime_type};base64,{img_data}'
+                                images.append({
+                                    'filename': file,
+                                    'data': image_data
+                                })
+                                
+                                # 计算图片相对于markdown文件的路径
+                                rel_path = os.path.relpath(img_path, os.path.dirname(md_path))
+                                # 替换Windows路径分隔符为Linux风格
+                                rel_path = rel_path.replace('\\', '/')
+                                # 同时存储不同可能的路径形式以增加匹配概率
+                                image_mapping[rel_path] = image_data
+                                image_mapping[file] = image_data
+                                
+                                # 处理combined_images路径格式
+                                if 'combined_images/' in rel_path:
+                                    image_mapping[rel_path.split('combined_images/')[1]] = image_data
+                                    
+                        except Exception as e:
+                            print(f"处理图片 {file} 时出错: {e}")
             
-            with tempfile.TemporaryDirectory() as temp_dir:
-                with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                    zip_ref.extractall(temp_dir)
-                
-                # 查找markdown文件
-                md_path = None
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        if file.endswith('.md'):
-                            md_path = os.path.join(root, file)
-                            with open(md_path, 'r', encoding='utf-8') as f:
-                                markdown_content = f.read()
-                            break
-                    if markdown_content:
-                        break
-                
-                if not md_path:
-                    return jsonify({
-                        'success': False,
-                        'error': 'Markdown文件未找到'
-                    }), 404
+            # 替换Markdown中的图片引用为base64数据
+            def replace_image_path(match):
+                alt_text = match.group(1)
+                img_path = match.group(2)
                 
-                # 查找并处理所有图片文件
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        if file.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.svg')):
-                            # 将图片转换为base64编码
-                            img_path = os.path.join(root, file)
-                            try:
-                                with open(img_path, 'rb') as img_file:
-                                    img_data = base64.b64encode(img_file.read()).decode()
-                                    ext = os.path.splitext(file)[1][1:].lower()
-                                    if ext == 'svg':
-                                        mime_type = 'image/svg+xml'
-                                    else:
-                                        mime_type = f'image/{ext}'
-                                    
-                                    # 存储图片信息
-                                    image_data = f'data:{mime_type};base64,{img_data}'
-                                    images.append({
-                                        'filename': file,
-                                        'data': image_data
-                                    })
-                                    
-                                    # 计算图片相对于markdown文件的路径
-                                    rel_path = os.path.relpath(img_path, os.path.dirname(md_path))
-                                    # 替换Windows路径分隔符为Linux风格
-                                    rel_path = rel_path.replace('\\', '/')
-                                    # 同时存储不同可能的路径形式以增加匹配概率
-                                    image_mapping[rel_path] = image_data
-                                    image_mapping[file] = image_data
-                                    
-                                    # 处理combined_images路径格式
-                                    if 'combined_images/' in rel_path:
-                                        image_mapping[rel_path.split('combined_images/')[1]] = image_data
-                                        
-                            except Exception as e:
-                                print(f"处理图片 {file} 时出错: {e}")
+                # 尝试不同的路径格式进行匹配
+                if img_path in image_mapping:
+                    return f'![{alt_text}]({image_mapping[img_path]})'
                 
-                # 替换Markdown中的图片引用为base64数据
-                def replace_image_path(match):
-                    alt_text = match.group(1)
-                    img_path = match.group(2)
-                    
-                    # 尝试不同的路径格式进行匹配
-                    if img_path in image_mapping:
-                        return f'![{alt_text}]({image_mapping[img_path]})'
-                    
-                    # 尝试提取文件名作为回退方案
-                    img_filename = os.path.basename(img_path)
-                    if img_filename in image_mapping:
-                        return f'![{alt_text}]({image_mapping[img_filename]})'
-                    
-                    # 如果都找不到，保留原始路径
-                    return match.group(0)
+                # 尝试提取文件名作为回退方案
+                img_filename = os.path.basename(img_path)
+                if img_filename in image_mapping:
+                    return f'![{alt_text}]({image_mapping[img_filename]})'
                 
-                # 使用正则表达式替换Markdown中的图片引用
-                markdown_content = re.sub(r'!\[(.*?)\]\((.*?)\)', replace_image_path, markdown_content)
-            
-            return jsonify({
-                'success': True,
-                'markdown_content': markdown_content,
-                'images': images,
-                'filename': os.path.basename(zip_path)
-            })
+                # 如果都找不到，保留原始路径
+                return match.group(0)
             
+            # 使用正则表达式替换Markdown中的图片引用
+            markdown_content = re.sub(r'!\[(.*?)\]\((.*?)\)', replace_image_path, markdown_content)
+        
+        return jsonify({
+            'success': True,
+            'markdown_content': markdown_content,
+            'images': images,
+            'filename': os.path.basename(zip_path)
+        })
+        
     except Exception as e:
         return jsonify({
             'success': False,
@@ -1207,7 +1342,7 @@ def serve_markdown_image(process_id, image_path):
     import os
     
     try:
-        with services.processing_lock:
+        with services.job_lock(process_id):
             if process_id not in services.processing_jobs:
                 return jsonify({'error': '处理任务不存在'}), 404
             
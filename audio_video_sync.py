@@ -3,8 +3,16 @@
 
 import os
 import sys
-import subprocess
 import re
+import json
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "Paper2Video"))
+from wait_time_calculator import adjust_all_scenes
+
+# 对齐报告文件名，位于 final_results 目录下
+SYNC_REPORT_FILENAME = "sync_report.json"
 
 def parse_speech_txt(speech_txt_path):
     """
@@ -75,53 +83,80 @@ def get_corresponding_code_file(audio_filename):
     
     return code_filename
 
-def run_wait_time_calculator(duration, code_file_path):
+def sync_scenes(audio_info, code_dir, workers=1):
     """
-    运行wait_time_calculator.py脚本
-    
+    按音频时长对齐 code_dir 下所有场景代码（在本进程内完成）
+
     Args:
-        duration (float): 目标时长
-        code_file_path (str): 代码文件路径
-    
+        audio_info: parse_speech_txt 的结果，[(音频文件名, 时长秒数), ...]
+        code_dir: 场景代码目录
+        workers: 并行处理的文件数，1 为顺序处理
+
     Returns:
-        bool: 是否成功执行
+        dict: 结构化报告，scenes 按 audio_info 顺序排列，每项包含
+        audio_file / code_file / target / estimated / difference / added_wait / status / warnings；
+        status 为 padded / too_long / exact / error / missing_code
     """
-    try:
-        cmd = ['python3', 'Paper2Video/wait_time_calculator.py', str(duration), code_file_path]
-        print(f"🔧 执行命令: {' '.join(cmd)}")
-        
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        
-        if result.stdout:
-            print(result.stdout)
-        if result.stderr:
-            print(f"⚠️  stderr: {result.stderr}")
-        
-        return True
-    
-    except subprocess.CalledProcessError as e:
-        print(f"❌ 命令执行失败，退出码: {e.returncode}")
-        if e.stdout:
-            print(f"stdout: {e.stdout}")
-        if e.stderr:
-            print(f"stderr: {e.stderr}")
-        return False
-    except Exception as e:
-        print(f"❌ 执行过程中发生错误: {str(e)}")
-        return False
+    start_time = time.time()
+    scenes = []
+    targets = []
+    for audio_file, duration in audio_info:
+        code_file_path = os.path.join(code_dir, get_corresponding_code_file(audio_file))
+        scene = {
+            'audio_file': audio_file,
+            'code_file': os.path.basename(code_file_path),
+            'target': duration,
+            'estimated': None,
+            'difference': None,
+            'added_wait': 0.0,
+            'status': 'missing_code',
+            'warnings': [],
+        }
+        scenes.append(scene)
+        if os.path.exists(code_file_path):
+            targets.append((scene, code_file_path))
+
+    results = adjust_all_scenes([(path, scene['target']) for scene, path in targets], workers=workers)
+    for (scene, _), result in zip(targets, results):
+        for key in ('estimated', 'difference', 'added_wait', 'status', 'warnings'):
+            scene[key] = result[key]
+
+    status_counts = {}
+    for scene in scenes:
+        status_counts[scene['status']] = status_counts.get(scene['status'], 0) + 1
+    failed = status_counts.get('error', 0) + status_counts.get('missing_code', 0)
+    return {
+        'code_dir': code_dir,
+        'total': len(scenes),
+        'succeeded': len(scenes) - failed,
+        'failed': failed,
+        'status_counts': status_counts,
+        'elapsed': round(time.time() - start_time, 3),
+        'scenes': scenes,
+    }
+
+def write_sync_report(report, report_path):
+    """把对齐报告写成 JSON，供 Web 服务读取"""
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
 
 def main():
-    if len(sys.argv) != 2:
+    if len(sys.argv) < 2:
         print("❌ 错误: 请提供输出目录名")
-        print("📝 使用方法: python3 audio_video_sync.py <OUTPUT_DIR>")
+        print("📝 使用方法: python3 audio_video_sync.py <OUTPUT_DIR> [--workers N]")
         print("📝 示例: python3 audio_video_sync.py ChatDev_short_output")
         sys.exit(1)
     
-    output_dir = sys.argv[1]
+    parser = argparse.ArgumentParser(description="根据音频时长调整场景代码的等待时间")
+    parser.add_argument("output_dir", help="Paper2Video 下的输出目录名称")
+    parser.add_argument("--workers", type=int, default=1, help="并行处理的文件数 (默认: 1)")
+    args = parser.parse_args()
+    output_dir = args.output_dir
     
     # 构建路径
     speech_txt_path = f"Paper2Video/{output_dir}/final_results/Speech_Audio/Speech.txt"
     code_dir = f"Paper2Video/{output_dir}/final_results/Code"
+    report_path = f"Paper2Video/{output_dir}/final_results/{SYNC_REPORT_FILENAME}"
     
     print("🎬 开始音视频对齐处理")
     print(f"📄 Speech.txt路径: {speech_txt_path}")
@@ -147,36 +182,34 @@ def main():
     
     print(f"✅ 找到 {len(audio_info)} 个音频文件")
     
-    # 处理每个音频文件
-    success_count = 0
-    total_count = len(audio_info)
-    
-    for i, (audio_file, duration) in enumerate(audio_info, 1):
-        print(f"\n🎵 [{i}/{total_count}] 处理: {audio_file}")
-        print(f"   时长: {duration}s")
-        
-        # 生成对应的代码文件名
-        code_filename = get_corresponding_code_file(audio_file)
-        code_file_path = os.path.join(code_dir, code_filename)
-        
-        print(f"   对应代码文件: {code_filename}")
-        
-        # 检查代码文件是否存在
-        if not os.path.exists(code_file_path):
-            print(f"   ❌ 代码文件不存在: {code_file_path}")
-            continue
-        
-        # 运行wait_time_calculator.py
-        print(f"   🔧 调整代码文件以匹配音频时长...")
-        if run_wait_time_calculator(duration, code_file_path):
-            print(f"   ✅ 处理完成")
-            success_count += 1
-        else:
+    # 在本进程内一次性调整所有代码文件
+    print(f"🔧 调整代码文件以匹配音频时长 (并行数: {args.workers})...")
+    report = sync_scenes(audio_info, code_dir, workers=args.workers)
+    total_count = report['total']
+    
+    for i, scene in enumerate(report['scenes'], 1):
+        name = scene['code_file']
+        print(f"\n🎵 [{i}/{total_count}] {scene['audio_file']} ({scene['target']}s) → {name}")
+        for warning in scene['warnings']:
+            print(f"   ⚠️  {warning}")
+        if scene['status'] == 'missing_code':
+            print(f"   ❌ 代码文件不存在: {os.path.join(code_dir, name)}")
+        elif scene['status'] == 'error':
             print(f"   ❌ 处理失败")
+        elif scene['status'] == 'padded':
+            print(f"   ✅ 动画 {scene['estimated']:.2f}s / 音频 {scene['target']:.2f}s，补充等待 {scene['added_wait']:.2f}s")
+        elif scene['status'] == 'too_long':
+            print(f"   ✅ 动画 {scene['estimated']:.2f}s 已长于音频 {scene['target']:.2f}s，需要减少 {abs(scene['difference']):.2f}s")
+        else:
+            print(f"   ✅ 动画时长与音频完全匹配")
+    
+    write_sync_report(report, report_path)
+    success_count = report['succeeded']
     
     print("\n" + "=" * 50)
     print(f"🎊 音视频对齐处理完成！")
     print(f"📊 处理结果: {success_count}/{total_count} 个文件成功处理")
+    print(f"📄 对齐报告: {report_path}")
     
     if success_count == total_count:
         print("✨ 所有文件都已成功对齐！")
@@ -186,4 +219,4 @@ def main():
         print("❌ 所有文件处理都失败了，请检查配置和文件路径")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -4531,7 +4531,8 @@ async function submitAiEdit() {
     document.getElementById('aiEditLoading').classList.remove('hidden');
 
     try {
-        const response = await fetch('/editor/ai-edit', {
+        // 使用SSE流式接口，边生成边显示修改后的代码
+        const response = await fetch('/editor/ai-edit-stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -4543,20 +4544,54 @@ async function submitAiEdit() {
             })
         });
 
-        const data = await response.json();
-
-        if (data.success) {
-            aiEditState.modifiedCode = data.modified_code;
-            displayEditResult();
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.error);
         }
 
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        let partialCode = '';
+        let finished = false;
+
+        while (!finished) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE事件以空行分隔
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                if (!raw.startsWith('data: ')) continue;
+                const event = JSON.parse(raw.slice(6));
+                if (event.error) {
+                    throw new Error(event.error);
+                }
+                if (event.delta) {
+                    partialCode += event.delta;
+                    aiEditState.modifiedCode = partialCode;
+                    displayEditResult();
+                }
+                if (event.done) {
+                    aiEditState.modifiedCode = event.modified_code;
+                    displayEditResult();
+                    finished = true;
+                }
+            }
+        }
+
+        if (!finished) {
+            throw new Error('连接中断，未收到完整结果');
+        }
+
     } catch (error) {
         showError(`智能体编辑失败: ${error.message}`);
         console.error('AI edit error:', error);
         
         // 返回到输入界面
+        document.getElementById('aiEditResult').classList.add('hidden');
         document.getElementById('aiEditLoading').classList.add('hidden');
         document.querySelector('.ai-edit-request').classList.remove('hidden');
     }
@@ -109,6 +109,16 @@ fi
 # =========================================================================
 
 
+# 若已启动常驻TTS worker (services/cosyvoice/tts_worker.py)，设置 COSYVOICE_WORKER_URL
+# 后 run_cosyvoice_dynamic.py 会把合成任务交给worker，不再在本进程加载模型
+if [ -n "$COSYVOICE_WORKER_URL" ]; then
+    echo "🔗 TTS worker: $COSYVOICE_WORKER_URL"
+fi
+# 设置 COSYVOICE_CHUNK_WORKERS=N 时每页讲稿按句切分、N 线程并发合成
+if [ -n "$COSYVOICE_CHUNK_WORKERS" ]; then
+    echo "🧩 分句并发合成线程数: $COSYVOICE_CHUNK_WORKERS"
+fi
+
 echo "🔧 激活conda环境并执行语音合成..."
 
 # 重新检测conda路径（相对于CosyVoice目录）
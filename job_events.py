@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+处理任务事件的发布/订阅
+
+每个任务一个频道：任务字段变化（进度、状态、阶段、当前步骤）和新增日志发布到频道，
+/api/v1/events/<task_id> 的每个 SSE 连接订阅一次，收到事件后立即推送给客户端，
+不再需要轮询状态接口。
+
+订阅者的队列有上限；客户端读得太慢导致队列写满时丢弃最旧的事件，并补发一个
+resync 事件，提示客户端以新的状态快照为准。
+"""
+
+import queue
+import threading
+
+# 单个订阅者最多积压的事件数
+SUBSCRIBER_QUEUE_SIZE = 1000
+# 任务进入这些状态后发布 end 事件，SSE 连接随之结束
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class Subscription:
+    """一个订阅者的事件队列"""
+
+    def __init__(self, bus, process_id, maxsize=SUBSCRIBER_QUEUE_SIZE):
+        self.bus = bus
+        self.process_id = process_id
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, event):
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # 丢弃最旧的事件，并让客户端重新同步
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            try:
+                self._queue.put_nowait({'type': 'resync', 'data': {}})
+            except queue.Full:
+                pass
+
+    def get(self, timeout=None):
+        """取下一个事件，超时返回None"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JobEventBus:
+    """按任务ID分频道的事件总线；没有订阅者的频道发布事件几乎没有开销"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = {}     # process_id -> [Subscription]
+        self._seq = {}          # process_id -> 最近一个事件序号
+
+    def subscribe(self, process_id):
+        subscription = Subscription(self, process_id)
+        with self._lock:
+            self._channels.setdefault(process_id, []).append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.process_id)
+            if subscribers and subscription in subscribers:
+                subscribers.remove(subscription)
+                if not subscribers:
+                    del self._channels[subscription.process_id]
+                    self._seq.pop(subscription.process_id, None)
+
+    def publish(self, process_id, event_type, data):
+        with self._lock:
+            subscribers = self._channels.get(process_id)
+            if not subscribers:
+                return
+            seq = self._seq.get(process_id, 0) + 1
+            self._seq[process_id] = seq
+            subscribers = list(subscribers)
+        event = {'id': seq, 'type': event_type, 'data': data}
+        for subscription in subscribers:
+            subscription.put(event)
+
+    def subscriber_count(self, process_id=None):
+        with self._lock:
+            if process_id is not None:
+                return len(self._channels.get(process_id, []))
+            return sum(len(subscribers) for subscribers in self._channels.values())
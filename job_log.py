@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+处理任务日志
+
+job['log_messages'] 原本是无限增长的列表，流水线每输出一行就追加一条。JobLog 在内存中
+只保留最近 JOB_LOG_RING_SIZE 条（环形缓冲），完整日志按 JSON 行追加写入
+JOB_LOG_DIR/<process_id>.log，服务重启后从文件尾部恢复环形缓冲。
+
+JobLog 自带锁，追加日志不需要持有任务锁；tail(n) 只访问环形缓冲的尾部，与日志总量无关。
+通过 add_append_listener 注册的回调会在每条日志追加后被调用（用于推送实时日志）。
+"""
+
+import os
+import json
+import threading
+from collections import deque
+
+JOB_LOG_DIR = os.environ.get(
+    'JOB_LOG_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Paper2Video', 'job_logs')
+)
+# 内存中保留的日志条数
+JOB_LOG_RING_SIZE = int(os.environ.get('JOB_LOG_RING_SIZE', '500'))
+
+
+_append_listeners = []
+
+
+def add_append_listener(listener):
+    """注册日志追加回调 listener(process_id, entry)"""
+    _append_listeners.append(listener)
+
+
+def job_log_path(process_id):
+    return os.path.join(JOB_LOG_DIR, f"{process_id}.log")
+
+
+class JobLog:
+    """有界的任务日志：接口兼容原来的日志列表（append / len / 切片 / 迭代）"""
+
+    def __init__(self, path=None, entries=(), maxlen=JOB_LOG_RING_SIZE, process_id=None):
+        self.path = path
+        self.process_id = process_id
+        self._ring = deque(entries, maxlen=maxlen)
+        self._count = len(self._ring)
+        self._lock = threading.Lock()
+        self._file = None   # 追加写入的文件句柄，首次写入时打开并一直保持
+
+    @classmethod
+    def open(cls, process_id, maxlen=JOB_LOG_RING_SIZE):
+        """打开任务日志；日志文件已存在时从文件末尾读取并载入其最后 maxlen 条"""
+        path = job_log_path(process_id)
+        log = cls(path, maxlen=maxlen, process_id=process_id)
+        if os.path.exists(path):
+            for line in _read_tail_lines(path, maxlen):
+                entry = _parse_line(line)
+                if entry is not None:
+                    log._ring.append(entry)
+                    log._count += 1
+        return log
+
+    def append(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        with self._lock:
+            self._ring.append(entry)
+            self._count += 1
+            if self.path:
+                try:
+                    if self._file is None:
+                        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                        # 行缓冲：每条日志写完即刷新，read_all 和服务重启后都能读到
+                        self._file = open(self.path, 'a', encoding='utf-8', buffering=1)
+                    self._file.write(line)
+                except OSError as e:
+                    print(f"⚠️ 写入任务日志文件失败 ({self.path}): {e}")
+                    self._close_file()
+        if self.process_id is not None:
+            for listener in _append_listeners:
+                listener(self.process_id, entry)
+
+    def extend(self, entries):
+        for entry in entries:
+            self.append(entry)
+
+    def tail(self, n=30):
+        """返回最近 n 条日志"""
+        with self._lock:
+            size = len(self._ring)
+            n = min(n, size)
+            return [self._ring[i] for i in range(size - n, size)]
+
+    def read_all(self):
+        """读取完整日志（来自日志文件，没有文件时返回内存中的部分）"""
+        if self.path and os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return [entry for entry in map(_parse_line, f) if entry is not None]
+        return self.tail(len(self._ring))
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def close(self):
+        """关闭日志文件句柄（之后再追加时会重新打开）"""
+        with self._lock:
+            self._close_file()
+
+    def remove(self):
+        """删除日志文件并清空内存中的日志"""
+        with self._lock:
+            self._ring.clear()
+            self._count = 0
+            self._close_file()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def __len__(self):
+        # 日志总条数（含已移出环形缓冲的部分；从文件恢复的日志只计入载入的条数）
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        return iter(self.tail(len(self._ring)))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice) and index.step is None and index.stop is None \
+                and index.start is not None and index.start < 0:
+            return self.tail(-index.start)
+        return self.tail(len(self._ring))[index]
+
+    def __repr__(self):
+        return f"JobLog({self.path!r}, {self._count} 条)"
+
+
+def _read_tail_lines(path, n, block_size=64 * 1024):
+    """从文件末尾向前按块读取，返回最后 n 行，不读取更早的内容"""
+    if n <= 0:
+        return []
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        data = b''
+        while pos > 0 and data.count(b'\n') <= n:
+            step = min(block_size, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.splitlines()
+    if pos > 0:
+        # 第一行可能只读到一半
+        lines = lines[1:]
+    return [line.decode('utf-8', errors='replace') for line in lines[-n:]]
+
+
+def _parse_line(line):
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        return json.loads(line)
+    except json.JSONDecodeError:
+        return {'time': None, 'message': line}
@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+记录任务的性能数据
+
+每个任务一个 JobPerf，收集两类区间 (span)：
+- 流水线脚本上报的阶段（pipeline_progress 的 end 事件：mineru / sections / brain / coder / speecher /
+  tts / render / mux），含墙钟耗时和 CPU 时间；以及每次 LLM 调用的延迟和 token 数
+- 服务端记录的排队等待 (queue)、等待与占用调度名额 (slot_wait.<阶段> / slot.<阶段>)，
+  以及每个子进程的运行时间和输出目录写入量 (process.<脚本名>)
+
+结果写入 <输出目录>/perf.json。summarize() 汇总最近多个任务，给出各阶段耗时的分位数。
+"""
+
+import os
+import json
+import time
+import threading
+
+PERF_FILENAME = 'perf.json'
+# 汇总时计算的分位数
+PERCENTILES = (50, 90, 99)
+
+
+def directory_bytes(directory):
+    """目录下所有文件的总字节数"""
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def percentile(values, q):
+    """线性插值的分位数；values 为空时返回None"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+
+def _distribution(values):
+    values = [v for v in values if v is not None]
+    if not values:
+        return None
+    result = {f"p{q}": round(percentile(values, q), 3) for q in PERCENTILES}
+    result.update({'count': len(values), 'mean': round(sum(values) / len(values), 3), 'max': round(max(values), 3)})
+    return result
+
+
+class JobPerf:
+    """单个任务的性能记录，可被多个线程同时写入"""
+
+    def __init__(self, process_id, spans=(), llm_calls=(), created_at=None):
+        self.process_id = process_id
+        self.spans = list(spans)
+        self.llm_calls = list(llm_calls)
+        self.created_at = created_at or time.time()
+        self._open = {}     # 服务端尚未结束的区间: 名称 -> (开始时间, 附加字段)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, process_id, output_dir):
+        """载入输出目录中已有的 perf.json（如服务重启后继续处理的任务），没有时返回空记录"""
+        path = os.path.join(output_dir, PERF_FILENAME)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return cls(process_id)
+        return cls(process_id, data.get('spans', ()), data.get('llm_calls', ()), data.get('created_at'))
+
+    # ------------------------------------------------------------------ 记录
+
+    def add_span(self, name, start, end, source='pipeline', **fields):
+        span = {'name': name, 'source': source, 'start': round(start, 3), 'end': round(end, 3),
+                'duration': round(end - start, 3)}
+        span.update({key: value for key, value in fields.items() if value is not None})
+        with self._lock:
+            self.spans.append(span)
+
+    def open_span(self, name, **fields):
+        with self._lock:
+            self._open[name] = (time.time(), fields)
+
+    def close_spans(self, prefix='', **fields):
+        """结束名称以 prefix 开头的服务端区间"""
+        now = time.time()
+        with self._lock:
+            names = [name for name in self._open if name.startswith(prefix)]
+            closed = [(name, self._open.pop(name)) for name in names]
+        for name, (start, opened_fields) in closed:
+            self.add_span(name, start, now, source='service', **{**opened_fields, **fields})
+
+    def handle_event(self, event):
+        """处理流水线上报的事件：end 事件记为区间，llm 事件记为一次调用"""
+        kind = event.get('event')
+        if kind == 'llm':
+            call = {key: event.get(key) for key in
+                    ('ts', 'model', 'latency', 'prompt_tokens', 'completion_tokens', 'cached', 'ok')}
+            with self._lock:
+                self.llm_calls.append(call)
+        elif kind == 'end' and event.get('duration') is not None:
+            end = event.get('ts') or time.time()
+            self.add_span(event['stage'], end - event['duration'], end, scope=event.get('scope'),
+                          cpu_seconds=event.get('cpu_seconds'), ok=event.get('ok'), pid=event.get('pid'))
+
+    # ------------------------------------------------------------------ 输出
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+            llm_calls = list(self.llm_calls)
+        return {
+            'process_id': self.process_id,
+            'created_at': self.created_at,
+            'updated_at': time.time(),
+            'stages': stage_totals(spans),
+            'llm': llm_totals(llm_calls),
+            'spans': spans,
+            'llm_calls': llm_calls,
+        }
+
+    def write(self, output_dir):
+        """原子地写入 <output_dir>/perf.json"""
+        path = os.path.join(output_dir, PERF_FILENAME)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"⚠️ 写入性能记录失败 ({path}): {e}")
+        return path
+
+
+def stage_totals(spans):
+    """
+    按阶段汇总区间
+
+    wall_seconds 为该阶段从最早开始到最晚结束的时间（并行的多个章节只算一次），
+    busy_seconds 为各区间耗时之和。
+    """
+    stages = {}
+    for span in spans:
+        stage = stages.setdefault(span['name'], {'count': 0, 'start': span['start'], 'end': span['end'],
+                                                 'busy_seconds': 0.0, 'cpu_seconds': None, 'bytes_written': None})
+        stage['count'] += 1
+        stage['start'] = min(stage['start'], span['start'])
+        stage['end'] = max(stage['end'], span['end'])
+        stage['busy_seconds'] += span['duration']
+        for key in ('cpu_seconds', 'bytes_written'):
+            if span.get(key) is not None:
+                stage[key] = (stage[key] or 0) + span[key]
+    for stage in stages.values():
+        stage['wall_seconds'] = round(stage.pop('end') - stage.pop('start'), 3)
+        stage['busy_seconds'] = round(stage['busy_seconds'], 3)
+        if stage['cpu_seconds'] is not None:
+            stage['cpu_seconds'] = round(stage['cpu_seconds'], 3)
+    return stages
+
+
+def llm_totals(llm_calls):
+    """汇总 LLM 调用次数、延迟分布和 token 用量（命中缓存的调用不计入延迟）"""
+    requested = [call for call in llm_calls if not call.get('cached')]
+    return {
+        'calls': len(llm_calls),
+        'cached': len(llm_calls) - len(requested),
+        'failed': sum(1 for call in requested if call.get('ok') is False),
+        'latency': _distribution([call.get('latency') for call in requested]),
+        'prompt_tokens': sum(call.get('prompt_tokens') or 0 for call in requested),
+        'completion_tokens': sum(call.get('completion_tokens') or 0 for call in requested),
+    }
+
+
+def load_perf(output_dir):
+    """读取输出目录中的 perf.json，不存在或无法解析时返回None"""
+    try:
+        with open(os.path.join(output_dir, PERF_FILENAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def summarize(records):
+    """
+    汇总多个任务的 perf.json
+
+    Returns:
+        {'jobs': 任务数, 'stages': {阶段: {'wall_seconds': 分布, 'cpu_seconds': 分布, 'bytes_written': 分布}},
+         'llm': {'latency': 所有调用的延迟分布, 'calls_per_job' / 'prompt_tokens_per_job' / 'completion_tokens_per_job': 分布}}
+    """
+    per_stage = {}
+    latencies = []
+    calls_per_job, prompt_tokens, completion_tokens = [], [], []
+    for record in records:
+        for name, stage in record.get('stages', {}).items():
+            values = per_stage.setdefault(name, {'wall_seconds': [], 'cpu_seconds': [], 'bytes_written': []})
+            for key in values:
+                values[key].append(stage.get(key))
+        calls = record.get('llm_calls', [])
+        latencies.extend(call.get('latency') for call in calls if not call.get('cached'))
+        llm = record.get('llm', {})
+        calls_per_job.append(llm.get('calls'))
+        prompt_tokens.append(llm.get('prompt_tokens'))
+        completion_tokens.append(llm.get('completion_tokens'))
+    return {
+        'jobs': len(records),
+        'stages': {name: {key: _distribution(vals) for key, vals in values.items()}
+                   for name, values in sorted(per_stage.items())},
+        'llm': {
+            'latency': _distribution(latencies),
+            'calls_per_job': _distribution(calls_per_job),
+            'prompt_tokens_per_job': _distribution(prompt_tokens),
+            'completion_tokens_per_job': _distribution(completion_tokens),
+        },
+    }
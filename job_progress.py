@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+接收并汇总流水线进度事件
+
+流水线脚本通过 Paper2Video/pipeline_progress.py 把 JSON 进度事件发到一个 Unix 数据报套接字。
+services 为每个任务子进程创建一个 ProgressListener（套接字路径通过环境变量传给子进程），
+收到的事件交给 ProgressTracker，按阶段计划换算成总进度、剩余时间和各阶段耗时；
+性能相关的事件同时交给 job_perf.JobPerf。
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import tempfile
+import threading
+
+from Paper2Video.pipeline_progress import PROGRESS_SOCKET_ENV
+
+# 参与进度计算的事件；llm 等性能事件由 job_perf 处理
+PROGRESS_EVENTS = ('start', 'progress', 'end')
+
+
+class ProgressTracker:
+    """
+    把进度事件汇总为任务进度
+
+    plan 为 [(阶段, 起始进度, 结束进度)]：阶段内按已完成单元的比例在两个进度之间插值，
+    同一阶段的多个 scope（如并行处理的各章节）合并计算；不在计划中的阶段只记录耗时。
+    children 为 {阶段: (子阶段, ...)}：父阶段的单元（如章节）内部进度由子阶段的事件细分，
+    例如每个章节依次批量生成代码和演讲稿时，进度不必等整个章节完成才前进。
+    """
+
+    def __init__(self, plan, children=None):
+        self.plan = {stage: (low, high) for stage, low, high in plan}
+        self.plan_end = max(high for _, _, high in plan) if plan else 100
+        self.children = children or {}
+        self.stages = {}
+        self.first_event_at = None
+        self.first_progress = None
+        self.progress = None
+
+    def handle(self, event):
+        """处理一个事件，返回需要写入任务的字段；事件无效时返回None"""
+        stage = event.get('stage')
+        kind = event.get('event', 'progress')
+        if not stage or kind not in PROGRESS_EVENTS:
+            return None
+        ts = event.get('ts') or time.time()
+        if self.first_event_at is None:
+            self.first_event_at = ts
+        info = self.stages.setdefault(stage, {'start': ts, 'end': None, 'open': set(), 'units': {}, 'unit': None})
+        scope = event.get('scope') or ''
+
+        if kind == 'start':
+            info['open'].add(scope)
+            info['end'] = None
+        if event.get('total') is not None:
+            info['units'][scope] = (event.get('done') or 0, event['total'])
+        if event.get('unit'):
+            info['unit'] = event['unit']
+        if kind == 'end':
+            info['open'].discard(scope)
+            if scope in info['units']:
+                total = info['units'][scope][1]
+                info['units'][scope] = (total, total)
+            if not info['open']:
+                info['end'] = ts
+        return self._update(stage, info)
+
+    def _fraction(self, stage):
+        info = self.stages.get(stage)
+        if info is not None and info['end'] is not None:
+            return 1.0
+        done = sum(d for d, _ in info['units'].values()) if info else 0
+        total = sum(t for _, t in info['units'].values()) if info else 0
+        fraction = done / total if total else 0.0
+        kids = [self.stages[kid] for kid in self.children.get(stage, ()) if kid in self.stages]
+        if kids:
+            # 父阶段的单元数未知时，以子阶段出现过的 scope 数代替
+            expected = total or max(len(kid['units']) for kid in kids) or 1
+            kid_fractions = [
+                min(1.0, sum(d / t for d, t in kid['units'].values() if t) / expected) for kid in kids
+            ]
+            fraction = max(fraction, sum(kid_fractions) / len(self.children[stage]))
+        return fraction
+
+    def _started(self, stage):
+        return stage in self.stages or any(kid in self.stages for kid in self.children.get(stage, ()))
+
+    def _update(self, stage, info):
+        now = time.time()
+        done = sum(d for d, _ in info['units'].values())
+        total = sum(t for _, t in info['units'].values())
+        fraction = 1.0 if info['end'] is not None else (done / total if total else 0.0)
+        stage_elapsed = (info['end'] or now) - info['start']
+
+        update = {
+            'stage_durations': {name: round((s['end'] or now) - s['start'], 1) for name, s in self.stages.items()},
+            'progress_detail': {
+                'stage': stage, 'done': done, 'total': total, 'unit': info['unit'],
+                # 当前阶段按已完成单元的平均耗时外推
+                'stage_eta_seconds': round(stage_elapsed * (1 - fraction) / fraction, 1) if 0 < fraction < 1 else None,
+            },
+        }
+        candidates = [low + (high - low) * self._fraction(name)
+                      for name, (low, high) in self.plan.items() if self._started(name)]
+        if candidates:
+            if self.first_progress is None:
+                self.first_progress = min(low for name, (low, _) in self.plan.items() if self._started(name))
+            self.progress = max(self.progress or 0, max(candidates))
+            update['progress'] = round(self.progress, 1)
+            # 整个计划剩余的时间按目前的进度速度外推
+            elapsed = now - self.first_event_at
+            gained = self.progress - self.first_progress
+            if gained > 0 and elapsed > 0:
+                update['eta_seconds'] = round((self.plan_end - self.progress) * elapsed / gained, 1)
+        return update
+
+
+class ProgressListener:
+    """绑定一个临时 Unix 数据报套接字，在后台线程中接收进度事件并回调 on_event(event)"""
+
+    def __init__(self, on_event):
+        self.on_event = on_event
+        self.path = os.path.join(tempfile.gettempdir(), f"edupal-progress-{uuid.uuid4().hex[:16]}.sock")
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        self._sock.settimeout(0.5)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='progress-listener', daemon=True)
+        self._thread.start()
+
+    def env(self):
+        """传给子进程的环境变量"""
+        return {PROGRESS_SOCKET_ENV: self.path}
+
+    def _handle(self, data):
+        try:
+            event = json.loads(data.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            return
+        try:
+            self.on_event(event)
+        except Exception as e:
+            print(f"⚠️ 处理进度事件出错: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                data = self._sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._handle(data)
+
+    def close(self):
+        """停止接收，处理套接字中剩余的事件后删除套接字文件"""
+        self._stop.set()
+        self._thread.join()
+        self._sock.setblocking(False)
+        while True:
+            try:
+                data = self._sock.recv(65536)
+            except (BlockingIOError, OSError):
+                break
+            self._handle(data)
+        self._sock.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def close_when_done(self, process, on_closed=None):
+        """子进程退出后关闭监听，处理完剩余事件后调用 on_closed(process)；返回执行这些工作的线程"""
+        def wait_and_close():
+            process.wait()
+            self.close()
+            if on_closed is not None:
+                try:
+                    on_closed(process)
+                except Exception as e:
+                    print(f"⚠️ 子进程结束回调出错: {e}")
+        thread = threading.Thread(target=wait_and_close, name='progress-listener-close', daemon=True)
+        thread.start()
+        return thread
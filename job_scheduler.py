@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+处理任务调度器
+
+原来每个 /api/v1 请求都直接启动一个处理线程，同时提交十个任务就会有十条
+MinerU/LLM/Manim 流水线同时抢占 GPU 和 CPU。本模块负责准入控制：
+
+- 全局上限：同一时刻最多运行 JOB_MAX_RUNNING 个任务，其余任务排队
+- 阶段上限：任务进入 mineru / llm / tts / render 阶段前需要取得该阶段的名额，
+  每个任务同一时刻最多占用一个阶段名额，进入下一阶段时自动归还上一阶段的名额；
+  阶段切换由子进程的输出触发时子进程已经开始新阶段的工作，等待名额期间暂停其进程组（SIGSTOP/SIGCONT）
+- 排队顺序：优先级高的先运行；同一优先级下，已经开始的任务（继续处理）先于新任务，其余按提交顺序
+- 取消：排队中的任务直接出队；运行中的任务会终止其登记的子进程，并在阶段等待处抛出 JobCancelled
+
+调度器本身不读写 processing_jobs，状态变化通过 on_event(job_id, event, info) 回调通知业务层，
+回调总是在调度器锁之外调用。
+"""
+
+import os
+import heapq
+import signal
+import itertools
+import threading
+import traceback
+
+
+def _env_int(name, default):
+    try:
+        return max(1, int(os.environ.get(name, default)))
+    except ValueError:
+        return default
+
+
+# 同时运行的任务数上限
+JOB_MAX_RUNNING = _env_int('JOB_MAX_RUNNING', 2)
+# 各阶段同时占用的名额上限
+JOB_STAGE_SLOTS = {
+    'mineru': _env_int('JOB_SLOTS_MINERU', 1),
+    'llm': _env_int('JOB_SLOTS_LLM', 4),
+    'tts': _env_int('JOB_SLOTS_TTS', 1),
+    'render': _env_int('JOB_SLOTS_RENDER', 2),
+}
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+class JobScheduler:
+    """带全局上限和阶段上限的优先级队列"""
+
+    def __init__(self, max_running=JOB_MAX_RUNNING, stage_slots=None, on_event=None):
+        self.max_running = max_running
+        self.stage_slots = dict(stage_slots if stage_slots is not None else JOB_STAGE_SLOTS)
+        self.on_event = on_event
+        self._cond = threading.Condition()
+        self._seq = itertools.count()
+        self._queue = []            # 堆: (排序键, 任务)
+        self._running = {}          # job_id -> 运行信息
+        self._stage_usage = {stage: 0 for stage in self.stage_slots}
+        self._cancelled = set()
+
+    # ------------------------------------------------------------------ 提交与出队
+
+    def submit(self, job_id, target, args=(), priority=0, resume=False):
+        """
+        提交任务，返回排队位置（从1开始）
+
+        Args:
+            priority: 数值越大越先运行
+            resume: 已开始过的任务（如自动继续处理）在同一优先级内排在新任务前面
+        """
+        entry = {'job_id': job_id, 'target': target, 'args': tuple(args), 'priority': priority}
+        key = (-priority, 0 if resume else 1, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._queue, (key, entry))
+            position = self._position_locked(job_id)
+        self._emit(job_id, 'queued', {'position': position})
+        self._dispatch()
+        return position
+
+    def _dispatch(self):
+        """在有空闲名额时按队列顺序启动任务"""
+        started = []
+        with self._cond:
+            deferred = []
+            while self._queue and len(self._running) < self.max_running:
+                item = heapq.heappop(self._queue)
+                job_id = item[1]['job_id']
+                if job_id in self._running:
+                    # 同一任务的上一段仍在收尾，等它结束后再启动
+                    deferred.append(item)
+                    continue
+                thread = threading.Thread(target=self._run, args=(item[1],), name=f"job-{job_id[:8]}", daemon=True)
+                self._running[job_id] = {'thread': thread, 'stage': None, 'processes': []}
+                started.append((job_id, thread))
+            for item in deferred:
+                heapq.heappush(self._queue, item)
+        for job_id, thread in started:
+            self._emit(job_id, 'started', {})
+            thread.start()
+
+    def _run(self, entry):
+        job_id = entry['job_id']
+        try:
+            entry['target'](*entry['args'])
+        except JobCancelled:
+            pass
+        except Exception:
+            traceback.print_exc()
+        finally:
+            with self._cond:
+                info = self._running.pop(job_id, None)
+                if info is not None:
+                    self._leave_stage_locked(info)
+                cancelled = job_id in self._cancelled
+                self._cancelled.discard(job_id)
+                self._cond.notify_all()
+            self._emit(job_id, 'cancelled' if cancelled else 'finished', {})
+            self._dispatch()
+
+    # ------------------------------------------------------------------ 运行中的任务
+
+    def enter_stage(self, job_id, stage):
+        """
+        进入新阶段：归还当前阶段名额，等待并占用新阶段名额
+
+        不经调度器启动的调用（如编辑器中的预览渲染）不受限制，直接返回。
+        需要等待名额时暂停任务已登记且仍在运行的子进程，取得名额或任务被取消后恢复。
+        任务已被取消时抛出 JobCancelled。
+        """
+        with self._cond:
+            info = self._running.get(job_id)
+            if info is None or info['stage'] == stage:
+                return
+            self._leave_stage_locked(info)
+            must_wait = stage in self._stage_usage and self._stage_usage[stage] >= self.stage_slots[stage]
+        if must_wait:
+            self._emit(job_id, 'waiting_stage', {'stage': stage})
+        paused = None
+        try:
+            with self._cond:
+                if stage in self._stage_usage:
+                    while self._stage_usage[stage] >= self.stage_slots[stage] and job_id not in self._cancelled:
+                        if paused is None:
+                            paused = [p for p in info['processes'] if p.poll() is None]
+                            for process in paused:
+                                _pause(process)
+                        self._cond.wait()
+                if job_id in self._cancelled:
+                    raise JobCancelled(job_id)
+                if stage in self._stage_usage:
+                    self._stage_usage[stage] += 1
+                info['stage'] = stage
+        finally:
+            for process in paused or ():
+                _resume(process)
+        self._emit(job_id, 'stage', {'stage': stage, 'waited': must_wait})
+
+    def _leave_stage_locked(self, info):
+        if info['stage'] in self._stage_usage:
+            self._stage_usage[info['stage']] -= 1
+            self._cond.notify_all()
+        info['stage'] = None
+
+    def register_process(self, job_id, process):
+        """登记任务启动的子进程，取消时一并终止"""
+        with self._cond:
+            info = self._running.get(job_id)
+            if info is None:
+                return
+            info['processes'] = [p for p in info['processes'] if p.poll() is None] + [process]
+            cancelled = job_id in self._cancelled
+        if cancelled:
+            _terminate(process)
+
+    def cancel(self, job_id):
+        """
+        取消任务
+
+        Returns:
+            'queued': 已从队列移除；'running': 已终止运行中的子进程；None: 任务不在调度器中
+        """
+        with self._cond:
+            queued = [item for item in self._queue if item[1]['job_id'] == job_id]
+            if queued:
+                self._queue = [item for item in self._queue if item[1]['job_id'] != job_id]
+                heapq.heapify(self._queue)
+            info = self._running.get(job_id)
+            if info is not None:
+                self._cancelled.add(job_id)
+                processes = list(info['processes'])
+                self._cond.notify_all()
+        if info is not None:
+            for process in processes:
+                _terminate(process)
+            return 'running'
+        if queued:
+            self._emit(job_id, 'cancelled', {})
+            return 'queued'
+        return None
+
+    def is_cancelled(self, job_id):
+        with self._cond:
+            return job_id in self._cancelled
+
+    # ------------------------------------------------------------------ 查询
+
+    def _position_locked(self, job_id):
+        for position, (_, entry) in enumerate(sorted(self._queue, key=lambda item: item[0]), 1):
+            if entry['job_id'] == job_id:
+                return position
+        return None
+
+    def queue_position(self, job_id):
+        """返回任务的排队位置（从1开始），不在队列中时返回None"""
+        with self._cond:
+            return self._position_locked(job_id)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'max_running': self.max_running,
+                'running': {job_id: info['stage'] for job_id, info in self._running.items()},
+                'queued': [entry['job_id'] for _, entry in sorted(self._queue, key=lambda item: item[0])],
+                'stages': {stage: {'used': self._stage_usage[stage], 'slots': self.stage_slots[stage]}
+                           for stage in self.stage_slots},
+            }
+
+    def _emit(self, job_id, event, info):
+        if self.on_event is None:
+            return
+        try:
+            self.on_event(job_id, event, info)
+        except Exception:
+            traceback.print_exc()
+
+
+def _send_signal(process, sig):
+    """向子进程发送信号；以 start_new_session=True 启动的进程连同其进程组一起发送"""
+    if process.poll() is not None:
+        return
+    try:
+        if hasattr(os, 'killpg') and os.getpgid(process.pid) == process.pid:
+            os.killpg(process.pid, sig)
+        else:
+            process.send_signal(sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def _terminate(process):
+    """终止子进程；被暂停的子进程同时恢复运行，否则收不到 SIGTERM"""
+    _send_signal(process, signal.SIGTERM)
+    _resume(process)
+
+
+def _pause(process):
+    """暂停子进程（不支持 SIGSTOP 的平台上不做处理）"""
+    if hasattr(signal, 'SIGSTOP'):
+        _send_signal(process, signal.SIGSTOP)
+
+
+def _resume(process):
+    if hasattr(signal, 'SIGCONT'):
+        _send_signal(process, signal.SIGCONT)
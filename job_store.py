@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+处理任务的持久化存储
+
+services.processing_jobs 原本是纯内存字典，服务重启后所有任务状态和日志都会丢失。
+本模块提供一个行为与 dict 相同的 PersistentJobs：业务代码照旧通过
+processing_jobs[pid]['status'] = ... 修改任务，被修改的任务会被标记为脏数据，
+由后台线程定期（默认0.5秒）写入SQLite。
+
+- jobs 表保存任务字段（JSON），按 process_id 主键、stage/status 索引查询
+- 日志不进数据库：log_messages 是 job_log.JobLog，自行追加写入日志文件，载入任务时从文件恢复
+- 启动时只载入未结束的任务和最近 JOB_STORE_PRELOAD_RECENT 个任务，其余任务按 process_id 访问时再从数据库载入
+- 通过 JOB_STORE_ENABLED=0 关闭持久化，JOB_STORE_PATH 指定数据库位置
+"""
+
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+
+from job_log import JobLog, job_log_path
+
+JOB_STORE_ENABLED = os.environ.get('JOB_STORE_ENABLED', '1').lower() not in ('0', 'false', 'no')
+JOB_STORE_PATH = os.environ.get(
+    'JOB_STORE_PATH',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'Paper2Video', 'processing_jobs.sqlite3')
+)
+# 后台写入间隔（秒）
+JOB_STORE_FLUSH_INTERVAL = float(os.environ.get('JOB_STORE_FLUSH_INTERVAL', '0.5'))
+# 启动时除未结束的任务外，额外载入的最近任务数
+JOB_STORE_PRELOAD_RECENT = int(os.environ.get('JOB_STORE_PRELOAD_RECENT', '200'))
+# 已结束的任务状态，启动时不必全部载入
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class JobStore:
+    """SQLite 任务表，WAL 模式，可被多个线程共享"""
+
+    def __init__(self, path=JOB_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._conn_pid = None
+
+    def _connect(self):
+        # fork 出来的子进程不能复用父进程的连接
+        if self._conn is None or self._conn_pid != os.getpid():
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'process_id TEXT PRIMARY KEY, status TEXT, stage TEXT, data TEXT NOT NULL, '
+                'start_time TEXT, updated_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_stage ON jobs(stage)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)')
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def save(self, process_id, data):
+        """写入任务字段（data 不含 log_messages）"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                'INSERT OR REPLACE INTO jobs(process_id, status, stage, data, start_time, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (process_id, data.get('status'), data.get('stage'),
+                 json.dumps(data, ensure_ascii=False, default=str), data.get('start_time'), time.time())
+            )
+
+    def delete(self, process_id):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM jobs WHERE process_id = ?', (process_id,))
+
+    def load(self, process_id):
+        """读取单个任务字段，不存在时返回None"""
+        with self._lock:
+            conn = self._connect()
+            row = conn.execute('SELECT data FROM jobs WHERE process_id = ?', (process_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def load_startup(self, recent=JOB_STORE_PRELOAD_RECENT, terminal_statuses=TERMINAL_STATUSES):
+        """读取未结束的任务和最近 recent 个任务的字段，返回 {process_id: job}，按开始时间排序"""
+        placeholders = ', '.join('?' * len(terminal_statuses))
+        with self._lock:
+            conn = self._connect()
+            rows = conn.execute(
+                f'SELECT process_id, data FROM jobs WHERE status IS NULL OR status NOT IN ({placeholders}) '
+                'OR process_id IN (SELECT process_id FROM jobs ORDER BY start_time DESC LIMIT ?) '
+                'ORDER BY start_time',
+                (*terminal_statuses, recent)
+            ).fetchall()
+        return {process_id: json.loads(data) for process_id, data in rows}
+
+    def find(self, stage=None, status=None):
+        """按 stage / status 查询任务ID（走索引）"""
+        clauses, params = [], []
+        for column, value in (('stage', stage), ('status', status)):
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            clauses.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        sql = 'SELECT process_id FROM jobs'
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        with self._lock:
+            conn = self._connect()
+            return [row[0] for row in conn.execute(sql + ' ORDER BY start_time', params).fetchall()]
+
+
+class PersistentJob(dict):
+    """单个任务：任何字段修改都会通知所属的 PersistentJobs"""
+
+    def __init__(self, owner, process_id, data):
+        super().__init__()
+        self._owner = owner
+        self._process_id = process_id
+        for key, value in data.items():
+            super().__setitem__(key, self._wrap(key, value))
+
+    def _wrap(self, key, value):
+        if key == 'log_messages' and not isinstance(value, JobLog):
+            # 兼容直接赋值为列表的写法
+            log = JobLog(job_log_path(self._process_id), process_id=self._process_id)
+            log.extend(value or [])
+            return log
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, self._wrap(key, value))
+        if key != 'log_messages':
+            self._owner.changed(self._process_id, key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._owner.changed(self._process_id, key, None)
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *args):
+        value = super().pop(key, *args)
+        self._owner.changed(self._process_id, key, None)
+        return value
+
+
+class PersistentJobs(dict):
+    """
+    与 dict 接口一致的任务表，修改由后台线程异步写入 JobStore
+
+    lock_for(process_id) 返回业务代码修改该任务时持有的锁（services.job_lock），
+    写入前在该锁内取快照，保证写入的是一致的任务状态；任务被删除时调用 release_lock(process_id) 释放该锁。
+    store 为 None 时任务只保存在内存中；无论是否持久化，字段修改都会通知 add_listener 注册的回调。
+    启动时没有载入的任务在 in / get / [] 访问时从数据库载入；items() 等遍历只包含已在内存中的任务。
+    """
+
+    def __init__(self, store, lock_for, flush_interval=JOB_STORE_FLUSH_INTERVAL, release_lock=None):
+        super().__init__()
+        self.store = store
+        self._listeners = []
+        self.lock_for = lock_for
+        self.release_lock = release_lock
+        self.flush_interval = flush_interval
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._flusher = None
+        self._stop = threading.Event()
+        self._fetch_lock = threading.Lock()
+
+    # ---------- dict 接口 ----------
+    def __contains__(self, process_id):
+        return self._fetch(process_id) is not None
+
+    def __missing__(self, process_id):
+        job = self._fetch(process_id)
+        if job is None:
+            raise KeyError(process_id)
+        return job
+
+    def get(self, process_id, default=None):
+        job = self._fetch(process_id)
+        return default if job is None else job
+
+    def __setitem__(self, process_id, job):
+        if not isinstance(job, PersistentJob) or job._owner is not self:
+            job = PersistentJob(self, process_id, job)
+        super().__setitem__(process_id, job)
+        self.mark_dirty(process_id)
+
+    def __delitem__(self, process_id):
+        job = self._fetch(process_id)
+        super().__delitem__(process_id)
+        self._forget(process_id, job)
+
+    def pop(self, process_id, *args):
+        existed = process_id in self
+        value = super().pop(process_id, *args)
+        if existed:
+            self._forget(process_id, value)
+        return value
+
+    def _forget(self, process_id, job=None):
+        log = job.get('log_messages') if job is not None else None
+        if isinstance(log, JobLog):
+            log.close()
+        with self._dirty_lock:
+            self._dirty.discard(process_id)
+        if self.store is not None:
+            self.store.delete(process_id)
+        if os.path.exists(job_log_path(process_id)):
+            os.remove(job_log_path(process_id))
+        if self.release_lock is not None:
+            self.release_lock(process_id)
+
+    # ---------- 持久化 ----------
+    def load(self):
+        """从数据库载入未结束的任务和最近的任务（启动时调用一次）"""
+        for process_id, job in self.store.load_startup().items():
+            job['log_messages'] = JobLog.open(process_id)
+            super().__setitem__(process_id, PersistentJob(self, process_id, job))
+        return self
+
+    def _fetch(self, process_id):
+        """返回内存中的任务；不在内存中时从数据库载入，数据库中也没有时返回None"""
+        job = dict.get(self, process_id)
+        if job is not None or self.store is None:
+            return job
+        with self._fetch_lock:
+            job = dict.get(self, process_id)
+            if job is None:
+                try:
+                    data = self.store.load(process_id)
+                except sqlite3.Error as e:
+                    print(f"读取任务存储失败 ({process_id}): {e}")
+                    return None
+                if data is not None:
+                    data['log_messages'] = JobLog.open(process_id)
+                    job = PersistentJob(self, process_id, data)
+                    super().__setitem__(process_id, job)
+        return job
+
+    def add_listener(self, listener):
+        """注册字段修改回调 listener(process_id, key, value)"""
+        self._listeners.append(listener)
+
+    def changed(self, process_id, key, value):
+        self.mark_dirty(process_id)
+        for listener in self._listeners:
+            listener(process_id, key, value)
+
+    def mark_dirty(self, process_id):
+        if self.store is None:
+            return
+        with self._dirty_lock:
+            self._dirty.add(process_id)
+
+    def flush(self):
+        """把脏任务写入数据库"""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        if not dirty:
+            return 0
+
+        snapshots = []
+        for process_id in dirty:
+            job = dict.get(self, process_id)
+            if job is None:
+                continue
+            # 在任务锁内序列化，避免写入过程中字段被并发修改；各任务分别加锁，互不阻塞
+            with self.lock_for(process_id):
+                data = {k: v for k, v in job.items() if k != 'log_messages'}
+                snapshots.append((process_id, json.loads(json.dumps(data, default=str))))
+
+        for process_id, data in snapshots:
+            try:
+                self.store.save(process_id, data)
+            except sqlite3.Error as e:
+                print(f"写入任务存储失败 ({process_id}): {e}")
+                self.mark_dirty(process_id)
+        return len(snapshots)
+
+    def find(self, stage=None, status=None):
+        """按 stage / status 查询任务ID"""
+        if self.store is None:
+            return [process_id for process_id, job in self.items()
+                    if (stage is None or job.get('stage') in ([stage] if isinstance(stage, str) else stage))
+                    and (status is None or job.get('status') in ([status] if isinstance(status, str) else status))]
+        self.flush()
+        return self.store.find(stage=stage, status=status)
+
+    def start(self):
+        """启动后台写入线程，并在进程退出时写入剩余修改"""
+        if self._flusher is None and self.store is not None:
+            self._flusher = threading.Thread(target=self._flush_loop, name='job-store-flusher', daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+        return self
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"任务存储后台写入出错: {e}")
+
+    def close(self):
+        self._stop.set()
+        self.flush()
+
+
+def open_job_table(lock_for, release_lock=None):
+    """
+    创建 services 使用的任务表
+
+    持久化开启时返回已载入历史任务、已启动后台写入的 PersistentJobs，否则返回只在内存中的 PersistentJobs。
+    """
+    if not JOB_STORE_ENABLED:
+        return PersistentJobs(None, lock_for, release_lock=release_lock)
+    try:
+        return PersistentJobs(JobStore(), lock_for, release_lock=release_lock).load().start()
+    except sqlite3.Error as e:
+        print(f"⚠️ 任务存储不可用，使用内存任务表: {e}")
+        return PersistentJobs(None, lock_for, release_lock=release_lock)
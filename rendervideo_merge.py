@@ -8,8 +8,24 @@ import subprocess
 import shutil
 import ast
 import glob
+import json
+import time
+import hashlib
 import tempfile
+import threading
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from Paper2Video import pipeline_progress
+
+# 并行渲染时保证输出不交错
+print_lock = threading.Lock()
+
+# Manim 渲染质量，同时作为渲染缓存键的一部分
+RENDER_QUALITY = "l"
+# 渲染缓存：清单文件记录每个场景的哈希，缓存目录保存对应的成片
+RENDER_CACHE_MANIFEST = "render_cache.json"
+RENDER_CACHE_DIR = ".render_cache"
 
 
 def find_manim_files(code_dir):
@@ -33,14 +49,26 @@ def extract_class_name(py_file):
 
 def render_file(py_file, class_name, media_dir):
     """调用 Manim 将指定 Scene 渲染到 media_dir 下。"""
+    success, _, _ = render_scene(py_file, class_name, media_dir)
+    return success
+
+
+def render_scene(py_file, class_name, media_dir):
+    """
+    调用 Manim 渲染一个 Scene，返回 (是否成功, 耗时秒数, 错误信息)
+
+    并行渲染时每个场景使用独立的 media_dir，避免 Tex/partial_movie_files 等缓存互相覆盖。
+    """
     cmd = [
         "manim",
         py_file,
         class_name,
         "--media_dir", media_dir,
-        "-q", "l"     # 使用低质量加快渲染，按需调整质量参数
+        "-q", RENDER_QUALITY     # 使用低质量加快渲染，按需调整质量参数
     ]
-    print(f"🔹 Rendering {os.path.basename(py_file)} → class {class_name}")
+    with print_lock:
+        print(f"🔹 Rendering {os.path.basename(py_file)} → class {class_name}")
+    start_time = time.time()
     try:
         # 设置工作目录为 .py 文件所在目录
         # 修复图片路径无法读取的bug
@@ -49,10 +77,168 @@ def render_file(py_file, class_name, media_dir):
         
         # subprocess.run(cmd, check=True, capture_output=True, text=True)
 
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ 渲染失败: {os.path.basename(py_file)} - {e}")
-        return False
+        return True, time.time() - start_time, None
+    except (subprocess.CalledProcessError, FileNotFoundError) as e:
+        # 只保留 stderr 末尾，便于定位 Manim 报错
+        stderr_tail = (getattr(e, "stderr", None) or "").strip().splitlines()[-5:]
+        error = "\n".join([str(e)] + stderr_tail)
+        with print_lock:
+            print(f"❌ 渲染失败: {os.path.basename(py_file)} - {e}")
+        return False, time.time() - start_time, error
+
+
+def scene_media_dir(media_dir, py_file):
+    """每个场景独立的媒体目录：<media_dir>/<文件名>"""
+    return os.path.join(media_dir, os.path.splitext(os.path.basename(py_file))[0])
+
+
+def render_scenes(py_files, media_dir, jobs=1):
+    """
+    并行渲染所有场景文件
+
+    Manim 本身在子进程中运行，线程池只负责调度，jobs 即同时运行的 manim 进程数。
+
+    Returns:
+        按 py_files 顺序排列的结果列表，每项为
+        {'file', 'class_name', 'success', 'duration', 'error'}
+    """
+    total_count = len(py_files)
+    results = [None] * total_count
+    tasks = []
+    for i, py_file in enumerate(py_files):
+        cls = extract_class_name(py_file)
+        if not cls:
+            print(f"⚠️ [{i + 1}/{total_count}] 跳过 {os.path.basename(py_file)}: 未找到类定义")
+            results[i] = {'file': py_file, 'class_name': None, 'success': False, 'duration': 0.0, 'error': '未找到类定义'}
+            continue
+        tasks.append((i, py_file, cls))
+
+    completed = 0
+    pipeline_progress.start("render", total=len(tasks), unit="scene")
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = {
+            executor.submit(render_scene, py_file, cls, scene_media_dir(media_dir, py_file)): (i, py_file, cls)
+            for i, py_file, cls in tasks
+        }
+        for future in as_completed(futures):
+            i, py_file, cls = futures[future]
+            success, duration, error = future.result()
+            results[i] = {'file': py_file, 'class_name': cls, 'success': success, 'duration': duration, 'error': error}
+            completed += 1
+            pipeline_progress.advance("render", completed, len(tasks), unit="scene")
+            with print_lock:
+                status = "✅" if success else "❌"
+                print(f"🎬 [{completed}/{len(tasks)}] {status} {os.path.basename(py_file)} → {cls} ({duration:.1f}s)")
+    pipeline_progress.end("render")
+
+    return results
+
+
+def video_group_name(py_file):
+    """场景文件对应的视频名：文件名去掉 _code 后缀，与 collect_and_merge_videos 的分组一致"""
+    name = os.path.splitext(os.path.basename(py_file))[0]
+    return name[:-5] if name.endswith("_code") else name
+
+
+def find_referenced_assets(py_file):
+    """
+    找出场景源码中引用的本地文件（图片、背景等）
+
+    Manim 以场景文件所在目录为工作目录运行，因此字符串常量按该目录解析，能对应到已存在文件的即视为资源。
+    """
+    py_dir = os.path.dirname(os.path.abspath(py_file))
+    with open(py_file, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=py_file)
+    assets = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and 0 < len(node.value) < 512 \
+                and "\n" not in node.value:
+            path = os.path.join(py_dir, node.value)
+            if os.path.isfile(path):
+                assets.add(os.path.normpath(path))
+    return sorted(assets)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scene_cache_key(py_file, quality=RENDER_QUALITY):
+    """场景源码、引用资源内容和渲染质量共同决定的缓存键"""
+    digest = hashlib.sha256()
+    digest.update(f"quality={quality}\n".encode("utf-8"))
+    digest.update(file_sha256(py_file).encode("utf-8"))
+    py_dir = os.path.dirname(os.path.abspath(py_file))
+    for asset in find_referenced_assets(py_file):
+        digest.update(f"\n{os.path.relpath(asset, py_dir)}={file_sha256(asset)}".encode("utf-8"))
+    return digest.hexdigest()
+
+
+def load_render_manifest(base_dir):
+    """读取 final_results/render_cache.json，不存在或损坏时返回空清单"""
+    manifest_path = os.path.join(base_dir, RENDER_CACHE_MANIFEST)
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get('scenes'), dict):
+            return manifest
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {'version': 1, 'scenes': {}}
+
+
+def save_render_manifest(base_dir, manifest):
+    manifest_path = os.path.join(base_dir, RENDER_CACHE_MANIFEST)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def split_cached_scenes(py_files, base_dir, manifest):
+    """
+    按缓存清单把场景分为可复用和需要渲染两类
+
+    Returns:
+        (需要渲染的文件列表, {文件: 缓存键}, 可复用的 [(文件, 缓存视频路径)] 列表)
+    """
+    cache_dir = os.path.join(base_dir, RENDER_CACHE_DIR)
+    to_render, keys, reusable = [], {}, []
+    for py_file in py_files:
+        keys[py_file] = scene_cache_key(py_file)
+        entry = manifest['scenes'].get(os.path.basename(py_file))
+        cached_video = os.path.join(cache_dir, f"{video_group_name(py_file)}.mp4")
+        if entry and entry.get('hash') == keys[py_file] and os.path.isfile(cached_video):
+            reusable.append((py_file, cached_video))
+        else:
+            to_render.append(py_file)
+    return to_render, keys, reusable
+
+
+def update_render_cache(base_dir, video_dir, manifest, keys, results):
+    """把本次渲染成功的场景成片存入缓存目录并更新清单"""
+    cache_dir = os.path.join(base_dir, RENDER_CACHE_DIR)
+    os.makedirs(cache_dir, exist_ok=True)
+    for r in results:
+        py_file = r['file']
+        name = os.path.basename(py_file)
+        video_path = os.path.join(video_dir, f"{video_group_name(py_file)}.mp4")
+        if not r['success'] or not os.path.isfile(video_path):
+            manifest['scenes'].pop(name, None)
+            continue
+        shutil.copy2(video_path, os.path.join(cache_dir, os.path.basename(video_path)))
+        manifest['scenes'][name] = {
+            'hash': keys[py_file],
+            'class_name': r['class_name'],
+            'video': os.path.basename(video_path),
+            'render_seconds': round(r['duration'], 2),
+            'rendered_at': time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    save_render_manifest(base_dir, manifest)
 
 
 def merge_videos(video_list, output_path):
@@ -106,7 +292,7 @@ def collect_and_merge_videos(media_dir, video_dir):
     
     # 递归搜索所有mp4文件
     video_pattern = os.path.join(media_dir, "**", "*.mp4")
-    video_files = glob.glob(video_pattern, recursive=True)
+    video_files = sorted(glob.glob(video_pattern, recursive=True))
     
     if not video_files:
         print("❌ 未找到任何视频文件")
@@ -179,6 +365,17 @@ def main():
         "output_dir",
         help="指定子目录名称：脚本会去 Paper2Video/<output_dir>/final_results/Code 查找 .py 并输出到 Video。"
     )
+    parser.add_argument(
+        "--jobs", "-j",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="同时渲染的场景数 (默认: CPU核数)"
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="忽略渲染缓存，重新渲染所有场景"
+    )
     args = parser.parse_args()
 
     # 检查ffmpeg
@@ -204,29 +401,42 @@ def main():
         print("⚠️ 未找到任何 .py 文件，退出。")
         sys.exit(1)
 
-    print(f"📦 找到 {len(py_files)} 个Python文件")
-    
-    success_count = 0
-    total_count = len(py_files)
+    print(f"📦 找到 {len(py_files)} 个Python文件，并行渲染数: {args.jobs}")
 
-    for i, py_file in enumerate(py_files, 1):
-        cls = extract_class_name(py_file)
-        if not cls:
-            print(f"⚠️ [{i}/{total_count}] 跳过 {os.path.basename(py_file)}: 未找到类定义")
-            continue
-        
-        print(f"🎬 [{i}/{total_count}] 渲染 {os.path.basename(py_file)} → {cls}")
-        if render_file(py_file, cls, media_dir):
-            success_count += 1
-        else:
-            print(f"❌ 渲染失败: {os.path.basename(py_file)}")
+    # 对比渲染缓存，只渲染源码、引用资源或渲染质量发生变化的场景
+    manifest = load_render_manifest(base_dir)
+    if args.no_cache:
+        to_render, keys, reusable = list(py_files), {f: scene_cache_key(f) for f in py_files}, []
+    else:
+        to_render, keys, reusable = split_cached_scenes(py_files, base_dir, manifest)
+    if reusable:
+        os.makedirs(video_dir, exist_ok=True)
+        for py_file, cached_video in reusable:
+            shutil.copy2(cached_video, os.path.join(video_dir, os.path.basename(cached_video)))
+        print(f"♻️ 复用渲染缓存 {len(reusable)} 个场景，需要渲染 {len(to_render)} 个")
+
+    total_count = len(to_render)
+    start_time = time.time()
+    results = render_scenes(to_render, media_dir, jobs=args.jobs)
+    success_count = sum(1 for r in results if r['success'])
 
-    print(f"\n📊 渲染完成: {success_count}/{total_count} 成功")
+    print(f"\n📊 渲染完成: {success_count}/{total_count} 成功，总耗时 {time.time() - start_time:.1f}s")
+    for r in results:
+        status = "✅" if r['success'] else "❌"
+        print(f"   {status} {os.path.basename(r['file'])}: {r['duration']:.1f}s")
+    failures = [r for r in results if not r['success']]
+    if failures:
+        print(f"\n⚠️ 失败的场景 ({len(failures)} 个):")
+        for r in failures:
+            print(f"   - {os.path.basename(r['file'])}: {r['error']}")
 
     if success_count > 0:
         print(f"\n📁 收集并合并视频到 `{video_dir}`...")
         collect_and_merge_videos(media_dir, video_dir)
+        update_render_cache(base_dir, video_dir, manifest, keys, results)
         print("🎉 所有视频已合并并保存到Video目录！")
+    elif reusable and not failures:
+        print("🎉 所有场景均命中渲染缓存，视频已保存到Video目录！")
     else:
         print("❌ 没有成功渲染的视频")
 
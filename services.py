@@ -8,7 +8,13 @@ import concurrent.futures
 import threading
 from bs4 import BeautifulSoup
 from exa_py import Exa
-from api_call import process_text
+from api_call import process_text, stream_text
+import job_store
+from job_log import JobLog, add_append_listener
+from job_events import JobEventBus, TERMINAL_STATUSES
+from job_progress import ProgressListener, ProgressTracker
+from job_perf import JobPerf, directory_bytes, load_perf, summarize as summarize_perf
+from job_scheduler import JobScheduler
 import zipfile
 import glob
 import subprocess
@@ -1133,16 +1139,357 @@ from datetime import datetime
 from werkzeug.utils import secure_filename
 import time 
 # 处理状态跟踪
-processing_jobs = {}
-processing_results = {}
+# processing_jobs 默认持久化到 SQLite（见 job_store.py），服务重启后任务状态和日志仍可查询
+# processing_lock 只保护任务的增删和遍历；读写单个任务的字段时持有该任务自己的锁（job_lock），
+# 日志（JobLog）自带锁，追加日志不需要任何外部锁
 processing_lock = threading.Lock()
+_job_locks = {}
+
+
+def job_lock(process_id):
+    """返回单个任务的锁，不同任务之间互不阻塞"""
+    lock = _job_locks.get(process_id)
+    if lock is None:
+        if process_id not in processing_jobs:
+            # 不存在的任务（如用任意ID查询状态）不登记锁，避免 _job_locks 无限增长；
+            # 调用方持锁后检查任务是否存在，得到的是一把临时锁
+            return threading.RLock()
+        # setdefault 是原子操作，并发首次访问时也只会创建出同一把锁
+        lock = _job_locks.setdefault(process_id, threading.RLock())
+    return lock
+
+
+def _release_job_lock(process_id):
+    """任务被删除后释放它的锁"""
+    _job_locks.pop(process_id, None)
+
+
+processing_jobs = job_store.open_job_table(job_lock, release_lock=_release_job_lock)
+
+# 任务事件频道：字段修改和新增日志推送给 /api/v1/events 的订阅者
+job_events = JobEventBus()
+# 推送给订阅者的任务字段
+EVENT_FIELDS = ('status', 'progress', 'current_step', 'stage', 'error', 'output_dir', 'final_video_path', 'final_output_path',
+                'eta_seconds', 'stage_durations', 'progress_detail')
+
+
+def _publish_job_change(process_id, key, value):
+    if key not in EVENT_FIELDS:
+        return
+    job_events.publish(process_id, 'update', {key: value})
+    if key == 'status' and value in TERMINAL_STATUSES:
+        job_events.publish(process_id, 'end', {'status': value})
+
+
+def _publish_job_log(process_id, entry):
+    job_events.publish(process_id, 'log', entry)
+
+
+processing_jobs.add_listener(_publish_job_change)
+add_append_listener(_publish_job_log)
+processing_results = {}
+
+# 这些状态表示任务在排队或处理线程正在运行；服务重启后队列和线程都已不存在，需要根据输出目录对账
+INTERRUPTED_STATUSES = ('queued', 'starting', 'running', 'rendering_preview')
+
+
+def _job_output_dir(job):
+    """任务的输出目录；流水线尚未写回 output_dir 时按 base_name 推断"""
+    return job.get('output_dir') or (f"Paper2Video/{job['base_name']}_output" if job.get('base_name') else None)
+
+
+def _expected_final_output(job):
+    """根据输出格式推断最终产物路径"""
+    output_dir = _job_output_dir(job)
+    if not output_dir:
+        return None
+    if job.get('output_format', 'video') == 'ppt':
+        return os.path.join(output_dir, 'final_results', 'full_presentation.pptx')
+    return os.path.join(output_dir, 'final_results', 'Video_with_voice', 'Full.mp4')
+
+
+def recover_interrupted_jobs():
+    """
+    服务启动时对账：把重启前仍在运行的任务按输出目录的实际情况改为终态
+
+    - 最终产物已存在：标记为 completed
+    - Code 目录已生成场景代码：回到 waiting_for_edit，用户可以在编辑器中检查后重新继续
+    - 其他情况：标记为 failed
+    """
+    if processing_jobs.store is None:
+        return []
+    recovered = []
+    for process_id in processing_jobs.find(status=INTERRUPTED_STATUSES):
+        with job_lock(process_id):
+            job = processing_jobs.get(process_id)
+            if job is None:
+                continue
+            now = datetime.now().isoformat()
+            final_output = job.get('final_output_path') or _expected_final_output(job)
+            output_dir = _job_output_dir(job)
+            code_dir = os.path.join(output_dir, 'final_results', 'Code') if output_dir else None
+
+            if final_output and os.path.exists(final_output):
+                job.update({'status': 'completed', 'stage': 'completed', 'progress': 100,
+                            'current_step': '✅ 处理完成', 'final_output_path': final_output})
+                if final_output.endswith('.mp4'):
+                    job['final_video_path'] = final_output
+                message = '♻️ 服务重启后对账：最终产物已存在，任务标记为完成'
+            elif code_dir and os.path.isdir(code_dir) and glob.glob(os.path.join(code_dir, '*_code.py')):
+                job.update({'status': 'waiting_for_edit', 'stage': 'waiting_for_edit',
+                            'current_step': '⏸️ 服务重启，等待继续处理', 'output_dir': output_dir})
+                message = '♻️ 服务重启后对账：已有场景代码，可在编辑器检查后继续处理'
+            else:
+                job.update({'status': 'failed', 'current_step': '❌ 服务重启，任务中断',
+                            'error': '服务重启时任务仍在运行，且未找到可恢复的中间结果'})
+                message = '♻️ 服务重启后对账：任务中断且无可恢复的中间结果'
+            job['log_messages'].append({'time': now, 'message': message})
+            job['last_update'] = now
+            recovered.append((process_id, job['status']))
+    for process_id, status in recovered:
+        print(f"♻️ 任务 {process_id} 已对账为: {status}")
+    return recovered
+
+
+recover_interrupted_jobs()
+
+
+# =================================================================
+# ========================= 任务调度 =========================
+# =================================================================
+
+# 流水线脚本输出中的阶段标记 -> 调度器阶段；子进程启动时先进入首个阶段，输出中出现标记时切换
+STAGE_MARKERS = (
+    ('Step 2️⃣', 'llm'),
+    ('执行Step 6', 'tts'),
+    ('执行Step 7', 'render'),
+)
+
+
+# 各任务的性能记录，写入输出目录的 perf.json（见 job_perf.py）
+job_perfs = {}
+# 各任务子进程的进度监听关闭线程；任务结束时先等它们处理完剩余事件，再写 perf.json
+job_listeners = {}
+PROGRESS_CLOSE_TIMEOUT = 30
+
+
+def _job_perf(process_id):
+    perf = job_perfs.get(process_id)
+    if perf is None:
+        with job_lock(process_id):
+            job = processing_jobs.get(process_id)
+            output_dir = _job_output_dir(job) if job else None
+        # 继续处理的任务沿用已有的记录
+        loaded = JobPerf.load(process_id, output_dir) if output_dir else JobPerf(process_id)
+        perf = job_perfs.setdefault(process_id, loaded)
+    return perf
+
+
+def _write_job_perf(process_id, perf):
+    with job_lock(process_id):
+        job = processing_jobs.get(process_id)
+        output_dir = _job_output_dir(job) if job else None
+    if output_dir and os.path.isdir(output_dir):
+        perf.write(output_dir)
+
+
+def _record_scheduler_span(process_id, event, info):
+    """记录排队和调度名额的等待/占用时间"""
+    perf = _job_perf(process_id)
+    if event == 'queued':
+        perf.open_span('queue')
+    elif event == 'started':
+        perf.close_spans('queue')
+    elif event == 'waiting_stage':
+        perf.close_spans('slot')
+        perf.open_span(f"slot_wait.{info['stage']}")
+    elif event == 'stage':
+        perf.close_spans('slot')
+        perf.open_span(f"slot.{info['stage']}")
+    elif event in ('cancelled', 'finished'):
+        for closer in job_listeners.pop(process_id, []):
+            closer.join(PROGRESS_CLOSE_TIMEOUT)
+        perf.close_spans()
+        _write_job_perf(process_id, perf)
+        # 本段处理已结束；继续处理时从 perf.json 重新载入
+        job_perfs.pop(process_id, None)
+
+
+def _on_scheduler_event(process_id, event, info):
+    """把调度器的状态变化写回 processing_jobs"""
+    _record_scheduler_span(process_id, event, info)
+    with job_lock(process_id):
+        job = processing_jobs.get(process_id)
+        if job is None:
+            return
+        message = None
+        if event == 'queued':
+            job['status'] = 'queued'
+            job['current_step'] = '⏳ 排队等待执行'
+            message = f"⏳ 任务已进入队列，当前排在第 {info['position']} 位"
+        elif event == 'started':
+            if job['status'] == 'queued':
+                job['status'] = 'running'
+            message = '▶️ 任务开始执行'
+        elif event == 'waiting_stage':
+            message = f"⏳ 等待 {info['stage']} 资源空闲..."
+        elif event == 'stage':
+            job['resource_stage'] = info['stage']
+        elif event == 'cancelled':
+            job.update({'status': 'cancelled', 'current_step': '🛑 任务已取消', 'error': '任务已被取消'})
+            message = '🛑 任务已取消'
+        elif event == 'finished':
+            job['resource_stage'] = None
+        if message:
+            job['log_messages'].append({'time': datetime.now().isoformat(), 'message': message})
+        job['last_update'] = datetime.now().isoformat()
+        if event in ('cancelled', 'finished'):
+            # 本段处理已结束，释放日志文件句柄（之后再追加日志时重新打开）
+            job['log_messages'].close()
+
+    if event in ('started', 'cancelled'):
+        # 队列缩短，推送其余排队任务的新位置
+        for position, queued_id in enumerate(job_scheduler.stats()['queued'], 1):
+            job_events.publish(queued_id, 'update', {'queue_position': position})
+
+
+job_scheduler = JobScheduler(on_event=_on_scheduler_event)
+
+
+def _submit_job(process_id, target, args, resume=False):
+    """把处理函数交给调度器，按任务优先级排队"""
+    with job_lock(process_id):
+        priority = processing_jobs[process_id].get('priority', 0)
+    return job_scheduler.submit(process_id, target, args, priority=priority, resume=resume)
+
+
+# 流水线进度事件的阶段计划: (阶段, 起始进度, 结束进度)，阶段内按完成单元数插值（见 job_progress.py）
+INITIAL_PROGRESS_PLAN = (('mineru', 10, 25), ('sections', 25, 28), ('agents', 28, 65))
+# 各章节的代码和演讲稿生成进度细分 agents 阶段
+PROGRESS_CHILDREN = {'agents': ('coder', 'speecher')}
+PREVIEW_PROGRESS_PLAN = (('render', 82, 88),)
+CONTINUE_PROGRESS_PLAN = (('render', 97, 99),)
+FINAL_PROGRESS_PLAN = (('render', 70, 90),)
+
+
+def _apply_progress(process_id, update):
+    """把进度事件汇总结果写入任务；进度只增不减"""
+    if not update:
+        return
+    with job_lock(process_id):
+        job = processing_jobs.get(process_id)
+        if job is None:
+            return
+        for key, value in update.items():
+            if key == 'progress':
+                if value > (job.get('progress') or 0):
+                    job['progress'] = value
+            else:
+                job[key] = value
+
+
+def _start_job_process(process_id, stage, cmd, progress_plan=None, **popen_kwargs):
+    """
+    进入调度阶段后启动子进程，并登记到调度器以便取消；stage 为 None 时沿用当前阶段
+
+    子进程通过进度套接字上报的事件记入任务的性能记录；给出 progress_plan 时还会按计划换算为任务进度。
+    子进程结束后记录其运行时间和输出目录的写入量，并更新 perf.json。
+    """
+    if stage:
+        job_scheduler.enter_stage(process_id, stage)
+    tracker = ProgressTracker(progress_plan, children=PROGRESS_CHILDREN) if progress_plan else None
+
+    # 每次都取当前的记录：本段处理结束后记录会被移除，继续处理时从 perf.json 重新载入
+    def on_event(event):
+        _job_perf(process_id).handle_event(event)
+        if tracker is not None:
+            _apply_progress(process_id, tracker.handle(event))
+
+    with job_lock(process_id):
+        job = processing_jobs.get(process_id)
+        output_dir = _job_output_dir(job) if job else None
+    bytes_before = directory_bytes(output_dir) if output_dir else 0
+    script = os.path.basename(cmd[1] if len(cmd) > 1 else cmd[0])
+    started_at = time.time()
+
+    def on_closed(process):
+        bytes_written = directory_bytes(output_dir) - bytes_before if output_dir else None
+        perf = _job_perf(process_id)
+        perf.add_span(f"process.{script}", started_at, time.time(), source='service',
+                      returncode=process.returncode, bytes_written=bytes_written)
+        _write_job_perf(process_id, perf)
+
+    listener = ProgressListener(on_event)
+    env = dict(popen_kwargs.pop('env', None) or os.environ)
+    env.update(listener.env())
+    popen_kwargs['env'] = env
+    try:
+        process = subprocess.Popen(cmd, start_new_session=True, **popen_kwargs)
+    except Exception:
+        listener.close()
+        raise
+    job_listeners.setdefault(process_id, []).append(listener.close_when_done(process, on_closed=on_closed))
+    job_scheduler.register_process(process_id, process)
+    return process
+
+
+def _advance_stage(process_id, line):
+    """根据流水线输出切换调度阶段；等待名额期间调度器暂停子进程的进程组"""
+    for marker, stage in STAGE_MARKERS:
+        if marker in line:
+            job_scheduler.enter_stage(process_id, stage)
+            return
+
+
+def cancel_processing(process_id):
+    """取消排队中或运行中的任务"""
+    with job_lock(process_id):
+        job = processing_jobs.get(process_id)
+        if job is None:
+            return {'error': '处理任务不存在'}
+        if job['status'] in ('completed', 'failed', 'cancelled') or job.get('stage') == 'completed':
+            return {'error': f"任务已结束，无法取消: {job['status']}"}
+    result = job_scheduler.cancel(process_id)
+    if result is None:
+        return {'error': '任务不在调度队列中，无法取消'}
+    return {'process_id': process_id, 'status': 'cancelled' if result == 'queued' else 'cancelling',
+            'message': '任务已从队列移除' if result == 'queued' else '正在终止任务'}
+
+
+def get_scheduler_stats():
+    return job_scheduler.stats()
+
+
+def get_perf_summary(limit=50):
+    """汇总最近 limit 个有 perf.json 的任务，返回各阶段耗时、CPU时间、写入量和LLM调用的分位数"""
+    with processing_lock:
+        jobs = list(processing_jobs.items())
+
+    candidates = []
+    for process_id, job in jobs:
+        with job_lock(process_id):
+            output_dir = _job_output_dir(job)
+            start_time = job.get('start_time') or ''
+        if output_dir:
+            candidates.append((start_time, process_id, output_dir))
+
+    records = []
+    for _, process_id, output_dir in sorted(candidates, reverse=True):
+        record = load_perf(output_dir)
+        if record is not None:
+            records.append(record)
+            if len(records) >= limit:
+                break
+    summary = summarize_perf(records)
+    summary['process_ids'] = [record.get('process_id') for record in records]
+    return summary
 
 # =================================================================
 # ========================= 论文处理核心函数 =========================
 # =================================================================
 
 # 单篇论文预处理
-def start_paper_processing(pdf_path, pdf_filename, video_duration='medium', voice_type='female', output_format='video', background_choice='default', auto_continue=False):
+def start_paper_processing(pdf_path, pdf_filename, video_duration='medium', voice_type='female', output_format='video', background_choice='default', auto_continue=False, priority=0):
     """
     启动论文处理流程
     修改函数签名，增加 unique_base_name 参数,增加 background_choice 参数
@@ -1202,13 +1549,14 @@ def start_paper_processing(pdf_path, pdf_filename, video_duration='medium', voic
         'custom_background_path': custom_background_path, # 存储自定义背景路径
 
         'auto_continue': auto_continue,
+        'priority': priority, # 调度优先级，数值越大越先执行
 
         'status': 'starting',
         'progress': 0,
         'start_time': datetime.now().isoformat(),
         'last_update': datetime.now().isoformat(),
         'current_step': 'Step 0: 准备开始',
-        'log_messages': [],
+        'log_messages': JobLog.open(process_id),
         'output_dir': None,
         'final_video_path': None,
         'final_output_path': None, # 存储最终输出路径（视频或压缩包）
@@ -1226,18 +1574,14 @@ def start_paper_processing(pdf_path, pdf_filename, video_duration='medium', voic
     with processing_lock:
         processing_jobs[process_id] = job_info
     
-    # 启动异步处理线程 - 只执行到Step 3
-    processing_thread = threading.Thread(
-        target=run_initial_processing, 
-        args=(process_id, pdf_path, base_name)
-    )
-    processing_thread.daemon = True
-    processing_thread.start()
+    # 交给调度器排队执行 - 只执行到Step 3
+    queue_position = _submit_job(process_id, run_initial_processing, (process_id, pdf_path, base_name))
     
     return {
         'process_id': process_id,
         'message': f'开始处理论文: {pdf_filename}',
-        'status': 'starting'
+        'status': 'queued',
+        'queue_position': queue_position
     }
 
 def run_initial_processing(process_id, pdf_path, base_name):
@@ -1247,7 +1591,7 @@ def run_initial_processing(process_id, pdf_path, base_name):
     """
     # 内部辅助函数，保持不变
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, output_dir=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -1261,7 +1605,7 @@ def run_initial_processing(process_id, pdf_path, base_name):
     
     try:
         # 1. 根据用户选择，确定要执行的脚本和初始步骤信息
-        with processing_lock:
+        with job_lock(process_id):
             job = processing_jobs[process_id]
             chosen_format = job.get('output_format', 'video')
 
@@ -1308,8 +1652,8 @@ def run_initial_processing(process_id, pdf_path, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'mineru', cmd, progress_plan=INITIAL_PROGRESS_PLAN,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -1319,16 +1663,13 @@ def run_initial_processing(process_id, pdf_path, base_name):
         )
         
         # 实时读取输出
-        current_progress = 10
         if process.stdout:
             for line in process.stdout:
                 line = line.strip()
                 if line:
                     update_job_status(log_msg=line)
-                    # 简化的进度更新
-                    if 'Step' in line and current_progress < 65:
-                         current_progress += 5
-                         update_job_status(progress=min(current_progress, 65))
+                    _advance_stage(process_id, line)
+                    # 进度由流水线上报的进度事件更新（INITIAL_PROGRESS_PLAN）
         
         process.wait()
         
@@ -1386,7 +1727,7 @@ def run_initial_processing(process_id, pdf_path, base_name):
                 
                 # 插入自动应用背景图的逻辑
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         # 从 job_info 中获取之前存储的背景设置
                         choice = job.get('background_choice', 'default')
@@ -1450,14 +1791,14 @@ def run_initial_processing(process_id, pdf_path, base_name):
 
                 # 【新增逻辑】根据 job_info 中的设置，决定是否自动执行后续步骤
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         auto_continue = job.get('auto_continue', False) # 从任务状态中读取
 
                     if auto_continue:
                         update_job_status(log_msg='⚙️ 自动模式已启用，无缝衔接后续处理...')
                         # 为了兼容 continue_paper_processing，需要手动设置它期望的 stage
-                        with processing_lock:
+                        with job_lock(process_id):
                             processing_jobs[process_id]['stage'] = 'waiting_for_edit'
                         
                         continue_paper_processing(process_id)
@@ -1515,7 +1856,7 @@ def run_initial_processing(process_id, pdf_path, base_name):
 
                 # 插入自动应用背景图的逻辑
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         # 从 job_info 中获取之前存储的背景设置
                         choice = job.get('background_choice', 'default')
@@ -1590,14 +1931,14 @@ def run_initial_processing(process_id, pdf_path, base_name):
                 
                 # 【新增逻辑】根据 job_info 中的设置，决定是否自动执行后续步骤
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         auto_continue = job.get('auto_continue', False) # 从任务状态中读取
 
                     if auto_continue:
                         update_job_status(log_msg='⚙️ 自动模式已启用，无缝衔接后续处理...')
                         # 为了兼容 continue_paper_processing，需要手动设置它期望的 stage
-                        with processing_lock:
+                        with job_lock(process_id):
                             processing_jobs[process_id]['stage'] = 'waiting_for_edit'
                         
                         continue_paper_processing(process_id)
@@ -1626,7 +1967,7 @@ def run_initial_processing(process_id, pdf_path, base_name):
         )
 
 # 论文集预处理
-def start_folder_processing(folder_path, folder_name, unique_base_name, video_duration='medium', voice_type='female', output_format='video', background_choice='default', auto_continue=False):
+def start_folder_processing(folder_path, folder_name, unique_base_name, video_duration='medium', voice_type='female', output_format='video', background_choice='default', auto_continue=False, priority=0):
     """
     启动整个文件夹的处理流程。
     这个函数接收的是一个文件夹路径。
@@ -1685,13 +2026,14 @@ def start_folder_processing(folder_path, folder_name, unique_base_name, video_du
         'custom_background_path': custom_background_path,
 
         'auto_continue': auto_continue,
+        'priority': priority, # 调度优先级，数值越大越先执行
 
         'status': 'starting',
         'progress': 0,
         'start_time': datetime.now().isoformat(),
         'last_update': datetime.now().isoformat(),
         'current_step': 'Step 0: 准备开始',
-        'log_messages': [],
+        'log_messages': JobLog.open(process_id),
         'output_dir': None,
         'final_video_path': None,
         'final_output_path': None,
@@ -1712,18 +2054,14 @@ def start_folder_processing(folder_path, folder_name, unique_base_name, video_du
     with processing_lock:
         processing_jobs[process_id] = job_info
 
-    # 启动异步处理线程，调用一个新的运行函数
-    processing_thread = threading.Thread(
-        target=run_folder_processing, # <-- 调用为文件夹设计的运行函数
-        args=(process_id, folder_path, base_name)
-    )
-    processing_thread.daemon = True
-    processing_thread.start()
+    # 交给调度器排队执行，调用为文件夹设计的运行函数
+    queue_position = _submit_job(process_id, run_folder_processing, (process_id, folder_path, base_name))
 
     return {
         'process_id': process_id,
         'message': f'开始处理文件夹: {folder_name}',
-        'status': 'starting'
+        'status': 'queued',
+        'queue_position': queue_position
     }
 
 def run_folder_processing(process_id, folder_path, base_name):
@@ -1733,7 +2071,7 @@ def run_folder_processing(process_id, folder_path, base_name):
     """
     # 内部辅助函数，保持不变
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, output_dir=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -1749,7 +2087,7 @@ def run_folder_processing(process_id, folder_path, base_name):
     # print(f"\n--- [BACKGROUND THREAD] 文件夹处理线程 {process_id} 已成功启动！ ---\n")
     update_job_status(status='running', progress=5, step='准备环境') # <--- 初始状态更新
     try:
-        with processing_lock:
+        with job_lock(process_id):
             job = processing_jobs[process_id]
             chosen_format = job.get('output_format', 'video')
 
@@ -1781,8 +2119,8 @@ def run_folder_processing(process_id, folder_path, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'mineru', cmd, progress_plan=INITIAL_PROGRESS_PLAN,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -1802,10 +2140,8 @@ def run_folder_processing(process_id, folder_path, base_name):
                     # all_pipeline_video.py 内部在干什么
                     # print(f"  [SUBPROCESS OUTPUT] > {line}") 
                     update_job_status(log_msg=line)
-                    # 简化的进度更新
-                    if 'Step' in line and current_progress < 65:
-                         current_progress += 5
-                         update_job_status(progress=min(current_progress, 65))
+                    _advance_stage(process_id, line)
+                    # 进度由流水线上报的进度事件更新（INITIAL_PROGRESS_PLAN）
         
         process.wait()
         # 判断子进程是成功还是失败
@@ -1863,7 +2199,7 @@ def run_folder_processing(process_id, folder_path, base_name):
                 
                 # 自动应用背景图
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         # 从 job_info 中获取之前存储的背景设置
                         choice = job.get('background_choice', 'default')
@@ -1930,14 +2266,14 @@ def run_folder_processing(process_id, folder_path, base_name):
 
                 # 【新增逻辑】根据 job_info 中的设置，决定是否自动执行后续步骤
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         auto_continue = job.get('auto_continue', False) # 从任务状态中读取
 
                     if auto_continue:
                         update_job_status(log_msg='⚙️ 自动模式已启用，无缝衔接后续处理...')
                         # 为了兼容 continue_paper_processing，需要手动设置它期望的 stage
-                        with processing_lock:
+                        with job_lock(process_id):
                             processing_jobs[process_id]['stage'] = 'waiting_for_edit'
                         
                         continue_paper_processing(process_id)
@@ -1995,7 +2331,7 @@ def run_folder_processing(process_id, folder_path, base_name):
 
                 # 自动应用背景图
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         # 从 job_info 中获取之前存储的背景设置
                         choice = job.get('background_choice', 'default')
@@ -2059,14 +2395,14 @@ def run_folder_processing(process_id, folder_path, base_name):
                 
                 # 【新增逻辑】根据 job_info 中的设置，决定是否自动执行后续步骤
                 try:
-                    with processing_lock:
+                    with job_lock(process_id):
                         job = processing_jobs[process_id]
                         auto_continue = job.get('auto_continue', False) # 从任务状态中读取
 
                     if auto_continue:
                         update_job_status(log_msg='⚙️ 自动模式已启用，无缝衔接后续处理...')
                         # 为了兼容 continue_paper_processing，需要手动设置它期望的 stage
-                        with processing_lock:
+                        with job_lock(process_id):
                             processing_jobs[process_id]['stage'] = 'waiting_for_edit'
                         
                         continue_paper_processing(process_id)
@@ -2106,7 +2442,7 @@ def continue_paper_processing(process_id):
     import os # 【新增】
     import json # 【新增】
 
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             raise Exception('处理任务不存在')
         
@@ -2119,24 +2455,16 @@ def continue_paper_processing(process_id):
         job['status'] = 'running'
         base_name = job['base_name']
     
-    # 启动继续处理线程
+    # 交给调度器继续处理，已开始的任务在同一优先级内优先于新任务
     print('开始启动处理')
     job = processing_jobs[process_id]
     chosen_format = job.get('output_format', 'video')
     if chosen_format == 'video':
-        processing_thread = threading.Thread(
-            target=run_continue_processing, 
-            # target=run_final_processing, 
-            args=(process_id, base_name)
-        )
+        target = run_continue_processing
+        # target = run_final_processing
     elif chosen_format == 'ppt':
-        processing_thread = threading.Thread(
-            target=run_continue_processing_ppt, 
-            # target=run_final_processing, 
-            args=(process_id, base_name)
-        )
-    processing_thread.daemon = True
-    processing_thread.start()
+        target = run_continue_processing_ppt
+    _submit_job(process_id, target, (process_id, base_name), resume=True)
     
     return {
         'process_id': process_id,
@@ -2152,7 +2480,7 @@ def run_continue_processing(process_id, base_name):
     import traceback
     import subprocess
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, final_video=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -2173,7 +2501,7 @@ def run_continue_processing(process_id, base_name):
         project_root = os.path.abspath(os.path.dirname(__file__))
         output_dir_name = f"{base_name}_output"
         # === 创建配置文件 (这是您缺失的关键逻辑) ===
-        with processing_lock:
+        with job_lock(process_id):
             job = processing_jobs[process_id]
             custom_voice_path_rel = job.get("custom_voice_path")
             custom_voice_path_abs = None
@@ -2214,8 +2542,8 @@ def run_continue_processing(process_id, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'tts', cmd, progress_plan=CONTINUE_PROGRESS_PLAN,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -2236,6 +2564,7 @@ def run_continue_processing(process_id, base_name):
                     line = line.rstrip()
                     if line:
                         update_job_status(log_msg=line)
+                        _advance_stage(process_id, line)
                         
                         # 根据输出更新进度
                         if "Step 4.5" in line:
@@ -2276,7 +2605,7 @@ def run_continue_processing(process_id, base_name):
                     stage='completed'
                 )
                 # 设置 final_output_path
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         processing_jobs[process_id]['final_output_path'] = final_output if os.path.exists(final_output) else None
             elif chosen_format == 'ppt':
@@ -2289,7 +2618,7 @@ def run_continue_processing(process_id, base_name):
                     stage='completed'
                 )
                 # 对于PPT，设置 final_output_path 而不是 final_video_path
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         processing_jobs[process_id]['final_output_path'] = final_output if os.path.exists(final_output) else None
         else:
@@ -2316,7 +2645,7 @@ def run_continue_processing_ppt(process_id, base_name):
     import traceback
     import subprocess
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, final_video=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -2353,8 +2682,8 @@ def run_continue_processing_ppt(process_id, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'render', cmd,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -2460,7 +2789,7 @@ def run_continue_processing_ppt(process_id, base_name):
                 stage='completed'
             )
             # 设置 final_output_path
-            with processing_lock:
+            with job_lock(process_id):
                 if process_id in processing_jobs:
                     processing_jobs[process_id]['final_output_path'] = final_output if os.path.exists(final_output) else None
         else:
@@ -2504,7 +2833,7 @@ def generate_cover_content(process_id):
             'status': 'failed'
         }
     
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             return {
                 'error': '处理任务不存在',
@@ -2547,7 +2876,7 @@ def generate_cover_content(process_id):
                 mineru_output_dir = alt_mineru_dir
             else:
                 # 如果找不到MinerU输出，使用默认内容
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         job = processing_jobs[process_id]
                         job['log_messages'].append({
@@ -2578,7 +2907,7 @@ def generate_cover_content(process_id):
         
         if not md_files:
             # 如果找不到md文件，使用默认内容
-            with processing_lock:
+            with job_lock(process_id):
                 if process_id in processing_jobs:
                     job = processing_jobs[process_id]
                     job['log_messages'].append({
@@ -2609,7 +2938,7 @@ def generate_cover_content(process_id):
                 
         if not all_titles:
             # 如果提取失败，使用默认内容
-            with processing_lock:
+            with job_lock(process_id):
                 if process_id in processing_jobs:
                     job = processing_jobs[process_id]
                     job['log_messages'].append({
@@ -2641,7 +2970,7 @@ def generate_cover_content(process_id):
         final_affiliations = ", ".join(sorted(list(unique_affiliations))) if unique_affiliations else "未知单位"
         
         # 记录单位处理日志
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 job['log_messages'].append({
@@ -2687,7 +3016,7 @@ def generate_cover_content(process_id):
         if source_logo_path.exists():
             try:
                 shutil.copy(source_logo_path, code_dir)
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         job = processing_jobs[process_id]
                         job['log_messages'].append({
@@ -2695,7 +3024,7 @@ def generate_cover_content(process_id):
                             'message': f'✅ 成功复制logo文件: {source_logo_path} -> {code_dir}'
                         })
             except Exception as e:
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         job = processing_jobs[process_id]
                         job['log_messages'].append({
@@ -2703,7 +3032,7 @@ def generate_cover_content(process_id):
                             'message': f'⚠️ 警告: 复制logo文件时出错: {str(e)}，但不影响后续步骤'
                         })
         else:
-            with processing_lock:
+            with job_lock(process_id):
                 if process_id in processing_jobs:
                     job = processing_jobs[process_id]
                     job['log_messages'].append({
@@ -2732,26 +3061,26 @@ def generate_cover_content(process_id):
         #         job['log_messages'].append({'time': datetime.now().isoformat(), 'message': f'   - ❌ 复制其余.py文件时出错: {str(e)}'})
 
         # 2. 复制所有的txt文件 (除了1Introduction_speech.txt)
-        with processing_lock:
+        with job_lock(process_id):
             job['log_messages'].append({'time': datetime.now().isoformat(), 'message': '📋 开始复制所有的speech.txt文件...'})
         try:
             txt_files_to_copy = [f for f in source_cover_dir.glob('*.txt') if f.name != '1Introduction_speech.txt']
             if not txt_files_to_copy:
-                with processing_lock:
+                with job_lock(process_id):
                     job['log_messages'].append({'time': datetime.now().isoformat(), 'message': '   - ⚠️ 在源目录中没有找到需要复制的.txt文件。'})
             else:
                 for source_file in txt_files_to_copy:
                     destination_file = speech_dir / source_file.name
                     shutil.copy(source_file, destination_file)
-                    with processing_lock:
+                    with job_lock(process_id):
                         job['log_messages'].append({'time': datetime.now().isoformat(), 'message': f'   - ✅ 成功复制: {source_file.name} -> {destination_file}'})
         except Exception as e:
-            with processing_lock:
+            with job_lock(process_id):
                 job['log_messages'].append({'time': datetime.now().isoformat(), 'message': f'   - ❌ 复制.txt文件时出错: {str(e)}'})
         # --- 新增功能结束 ---
 
         # 更新状态
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 job['log_messages'].append({
@@ -2770,7 +3099,7 @@ def generate_cover_content(process_id):
         
     except Exception as e:
         # 发生错误，使用默认内容
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 job['log_messages'].append({
@@ -2815,7 +3144,7 @@ def generate_pptcover_content(process_id):
             'status': 'failed'
         }
     
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             return {
                 'error': '处理任务不存在',
@@ -2856,7 +3185,7 @@ def generate_pptcover_content(process_id):
             else:
                 print("正在生成ppt封面333...")
                 # 如果找不到MinerU输出，使用默认内容
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         job = processing_jobs[process_id]
                         job['log_messages'].append({
@@ -2888,7 +3217,7 @@ def generate_pptcover_content(process_id):
         
         if not md_files:
             # 如果找不到md文件，使用默认内容
-            with processing_lock:
+            with job_lock(process_id):
                 if process_id in processing_jobs:
                     job = processing_jobs[process_id]
                     job['log_messages'].append({
@@ -2921,7 +3250,7 @@ def generate_pptcover_content(process_id):
                 
         if not all_titles:
             # 如果提取失败，使用默认内容
-            with processing_lock:
+            with job_lock(process_id):
                 if process_id in processing_jobs:
                     job = processing_jobs[process_id]
                     job['log_messages'].append({
@@ -2954,7 +3283,7 @@ def generate_pptcover_content(process_id):
         final_affiliations = ", ".join(sorted(list(unique_affiliations))) if unique_affiliations else "未知单位"
         
         # 记录单位处理日志
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 job['log_messages'].append({
@@ -2998,7 +3327,7 @@ def generate_pptcover_content(process_id):
         if source_logo_path.exists():
             try:
                 shutil.copy(source_logo_path, code_dir)
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         job = processing_jobs[process_id]
                         job['log_messages'].append({
@@ -3006,7 +3335,7 @@ def generate_pptcover_content(process_id):
                             'message': f'✅ 成功复制logo文件: {source_logo_path} -> {code_dir}'
                         })
             except Exception as e:
-                with processing_lock:
+                with job_lock(process_id):
                     if process_id in processing_jobs:
                         job = processing_jobs[process_id]
                         job['log_messages'].append({
@@ -3014,7 +3343,7 @@ def generate_pptcover_content(process_id):
                             'message': f'⚠️ 警告: 复制logo文件时出错: {str(e)}，但不影响后续步骤'
                         })
         else:
-            with processing_lock:
+            with job_lock(process_id):
                 if process_id in processing_jobs:
                     job = processing_jobs[process_id]
                     job['log_messages'].append({
@@ -3023,7 +3352,7 @@ def generate_pptcover_content(process_id):
                     })
         
         # 更新状态
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 job['log_messages'].append({
@@ -3042,7 +3371,7 @@ def generate_pptcover_content(process_id):
         
     except Exception as e:
         # 发生错误，使用默认内容
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 job['log_messages'].append({
@@ -3103,7 +3432,7 @@ def create_default_cover(code_dir, speech_dir, base_name):
 def render_preview_video(process_id, base_name):
     """渲染预览视频，完成后进入等待交互编辑状态"""
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, final_video=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -3131,8 +3460,8 @@ def render_preview_video(process_id, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'render', cmd, progress_plan=PREVIEW_PROGRESS_PLAN,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -3140,8 +3469,6 @@ def render_preview_video(process_id, base_name):
             env=env
         )
         
-        current_progress = 82
-        
         if process.stdout:
             while True:
                 line = process.stdout.readline()
@@ -3152,15 +3479,8 @@ def render_preview_video(process_id, base_name):
                     line = line.strip()
                     print(f"[{process_id}] {line}")
                     
-                    # 根据输出更新进度
-                    if "Step 4.5" in line:
-                        current_progress = min(current_progress + 2, 88)
-                        update_job_status(progress=current_progress, log_msg=line)
-                    elif "预览视频" in line:
-                        current_progress = min(current_progress + 1, 88)
-                        update_job_status(progress=current_progress, log_msg=line)
-                    else:
-                        update_job_status(log_msg=line)
+                    # 进度由渲染脚本上报的进度事件更新（PREVIEW_PROGRESS_PLAN）
+                    update_job_status(log_msg=line)
         
         # 等待进程完成
         return_code = process.wait()
@@ -3199,7 +3519,7 @@ def render_preview_video(process_id, base_name):
 
 def start_preview_and_feedback(process_id):
     """检查预览和编辑状态（预览已集成到初始流程中）"""
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             raise Exception('处理任务不存在')
         
@@ -3219,7 +3539,7 @@ def start_preview_and_feedback(process_id):
 def render_preview_ppt(process_id, base_name):
     """渲染预览视频，完成后进入等待交互编辑状态"""
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, final_video=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -3247,8 +3567,8 @@ def render_preview_ppt(process_id, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'render', cmd,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -3313,7 +3633,7 @@ def render_preview_ppt(process_id, base_name):
 def run_preview_only(process_id, base_name):
     """只运行Step 4.5预览视频渲染，然后进入等待反馈编辑状态"""
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, final_video=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -3341,8 +3661,8 @@ def run_preview_only(process_id, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'render', cmd,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -3400,7 +3720,7 @@ def run_preview_only(process_id, base_name):
 
 def continue_after_feedback(process_id):
     """交互编辑完成后继续处理（Step 6-9）"""
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             raise Exception('处理任务不存在')
         
@@ -3413,13 +3733,8 @@ def continue_after_feedback(process_id):
         job['status'] = 'running'
         base_name = job['base_name']
     
-    # 启动最终处理线程
-    processing_thread = threading.Thread(
-        target=run_final_processing, 
-        args=(process_id, base_name)
-    )
-    processing_thread.daemon = True
-    processing_thread.start()
+    # 交给调度器执行最终处理
+    _submit_job(process_id, run_final_processing, (process_id, base_name), resume=True)
     
     return {
         'process_id': process_id,
@@ -3435,7 +3750,7 @@ def run_final_processing(process_id, base_name):
     # 内部的 update_job_status 辅助函数保持不变
     """运行最终处理流程（Step 6-9）"""
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, output_dir=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -3476,7 +3791,7 @@ def run_final_processing(process_id, base_name):
 
         # 【修改】使用绝对路径
         # ==================== 【核心修复逻辑：使用绝对路径】 ====================
-        with processing_lock:
+        with job_lock(process_id):
             job = processing_jobs[process_id]
             # 获取项目根目录的绝对路径
             # os.path.abspath(os.path.dirname(__file__)) 会得到 services.py 所在的目录
@@ -3505,7 +3820,7 @@ def run_final_processing(process_id, base_name):
         config_path_abs = os.path.join(temp_dir_abs, 'job_config.json')
         
         # 【修改】将配置文件的绝对路径也保存到 job_info 中，供 shell 脚本使用
-        with processing_lock:
+        with job_lock(process_id):
             processing_jobs[process_id]['job_config_path'] = config_path_abs
 
         with open(config_path_abs, 'w', encoding='utf-8') as f:
@@ -3524,8 +3839,8 @@ def run_final_processing(process_id, base_name):
         env['PYTHONUNBUFFERED'] = '1'
         env['PYTHONIOENCODING'] = 'utf-8'
         
-        process = subprocess.Popen(
-            cmd, 
+        process = _start_job_process(
+            process_id, 'tts', cmd, progress_plan=FINAL_PROGRESS_PLAN,
             stdout=subprocess.PIPE, 
             stderr=subprocess.STDOUT, 
             universal_newlines=True,
@@ -3545,6 +3860,7 @@ def run_final_processing(process_id, base_name):
                     line = line.rstrip()
                     if line:
                         update_job_status(log_msg=line)
+                        _advance_stage(process_id, line)
                         
                         # 根据输出更新进度
                         if 'Step 6' in line:
@@ -3610,28 +3926,18 @@ def run_final_processing(process_id, base_name):
         )
 
 def get_processing_status(process_id):
-    """获取处理状态"""
-    with processing_lock:
-        if process_id not in processing_jobs:
-            return {'error': '处理任务不存在'}
-        
-        job = processing_jobs[process_id].copy()
-        
-        # 添加调试信息
-        print(f"[DEBUG] 获取处理状态 - Process ID: {process_id}")
-        print(f"[DEBUG] 状态: {job['status']}, 进度: {job['progress']}")
-        print(f"[DEBUG] 当前步骤: {job['current_step']}")
-        print(f"[DEBUG] 处理阶段: {job.get('stage', 'unknown')}")
-        print(f"[DEBUG] 日志消息数量: {len(job['log_messages'])}")
-        
+    """获取处理状态；只读取需要的字段和最近30条日志，不复制整个任务"""
+    job = processing_jobs.get(process_id)
+    if job is None:
+        return {'error': '处理任务不存在'}
+
+    with job_lock(process_id):
         result = {
             'process_id': process_id,
             'status': job['status'],
             'progress': job['progress'],
             'current_step': job['current_step'],
             'start_time': job['start_time'],
-            # 'pdf_filename': job['pdf_filename'],
-            # 【核心修正】
             # 使用 .get() 方法安全地获取值。
             # 如果 'pdf_filename' 不存在，它会尝试获取 'folder_name'。
             # 如果两者都不存在，则返回 '未知任务'。
@@ -3641,18 +3947,26 @@ def get_processing_status(process_id):
             'final_video_path': job['final_video_path'],
             'error': job['error'],
             'stage': job.get('stage', 'unknown'),  # 新增stage字段
-            'recent_logs': job['log_messages'][-30:] if job['log_messages'] else []  # 最近30条日志
+            'queue_position': job_scheduler.queue_position(process_id) if job['status'] == 'queued' else None,
+            # 来自流水线进度事件（见 job_progress.py）
+            'eta_seconds': job.get('eta_seconds'),
+            'stage_durations': job.get('stage_durations'),
+            'progress_detail': job.get('progress_detail'),
         }
-        # 别忘了在最外层也加上 success 标志
-        result['success'] = True
-        print(f"[DEBUG] 返回的recent_logs数量: {len(result['recent_logs'])}")
-        return result
+    # 日志自带锁，取最近30条与日志总量无关
+    result['recent_logs'] = job['log_messages'].tail(30)
+    # 别忘了在最外层也加上 success 标志
+    result['success'] = True
+    return result
 
 def get_processing_results():
     """获取所有处理结果列表"""
     with processing_lock:
-        results = []
-        for process_id, job in processing_jobs.items():
+        jobs = list(processing_jobs.items())
+
+    results = []
+    for process_id, job in jobs:
+        with job_lock(process_id):
             if job['status'] in ['completed', 'failed']:
                 result_info = {
                     'process_id': process_id,
@@ -3664,12 +3978,30 @@ def get_processing_results():
                     'error': job['error']
                 }
                 results.append(result_info)
-        
-        return {'results': results}
+    
+    return {'results': results}
+
+def get_sync_report(process_id):
+    """读取音视频对齐步骤 (audio_video_sync.py) 写出的结构化报告"""
+    with job_lock(process_id):
+        if process_id not in processing_jobs:
+            return {'error': '处理任务不存在'}
+        output_dir = processing_jobs[process_id].get('output_dir')
+
+    if not output_dir:
+        return {'error': '任务尚未生成输出目录'}
+    report_path = os.path.join(output_dir, 'final_results', 'sync_report.json')
+    if not os.path.exists(report_path):
+        return {'error': '音视频对齐尚未完成'}
+    try:
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return {'success': True, 'report': json.load(f)}
+    except (OSError, json.JSONDecodeError) as e:
+        return {'error': f'读取对齐报告失败: {e}'}
 
 def get_result_download_path(result_id):
     """获取结果下载路径"""
-    with processing_lock:
+    with job_lock(result_id):
         if result_id not in processing_jobs:
             print(f"[DEBUG] 下载失败：processing_jobs中找不到result_id: {result_id}")
             return None
@@ -3707,7 +4039,7 @@ def get_result_download_path(result_id):
 def run_folder_markdown_generation(process_id, base_name):
     """运行Markdown文档生成和打包流程"""
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, final_output=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -3775,8 +4107,8 @@ def run_folder_markdown_generation(process_id, base_name):
         update_job_status(log_msg=f'⚙️ 执行命令: {" ".join(cmd)}') # 增加日志，方便调试
 
         # ... (函数余下的 subprocess.Popen 和打包逻辑保持不变)
-        process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
+        process = _start_job_process(
+            process_id, None, cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
             universal_newlines=True, bufsize=1, encoding='utf-8'
         )
 
@@ -3827,7 +4159,7 @@ def run_folder_markdown_generation(process_id, base_name):
 def run_markdown_generation(process_id, base_name):
     """运行Markdown文档生成和打包流程"""
     def update_job_status(status=None, progress=None, step=None, log_msg=None, error=None, final_output=None, stage=None):
-        with processing_lock:
+        with job_lock(process_id):
             if process_id in processing_jobs:
                 job = processing_jobs[process_id]
                 if status: job['status'] = status
@@ -3895,8 +4227,8 @@ def run_markdown_generation(process_id, base_name):
         update_job_status(log_msg=f'⚙️ 执行命令: {" ".join(cmd)}') # 增加日志，方便调试
 
         # ... (函数余下的 subprocess.Popen 和打包逻辑保持不变)
-        process = subprocess.Popen(
-            cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
+        process = _start_job_process(
+            process_id, None, cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, 
             universal_newlines=True, bufsize=1, encoding='utf-8'
         )
 
@@ -3947,7 +4279,7 @@ def run_markdown_generation(process_id, base_name):
 
 def get_editor_files(process_id):
     """获取指定处理任务的可编辑文件列表"""
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             raise Exception('处理任务不存在')
         
@@ -4090,7 +4422,7 @@ def upload_background_image(file, process_id):
     """上传背景图片"""
     from werkzeug.utils import secure_filename
     
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             raise Exception('处理任务不存在')
         
@@ -4138,7 +4470,7 @@ def apply_background_to_code(process_id, background_file):
     """应用背景图到所有代码文件"""
     import subprocess
     
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             raise Exception('处理任务不存在')
         
@@ -4231,7 +4563,7 @@ def search_editor_files(process_id, search_term):
 
 def get_page_video_associations(process_id):
     """获取视频预览与对应文件的关联关系"""
-    with processing_lock:
+    with job_lock(process_id):
         if process_id not in processing_jobs:
             raise Exception('处理任务不存在')
         
@@ -4283,33 +4615,24 @@ def get_page_video_associations(process_id):
         'video_preview_dir': video_preview_dir
     } 
 
-def ai_edit_code(original_code: str, edit_request: str, filename: str = None) -> dict:
-    """
-    使用AI智能体编辑代码
+def load_ai_edit_config():
+    """读取智能体编辑所需的API配置"""
+    with open('config.json', 'r', encoding='utf-8') as f:
+        config = json.load(f)
     
-    Args:
-        original_code: 原始代码
-        edit_request: 用户的修改需求
-        filename: 文件名（可选）
+    api_key = config.get('api_key')
+    model = config.get('model', 'gpt-4.5-preview')
     
-    Returns:
-        dict: 包含修改后代码的结果
-    """
-    try:
-        # 读取配置
-        with open('config.json', 'r', encoding='utf-8') as f:
-            config = json.load(f)
-        
-        api_key = config.get('api_key')
-        model = config.get('model', 'gpt-4.5-preview')
-        
-        if not api_key:
-            raise Exception("未配置API密钥")
-        
-        # 构建提示词
-        file_info = f"文件名: {filename}\n\n" if filename else ""
-        
-        prompt = f"""你是一个专业的代码编辑助手。请根据用户的修改需求，对给定的代码进行修改。
+    if not api_key:
+        raise Exception("未配置API密钥")
+    
+    return api_key, model
+
+def build_ai_edit_prompt(original_code: str, edit_request: str, filename: str = None) -> str:
+    """构建智能体编辑代码的提示词"""
+    file_info = f"文件名: {filename}\n\n" if filename else ""
+    
+    return f"""你是一个专业的代码编辑助手。请根据用户的修改需求，对给定的代码进行修改。
 
 {file_info}用户修改需求：
 {edit_request}
@@ -4327,29 +4650,75 @@ def ai_edit_code(original_code: str, edit_request: str, filename: str = None) ->
 
 修改后的代码："""
 
+def clean_ai_edit_response(ai_response: str) -> str:
+    """清理模型响应，提取代码部分"""
+    modified_code = ai_response.strip()
+    
+    # 如果响应被代码块包裹，提取其中的代码
+    if modified_code.startswith('```'):
+        lines = modified_code.split('\n')
+        # 去掉第一行的```和可能的语言标识
+        if len(lines) > 1:
+            lines = lines[1:]
+        # 去掉最后一行的```
+        if lines and lines[-1].strip() == '```':
+            lines = lines[:-1]
+        modified_code = '\n'.join(lines)
+    
+    return modified_code
+
+def ai_edit_code(original_code: str, edit_request: str, filename: str = None) -> dict:
+    """
+    使用AI智能体编辑代码
+    
+    Args:
+        original_code: 原始代码
+        edit_request: 用户的修改需求
+        filename: 文件名（可选）
+    
+    Returns:
+        dict: 包含修改后代码的结果
+    """
+    try:
+        api_key, model = load_ai_edit_config()
+        prompt = build_ai_edit_prompt(original_code, edit_request, filename)
+
         # 调用API获取修改后的代码
-        ai_response = process_text(prompt, api_key, model)
-        
-        # 清理响应，提取代码部分
-        modified_code = ai_response.strip()
-        
-        # 如果响应被代码块包裹，提取其中的代码
-        if modified_code.startswith('```'):
-            lines = modified_code.split('\n')
-            # 去掉第一行的```和可能的语言标识
-            if len(lines) > 1:
-                lines = lines[1:]
-            # 去掉最后一行的```
-            if lines and lines[-1].strip() == '```':
-                lines = lines[:-1]
-            modified_code = '\n'.join(lines)
+        # 用户重复提交同一需求时希望得到新的结果，不使用响应缓存
+        ai_response = process_text(prompt, api_key, model, use_cache=False)
         
         return {
             'original_code': original_code,
-            'modified_code': modified_code,
+            'modified_code': clean_ai_edit_response(ai_response),
             'edit_request': edit_request,
             'filename': filename
         }
         
     except Exception as e:
-        raise Exception(f"AI编辑代码失败: {str(e)}")
\ No newline at end of file
+        raise Exception(f"AI编辑代码失败: {str(e)}")
+
+def ai_edit_code_stream(original_code: str, edit_request: str, filename: str = None):
+    """
+    使用AI智能体编辑代码（流式版本）
+    
+    逐段产出事件字典：生成过程中为 {'delta': 新增文本}，
+    结束时为 {'done': True, 'modified_code': 清理后的完整代码}，出错时为 {'error': 错误信息}
+    """
+    try:
+        api_key, model = load_ai_edit_config()
+        prompt = build_ai_edit_prompt(original_code, edit_request, filename)
+        
+        chunks = []
+        for delta in stream_text(prompt, api_key, model, use_cache=False):
+            chunks.append(delta)
+            yield {'delta': delta}
+        
+        yield {
+            'done': True,
+            'modified_code': clean_ai_edit_response(''.join(chunks)),
+            'edit_request': edit_request,
+            'filename': filename
+        }
+    
+    except Exception as e:
+        yield {'error': f"AI编辑代码失败: {str(e)}"}
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, send_from_directory, request, jsonify
+from flask import Flask, render_template, send_from_directory, request, jsonify, Response, stream_with_context
 import os
 import magic
 import re
@@ -128,6 +128,35 @@ def call_api_with_text(text: str, model: Optional[str] = None) -> str:
     except Exception as e:
         return f"API调用失败: {str(e)}"
 
+def stream_api_with_text(text: str, model: Optional[str] = None):
+    """流式调用OpenAI API，逐段产出生成的文本；参数与 call_api_with_text 一致"""
+    if not model:
+        model = DEFAULT_MODEL or "gpt-4o"
+    
+    if not API_KEY:
+        raise Exception("未配置API密钥，请检查Paper2Video/config.json文件")
+    
+    client = OpenAI(
+        api_key=API_KEY,
+        base_url=API_BASE_URL,
+    )
+    
+    stream = client.chat.completions.create(
+        model=model,
+        messages=[
+            {
+                "role": "user",
+                "content": text
+            }
+        ],
+        max_tokens=2000,
+        temperature=0.3,
+        stream=True
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
 def similarity(a, b):
     """计算两个字符串的相似度"""
     return SequenceMatcher(None, a, b).ratio()
@@ -303,20 +332,9 @@ def serve_script(filename):
     
     return send_from_directory(SCRIPT_FOLDER, filename)
 
-@app.route('/optimize-code', methods=['POST'])
-def optimize_code():
-    try:
-        if not request.json:
-            return jsonify({'success': False, 'error': '无效的请求数据'}), 400
-        
-        original_code = request.json.get('code', '')
-        requirement = request.json.get('requirement', '')
-        
-        if not original_code or not requirement:
-            return jsonify({'success': False, 'error': '代码和需求不能为空'}), 400
-        
-        # 构建优化提示
-        prompt = f"""请根据以下需求优化Manim动画代码。
+def build_optimize_prompt(original_code: str, requirement: str) -> str:
+    """构建Manim代码优化提示"""
+    return f"""请根据以下需求优化Manim动画代码。
 
                     **用户需求:**
                     {requirement}
@@ -346,6 +364,32 @@ def optimize_code():
 
                     请直接从第一行开始提供优化后的完整Manim代码："""
 
+def clean_optimized_code(optimized_code: str) -> str:
+    """清理可能存在的markdown代码块标记"""
+    optimized_code = optimized_code.strip()
+    if optimized_code.startswith("```python"):
+        optimized_code = optimized_code[9:]
+    if optimized_code.startswith("```"):
+        optimized_code = optimized_code[3:]
+    if optimized_code.endswith("```"):
+        optimized_code = optimized_code[:-3]
+    return optimized_code.strip()
+
+@app.route('/optimize-code', methods=['POST'])
+def optimize_code():
+    try:
+        if not request.json:
+            return jsonify({'success': False, 'error': '无效的请求数据'}), 400
+        
+        original_code = request.json.get('code', '')
+        requirement = request.json.get('requirement', '')
+        
+        if not original_code or not requirement:
+            return jsonify({'success': False, 'error': '代码和需求不能为空'}), 400
+        
+        # 构建优化提示
+        prompt = build_optimize_prompt(original_code, requirement)
+
         # 调用API
         optimized_code = call_api_with_text(prompt)
         
@@ -353,14 +397,7 @@ def optimize_code():
             return jsonify({'success': False, 'error': optimized_code}), 500
         
         # 清理可能存在的markdown代码块标记
-        optimized_code = optimized_code.strip()
-        if optimized_code.startswith("```python"):
-            optimized_code = optimized_code[9:]
-        if optimized_code.startswith("```"):
-            optimized_code = optimized_code[3:]
-        if optimized_code.endswith("```"):
-            optimized_code = optimized_code[:-3]
-        optimized_code = optimized_code.strip()
+        optimized_code = clean_optimized_code(optimized_code)
         
         return jsonify({
             'success': True, 
@@ -371,6 +408,39 @@ def optimize_code():
     except Exception as e:
         return jsonify({'success': False, 'error': f'优化失败: {str(e)}'}), 500
 
+@app.route('/optimize-code-stream', methods=['POST'])
+def optimize_code_stream():
+    """与 /optimize-code 参数相同，以SSE边生成边推送代码片段，最后一条事件带有清理后的完整代码"""
+    if not request.json:
+        return jsonify({'success': False, 'error': '无效的请求数据'}), 400
+    
+    original_code = request.json.get('code', '')
+    requirement = request.json.get('requirement', '')
+    
+    if not original_code or not requirement:
+        return jsonify({'success': False, 'error': '代码和需求不能为空'}), 400
+    
+    prompt = build_optimize_prompt(original_code, requirement)
+    
+    def generate():
+        chunks = []
+        try:
+            for delta in stream_api_with_text(prompt):
+                chunks.append(delta)
+                yield f"data: {json.dumps({'delta': delta}, ensure_ascii=False)}\n\n"
+            event = {
+                'success': True,
+                'done': True,
+                'optimized_code': clean_optimized_code(''.join(chunks)),
+                'message': '代码优化完成'
+            }
+        except Exception as e:
+            event = {'success': False, 'done': True, 'error': f'优化失败: {str(e)}'}
+        yield f"data: {json.dumps(event, ensure_ascii=False)}\n\n"
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/multimodal-feedback', methods=['POST'])
 def multimodal_feedback():
     """多模态反馈：同时处理截图和文字需求"""
@@ -0,0 +1,331 @@
+# TTS 合成核心：后端抽象与 WAV 写出
+# 被 run_cosyvoice_dynamic.py（单次任务）和 tts_worker.py（常驻服务）共用
+
+import os
+import re
+import sys
+import json
+import math
+import wave
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from voice_profiles import VoiceProfileStore, ProfileKeyCache
+
+# CosyVoice 安装位置（可通过环境变量覆盖）
+COSYVOICE_ROOT = os.environ.get("COSYVOICE_ROOT", "/home/EduAgent/CosyVoice")
+COSYVOICE_MODEL_DIR = os.environ.get(
+    "COSYVOICE_MODEL_DIR", os.path.join(COSYVOICE_ROOT, "pretrained_models", "CosyVoice2-0.5B")
+)
+
+# 所有后端统一输出 16bit 单声道 PCM
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+# 分句合成时每个文本块的最大字符数
+CHUNK_MAX_CHARS = 80
+# 句末标点（中英文），分句时保留在句子末尾
+SENTENCE_END_RE = re.compile(r'(?<=[。！？；!?;…\n])|(?<=\.)(?=\s)')
+
+
+# 未显式传入 profile_store 时使用默认档案目录；传入 None 表示不使用磁盘档案
+DEFAULT_STORE = object()
+
+
+class FakeBackend:
+    """
+    不依赖 GPU 和模型文件的假后端
+
+    按文本长度生成正弦提示音，用于 CPU 环境下联调 worker 和流水线。
+    """
+
+    name = "fake"
+
+    def __init__(self, sample_rate=24000, seconds_per_char=0.15, profile_store=DEFAULT_STORE):
+        self.sample_rate = sample_rate
+        self.seconds_per_char = seconds_per_char
+        self.profile_store = VoiceProfileStore() if profile_store is DEFAULT_STORE else profile_store
+        self._voices = {}
+        self._profile_keys = ProfileKeyCache()
+        self._lock = threading.Lock()
+
+    def prepare_voice(self, prompt_wav, prompt_text, name=None):
+        key = self._profile_keys.get(prompt_wav, prompt_text)
+        with self._lock:
+            if key in self._voices:
+                return key
+            if self.profile_store is None or not self.profile_store.load(self, key):
+                self._voices[key] = prompt_text
+                if self.profile_store is not None:
+                    self.profile_store.save(self, key, prompt_wav, prompt_text, name)
+        return key
+
+    def save_profile(self, key, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({'prompt_text': self._voices[key]}, f, ensure_ascii=False)
+
+    def load_profile(self, key, path):
+        with open(path, "r", encoding="utf-8") as f:
+            self._voices[key] = json.load(f)['prompt_text']
+
+    def cached_voices(self):
+        with self._lock:
+            return list(self._voices)
+
+    def synthesize(self, text, prompt_wav, prompt_text):
+        """逐段产出 16bit PCM 字节，每个非空行一段"""
+        key = self.prepare_voice(prompt_wav, prompt_text)
+        # 不同音色使用不同音高，便于人工区分
+        freq = 200 + int(key[:2], 16)
+        for line in [l for l in text.splitlines() if l.strip()] or [text]:
+            frames = max(1, int(len(line.strip()) * self.seconds_per_char * self.sample_rate))
+            samples = bytearray()
+            for i in range(frames):
+                value = int(0.2 * 32767 * math.sin(2 * math.pi * freq * i / self.sample_rate))
+                samples += value.to_bytes(2, "little", signed=True)
+            yield bytes(samples)
+
+
+class CosyVoiceBackend:
+    """
+    CosyVoice2 后端
+
+    模型只加载一次；每个音色的提示音特征通过 add_zero_shot_spk 注册后复用，
+    并保存为音色档案，之后的任务直接从磁盘载入，不再重新计算。
+    """
+
+    name = "cosyvoice"
+
+    def __init__(self, model_dir=COSYVOICE_MODEL_DIR, cosyvoice_root=COSYVOICE_ROOT, profile_store=DEFAULT_STORE):
+        sys.path.insert(0, os.path.join(cosyvoice_root, "third_party", "Matcha-TTS"))
+        sys.path.insert(0, cosyvoice_root)
+
+        import torch
+        from cosyvoice.cli.cosyvoice import CosyVoice2
+        from cosyvoice.utils.file_utils import load_wav
+
+        self._torch = torch
+        self._load_wav = load_wav
+        print("正在加载 CosyVoice 模型...")
+        print("模型路径:", model_dir)
+        self.model = CosyVoice2(model_dir, load_jit=False, load_trt=False, load_vllm=False, fp16=False)
+        self.sample_rate = self.model.sample_rate
+        # 旧版本 CosyVoice2 没有 add_zero_shot_spk，此时缓存提示音张量
+        self._supports_spk_cache = hasattr(self.model, "add_zero_shot_spk")
+        self.profile_store = VoiceProfileStore() if profile_store is DEFAULT_STORE else profile_store
+        self._voices = {}
+        self._profile_keys = ProfileKeyCache()
+        self._lock = threading.Lock()
+        print("✅ 模型加载完成")
+
+    def prepare_voice(self, prompt_wav, prompt_text, name=None):
+        key = self._profile_keys.get(prompt_wav, prompt_text)
+        with self._lock:
+            if key in self._voices:
+                return key
+            # 旧版本无法导出特征，只能在进程内缓存提示音
+            use_store = self.profile_store is not None and self._supports_spk_cache
+            if use_store and self.profile_store.load(self, key):
+                print(f"🔊 已载入音色档案: {key}")
+                return key
+
+            prompt_speech_16k = self._load_wav(prompt_wav, 16000)
+            if self._supports_spk_cache:
+                self.model.add_zero_shot_spk(prompt_text, prompt_speech_16k, key)
+                self._voices[key] = None
+            else:
+                self._voices[key] = prompt_speech_16k
+            print(f"🔊 已计算音色特征: {key} ({prompt_wav})")
+            if use_store:
+                self.profile_store.save(self, key, prompt_wav, prompt_text, name)
+        return key
+
+    def save_profile(self, key, path):
+        self._torch.save(self.model.frontend.spk2info[key], path)
+
+    def load_profile(self, key, path):
+        device = getattr(self.model.frontend, "device", "cpu")
+        self.model.frontend.spk2info[key] = self._torch.load(path, map_location=device)
+        self._voices[key] = None
+
+    def cached_voices(self):
+        with self._lock:
+            return list(self._voices)
+
+    def to_pcm16(self, speech):
+        """将 [1, N] 的浮点语音张量转换为 16bit PCM 字节"""
+        speech = speech.squeeze(0).clamp(-1.0, 1.0)
+        return (speech * 32767).to(self._torch.int16).cpu().numpy().tobytes()
+
+    def synthesize(self, text, prompt_wav, prompt_text):
+        """逐段产出 16bit PCM 字节"""
+        key = self.prepare_voice(prompt_wav, prompt_text)
+        prompt_speech_16k = self._voices[key]
+        if prompt_speech_16k is None:
+            results = self.model.inference_zero_shot(text, "", "", zero_shot_spk_id=key, stream=False)
+        else:
+            results = self.model.inference_zero_shot(text, prompt_text, prompt_speech_16k, stream=False)
+        for result in results:
+            yield self.to_pcm16(result["tts_speech"])
+
+
+BACKENDS = {
+    "cosyvoice": CosyVoiceBackend,
+    "fake": FakeBackend,
+}
+
+
+def create_backend(name="cosyvoice", **kwargs):
+    """按名称创建 TTS 后端"""
+    if name not in BACKENDS:
+        raise ValueError(f"未知的TTS后端: {name}，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+def synthesize_to_wav(backend, text, prompt_wav, prompt_text, output_path):
+    """
+    合成一段文本并写入 WAV 文件
+
+    Returns:
+        (语音段数, 时长秒数)；没有产出任何语音段时返回 (0, 0.0) 且不写文件
+    """
+    segments = 0
+    frames = 0
+    writer = None
+    try:
+        for pcm in backend.synthesize(text, prompt_wav, prompt_text):
+            if writer is None:
+                writer = wave.open(output_path, "wb")
+                writer.setnchannels(CHANNELS)
+                writer.setsampwidth(SAMPLE_WIDTH)
+                writer.setframerate(backend.sample_rate)
+            writer.writeframes(pcm)
+            segments += 1
+            frames += len(pcm) // (SAMPLE_WIDTH * CHANNELS)
+    finally:
+        if writer is not None:
+            writer.close()
+    return segments, frames / backend.sample_rate
+
+
+def split_sentences(text, max_chars=CHUNK_MAX_CHARS):
+    """
+    按句末标点切分文本，并把相邻短句合并成不超过 max_chars 的文本块
+
+    单句超过 max_chars 时保持整句，不在句中截断，避免影响语调。
+    """
+    # 句子保留前导空白，合并后英文句子之间不会粘连
+    sentences = [s for s in SENTENCE_END_RE.split(text) if s and s.strip()]
+    chunks = []
+    current = ""
+    for sentence in sentences:
+        if current.strip() and len(current.strip()) + len(sentence.strip()) > max_chars:
+            chunks.append(current.strip())
+            current = ""
+        current += sentence
+    if current.strip():
+        chunks.append(current.strip())
+    return chunks
+
+
+def _synthesize_chunk(backend, chunk, prompt_wav, prompt_text):
+    """合成一个文本块，返回该块的全部 PCM 字节"""
+    return b"".join(backend.synthesize(chunk, prompt_wav, prompt_text))
+
+
+def synthesize_chunked_to_wav(backend, text, prompt_wav, prompt_text, output_path, workers=2, max_chars=CHUNK_MAX_CHARS):
+    """
+    分句并发合成一段文本，按原顺序流式写入 WAV 文件
+
+    最多同时有 2*workers 个文本块在合成或等待写出，已写出的块立即释放，
+    因此内存占用只与块大小和并发数有关，与整段文本长度无关。
+
+    Returns:
+        (写出的文本块数, 时长秒数)；没有产出任何语音时返回 (0, 0.0) 且不写文件
+    """
+    chunks = split_sentences(text, max_chars)
+    if not chunks:
+        return 0, 0.0
+    # 先注册音色，避免多个线程同时计算同一音色特征
+    backend.prepare_voice(prompt_wav, prompt_text)
+
+    segments = 0
+    frames = 0
+    writer = None
+    max_inflight = max(1, workers) * 2
+    pending = deque()
+    chunk_iter = iter(chunks)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        try:
+            while True:
+                while len(pending) < max_inflight:
+                    chunk = next(chunk_iter, None)
+                    if chunk is None:
+                        break
+                    pending.append(executor.submit(_synthesize_chunk, backend, chunk, prompt_wav, prompt_text))
+                if not pending:
+                    break
+                # 按提交顺序取结果，保证音频顺序与文本一致
+                pcm = pending.popleft().result()
+                if not pcm:
+                    continue
+                if writer is None:
+                    writer = wave.open(output_path, "wb")
+                    writer.setnchannels(CHANNELS)
+                    writer.setsampwidth(SAMPLE_WIDTH)
+                    writer.setframerate(backend.sample_rate)
+                writer.writeframes(pcm)
+                segments += 1
+                frames += len(pcm) // (SAMPLE_WIDTH * CHANNELS)
+        finally:
+            for future in pending:
+                future.cancel()
+            if writer is not None:
+                writer.close()
+    return segments, frames / backend.sample_rate
+
+
+def synthesize_directory(backend, input_dir, output_dir, prompt_wav, prompt_text, log=print, chunk_workers=0):
+    """
+    合成目录下所有 .txt 文件，输出同名 .wav 并写入汇总文件 <输入目录名>.txt
+
+    chunk_workers > 0 时每个文件按句切分后并发合成（见 synthesize_chunked_to_wav），
+    汇总文件在每个文件完成后立即追加，中途失败时已完成页面的时长不会丢失。
+
+    Returns:
+        结果列表，每项为 {'file', 'output_path', 'duration', 'segments'}
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    input_dir_name = os.path.basename(os.path.normpath(input_dir))
+    summary_path = os.path.join(output_dir, f"{input_dir_name}.txt")
+
+    txt_files = sorted([f for f in os.listdir(input_dir) if f.endswith(".txt")])
+    total_files = len(txt_files)
+    results = []
+    with open(summary_path, "w", encoding="utf-8") as summary_file:
+        for idx, fname in enumerate(txt_files, 1):
+            log(f"[{idx}/{total_files}] 正在处理文件: {fname}")
+            with open(os.path.join(input_dir, fname), "r", encoding="utf-8") as f:
+                text = f.read().strip()
+
+            output_wav_name = fname.replace(".txt", ".wav")
+            output_wav_path = os.path.join(output_dir, output_wav_name)
+            if chunk_workers > 0:
+                segments, duration_sec = synthesize_chunked_to_wav(
+                    backend, text, prompt_wav, prompt_text, output_wav_path, workers=chunk_workers
+                )
+            else:
+                segments, duration_sec = synthesize_to_wav(backend, text, prompt_wav, prompt_text, output_wav_path)
+            if not segments:
+                log("⚠️ 无可用语音段，跳过")
+                continue
+
+            summary_file.write(("\n" if results else "") + f"{output_wav_name}\t{duration_sec:.2f}s")
+            summary_file.flush()
+            results.append({'file': fname, 'output_path': output_wav_path, 'duration': duration_sec, 'segments': segments})
+            log(f"✅ 合成完成，共 {segments} 段，已保存至: {output_wav_path}（{duration_sec:.2f}s）")
+
+    log(f"✅ 汇总信息已写入: {summary_path}")
+
+    return results
@@ -0,0 +1,214 @@
+# 常驻 TTS worker：模型只加载一次，多个任务通过本地 HTTP 接口排队合成
+#
+# 启动:
+#   python tts_worker.py --port 50021                 # 使用 CosyVoice2
+#   python tts_worker.py --port 50021 --backend fake  # CPU 环境联调
+#
+# 接口:
+#   GET  /health          后端、队列深度、已缓存音色
+#   POST /synthesize      提交合成任务，返回 job_id；body 中 "wait": true 时阻塞到完成，
+#                         "chunk_workers": N 时按句切分并发合成
+#   GET  /jobs/<job_id>   查询任务状态和结果
+
+import os
+import sys
+import json
+import time
+import uuid
+import queue
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from tts_engine import create_backend, synthesize_directory, synthesize_to_wav, synthesize_chunked_to_wav
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 50021
+# 已完成任务最多保留的数量，避免常驻进程内存无限增长
+MAX_FINISHED_JOBS = 200
+
+
+class TTSWorker:
+    """
+    持有一个 TTS 后端和任务队列
+
+    任务按 FIFO 顺序由合成线程依次执行（GPU 上同一时刻只跑一个任务），
+    每个任务可包含一个目录或一批 {text, output_path} 条目。
+    """
+
+    def __init__(self, backend, num_threads=1):
+        self.backend = backend
+        self.queue = queue.Queue()
+        self.jobs = {}
+        self.finished_order = []
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in range(num_threads):
+            thread = threading.Thread(target=self._run, name=f"tts-worker-{i}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, request):
+        """校验请求并入队，返回任务字典"""
+        voice = request.get("voice") or {}
+        if not voice.get("prompt_wav") or voice.get("prompt_text") is None:
+            raise ValueError("voice 必须包含 prompt_wav 和 prompt_text")
+        if not request.get("items") and not (request.get("input_dir") and request.get("output_dir")):
+            raise ValueError("需要提供 items 列表，或 input_dir 与 output_dir")
+
+        job = {
+            'job_id': str(uuid.uuid4()),
+            'status': 'queued',
+            'request': request,
+            'results': [],
+            'error': None,
+            'submitted_at': time.time(),
+            'started_at': None,
+            'finished_at': None,
+            'done_event': threading.Event(),
+        }
+        with self.lock:
+            self.jobs[job['job_id']] = job
+        self.queue.put(job['job_id'])
+        return job
+
+    def get_job(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def job_view(self, job):
+        """返回可序列化的任务信息"""
+        with self.lock:
+            view = {k: v for k, v in job.items() if k not in ('request', 'done_event')}
+            if job['status'] == 'queued':
+                view['queue_position'] = list(self.queue.queue).index(job['job_id']) + 1 \
+                    if job['job_id'] in self.queue.queue else None
+            return view
+
+    def stats(self):
+        with self.lock:
+            statuses = {}
+            for job in self.jobs.values():
+                statuses[job['status']] = statuses.get(job['status'], 0) + 1
+        return {
+            'backend': self.backend.name,
+            'sample_rate': self.backend.sample_rate,
+            'queue_depth': self.queue.qsize(),
+            'jobs': statuses,
+            'cached_voices': self.backend.cached_voices(),
+        }
+
+    def _run(self):
+        while True:
+            job_id = self.queue.get()
+            job = self.get_job(job_id)
+            if job is None:
+                continue
+            with self.lock:
+                job['status'] = 'running'
+                job['started_at'] = time.time()
+            try:
+                job['results'] = self._process(job['request'])
+                status = 'completed'
+            except Exception as e:
+                job['error'] = str(e)
+                status = 'failed'
+                print(f"❌ 任务 {job_id} 失败: {e}")
+            with self.lock:
+                job['status'] = status
+                job['finished_at'] = time.time()
+                self.finished_order.append(job_id)
+                while len(self.finished_order) > MAX_FINISHED_JOBS:
+                    self.jobs.pop(self.finished_order.pop(0), None)
+            job['done_event'].set()
+
+    def _process(self, request):
+        voice = request["voice"]
+        prompt_wav, prompt_text = voice["prompt_wav"], voice["prompt_text"]
+        print(f"🔊 使用音色: {voice.get('name', 'default')} ({prompt_wav})")
+        # 先按名称注册音色档案，后续合成直接复用
+        self.backend.prepare_voice(prompt_wav, prompt_text, name=voice.get('name'))
+
+        # chunk_workers > 0 时按句并发合成
+        chunk_workers = int(request.get("chunk_workers") or 0)
+        if request.get("input_dir"):
+            return synthesize_directory(self.backend, request["input_dir"], request["output_dir"], prompt_wav, prompt_text,
+                                        chunk_workers=chunk_workers)
+
+        results = []
+        for item in request["items"]:
+            os.makedirs(os.path.dirname(os.path.abspath(item["output_path"])), exist_ok=True)
+            if chunk_workers > 0:
+                segments, duration = synthesize_chunked_to_wav(self.backend, item["text"], prompt_wav, prompt_text,
+                                                               item["output_path"], workers=chunk_workers)
+            else:
+                segments, duration = synthesize_to_wav(self.backend, item["text"], prompt_wav, prompt_text, item["output_path"])
+            results.append({'output_path': item["output_path"], 'duration': duration, 'segments': segments})
+        return results
+
+
+def make_handler(worker):
+    class Handler(BaseHTTPRequestHandler):
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                return self._send_json(200, {'status': 'ok', **worker.stats()})
+            if self.path.startswith("/jobs/"):
+                job = worker.get_job(self.path[len("/jobs/"):])
+                if job is None:
+                    return self._send_json(404, {'error': '任务不存在'})
+                return self._send_json(200, worker.job_view(job))
+            return self._send_json(404, {'error': '未知接口'})
+
+        def do_POST(self):
+            if self.path != "/synthesize":
+                return self._send_json(404, {'error': '未知接口'})
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                job = worker.submit(request)
+            except (ValueError, json.JSONDecodeError) as e:
+                return self._send_json(400, {'error': str(e)})
+
+            if request.get("wait"):
+                job['done_event'].wait()
+            return self._send_json(200 if request.get("wait") else 202, worker.job_view(job))
+
+        def log_message(self, format, *args):
+            # 只打印任务相关日志，不打印每个HTTP请求
+            pass
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="常驻 TTS worker 服务")
+    parser.add_argument("--host", default=DEFAULT_HOST, help=f"监听地址 (默认: {DEFAULT_HOST})")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help=f"监听端口 (默认: {DEFAULT_PORT})")
+    parser.add_argument("--backend", default="cosyvoice", choices=["cosyvoice", "fake"], help="TTS后端 (默认: cosyvoice)")
+    parser.add_argument("--threads", type=int, default=1, help="合成线程数 (默认: 1)")
+    args = parser.parse_args()
+
+    if args.backend == "cosyvoice":
+        os.environ.setdefault("CUDA_VISIBLE_DEVICES", "1")
+
+    backend = create_backend(args.backend)
+    worker = TTSWorker(backend, num_threads=args.threads)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(worker))
+    print(f"✅ TTS worker 已启动: http://{args.host}:{args.port} (后端: {backend.name})")
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 TTS worker 已停止")
+
+
+if __name__ == "__main__":
+    main()
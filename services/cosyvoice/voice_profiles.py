@@ -0,0 +1,240 @@
+# 音色档案缓存：每个音色的提示音特征只计算一次并持久化到磁盘
+#
+# 档案按 (提示音音频内容, 提示文本) 的哈希寻址，预设音色和用户上传的自定义音色一视同仁。
+#
+# 用法:
+#   python voice_profiles.py warm --preset all                       # 预热 female/male/child 预设音色
+#   python voice_profiles.py warm --prompt_wav a.wav --prompt_text "..." --name my_voice
+#   python voice_profiles.py list
+#   python voice_profiles.py evict <key或name>  |  python voice_profiles.py evict --all
+
+import os
+import json
+import time
+import hashlib
+import argparse
+import threading
+
+PROFILE_DIR = os.environ.get(
+    "COSYVOICE_PROFILE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "edupal", "voice_profiles")
+)
+
+
+def profile_key(prompt_wav, prompt_text):
+    """根据提示音音频内容和提示文本计算档案键"""
+    digest = hashlib.sha256()
+    with open(prompt_wav, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(b"\0")
+    digest.update(prompt_text.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+class ProfileKeyCache:
+    """
+    缓存 profile_key 的结果，避免分句合成时每个文本块都重新读取并哈希提示音
+
+    以 (绝对路径, 提示文本) 为键，记录计算时文件的修改时间和大小；文件变化后重新计算。
+    """
+
+    def __init__(self):
+        self._keys = {}
+        self._lock = threading.Lock()
+
+    def get(self, prompt_wav, prompt_text):
+        path = os.path.abspath(prompt_wav)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        with self._lock:
+            cached = self._keys.get((path, prompt_text))
+        if cached is not None and cached[0] == stamp:
+            return cached[1]
+        key = profile_key(path, prompt_text)
+        with self._lock:
+            self._keys[(path, prompt_text)] = (stamp, key)
+        return key
+
+
+def preset_voices():
+    """与 continue_pipeline.sh 中一致的预设音色"""
+    from tts_engine import COSYVOICE_ROOT
+    return {
+        'female': {
+            'prompt_wav': os.path.join(COSYVOICE_ROOT, "asset", "zero_shot_prompt.wav"),
+            'prompt_text': "希望你以后能够做的比我还好呦。",
+        },
+        'male': {
+            'prompt_wav': os.path.join(COSYVOICE_ROOT, "asset", "cross_lingual_prompt.wav"),
+            'prompt_text': "在那之后，完全收购那家公司，因此保持管理层的一致性，利益与即将加入家族的资产保持一致。这就是我们有时不买下全部的原因。",
+        },
+        'child': {
+            'prompt_wav': os.path.join(COSYVOICE_ROOT, "asset", "child_prompt.wav"),
+            'prompt_text': "这是一个示例童声。",
+        },
+    }
+
+
+class VoiceProfileStore:
+    """
+    磁盘上的音色档案目录
+
+    每个档案由后端写出的特征文件 <key>.<后端名> 和元数据 <key>.json 组成；
+    特征文件的序列化格式由后端的 save_profile/load_profile 决定。
+    """
+
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+
+    def feature_path(self, key, backend_name):
+        return os.path.join(self.directory, f"{key}.{backend_name}")
+
+    def meta_path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def has(self, key, backend_name):
+        return os.path.exists(self.feature_path(key, backend_name))
+
+    def load(self, backend, key):
+        """把档案载入后端；不存在或载入失败时返回False"""
+        path = self.feature_path(key, backend.name)
+        if not os.path.exists(path):
+            return False
+        try:
+            backend.load_profile(key, path)
+        except Exception as e:
+            print(f"⚠️ 音色档案 {key} 载入失败，将重新计算: {e}")
+            return False
+        self._touch(key)
+        return True
+
+    def save(self, backend, key, prompt_wav, prompt_text, name=None):
+        """让后端写出特征文件，并记录元数据；写临时文件后原子替换，避免并发读到半个文件"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.feature_path(key, backend.name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        backend.save_profile(key, tmp_path)
+        os.replace(tmp_path, path)
+
+        meta = self.read_meta(key) or {'key': key, 'created_at': time.time(), 'backends': []}
+        meta.update({'prompt_wav': os.path.abspath(prompt_wav), 'prompt_text': prompt_text, 'last_used': time.time()})
+        if name:
+            meta['name'] = name
+        if backend.name not in meta['backends']:
+            meta['backends'].append(backend.name)
+        self._write_meta(key, meta)
+
+    def read_meta(self, key):
+        try:
+            with open(self.meta_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+    def _write_meta(self, key, meta):
+        with self._lock:
+            tmp_path = f"{self.meta_path(key)}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.meta_path(key))
+
+    def _touch(self, key):
+        meta = self.read_meta(key)
+        if meta is not None:
+            meta['last_used'] = time.time()
+            self._write_meta(key, meta)
+
+    def list(self):
+        """返回所有档案的元数据，按最近使用时间倒序"""
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for fname in os.listdir(self.directory):
+            if fname.endswith(".json"):
+                meta = self.read_meta(fname[:-len(".json")])
+                if meta is not None:
+                    profiles.append(meta)
+        return sorted(profiles, key=lambda m: m.get('last_used', 0), reverse=True)
+
+    def evict(self, key_or_name):
+        """删除与键或名称匹配的档案，返回删除的档案键列表"""
+        removed = []
+        for meta in self.list():
+            if key_or_name in (meta['key'], meta.get('name')):
+                for fname in os.listdir(self.directory):
+                    if fname.startswith(meta['key'] + "."):
+                        os.remove(os.path.join(self.directory, fname))
+                removed.append(meta['key'])
+        return removed
+
+
+def cmd_warm(args, store):
+    from tts_engine import create_backend
+
+    if args.preset:
+        presets = preset_voices()
+        names = list(presets) if args.preset == "all" else [args.preset]
+        voices = [(name, presets[name]['prompt_wav'], presets[name]['prompt_text']) for name in names]
+    else:
+        if not args.prompt_wav or args.prompt_text is None:
+            raise SystemExit("warm 需要 --preset，或同时提供 --prompt_wav 和 --prompt_text")
+        voices = [(args.name, args.prompt_wav, args.prompt_text)]
+
+    backend = create_backend(args.backend, profile_store=store)
+    for name, prompt_wav, prompt_text in voices:
+        if not os.path.exists(prompt_wav):
+            print(f"⚠️ 跳过 {name}: 提示音文件不存在 {prompt_wav}")
+            continue
+        key = backend.prepare_voice(prompt_wav, prompt_text, name=name)
+        print(f"✅ {name or '(未命名)'}: {key}")
+
+
+def cmd_list(args, store):
+    profiles = store.list()
+    if not profiles:
+        print(f"(没有音色档案: {store.directory})")
+        return
+    for meta in profiles:
+        last_used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta.get('last_used', 0)))
+        print(f"{meta['key']}\t{meta.get('name', '-')}\t{','.join(meta.get('backends', []))}\t{last_used}\t{meta.get('prompt_wav')}")
+
+
+def cmd_evict(args, store):
+    if args.all:
+        targets = [meta['key'] for meta in store.list()]
+    elif args.target:
+        targets = [args.target]
+    else:
+        raise SystemExit("evict 需要指定档案键/名称，或使用 --all")
+    removed = []
+    for target in targets:
+        removed.extend(store.evict(target))
+    print(f"🗑️ 已删除 {len(removed)} 个音色档案" + (f": {', '.join(removed)}" if removed else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="管理 CosyVoice 音色档案缓存")
+    parser.add_argument("--profile_dir", default=PROFILE_DIR, help=f"档案目录 (默认: {PROFILE_DIR})")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    warm = subparsers.add_parser("warm", help="预先计算并保存音色档案")
+    warm.add_argument("--preset", choices=["all", "female", "male", "child"], help="预热预设音色")
+    warm.add_argument("--prompt_wav", help="自定义音色的提示音频路径")
+    warm.add_argument("--prompt_text", help="自定义音色的提示文本")
+    warm.add_argument("--name", help="档案名称，便于 list/evict")
+    warm.add_argument("--backend", default="cosyvoice", choices=["cosyvoice", "fake"], help="TTS后端")
+
+    subparsers.add_parser("list", help="列出已缓存的音色档案")
+
+    evict = subparsers.add_parser("evict", help="删除音色档案")
+    evict.add_argument("target", nargs="?", help="档案键或名称")
+    evict.add_argument("--all", action="store_true", help="删除全部档案")
+
+    args = parser.parse_args()
+    store = VoiceProfileStore(args.profile_dir)
+    {'warm': cmd_warm, 'list': cmd_list, 'evict': cmd_evict}[args.command](args, store)
+
+
+if __name__ == "__main__":
+    main()
@@ -1519,6 +1519,7 @@ window.playOrPausePreview = playOrPausePreview;
 // 当前处理任务
 let currentProcessing = null;
 let processingInterval = null;
+let processingEventSource = null; // 服务端推送的状态事件流
 
 async function startProcessing(filename, title) {
     try {
@@ -1769,12 +1770,98 @@ function toggleLogDisplay() {
 }
 
 function startStatusPolling(processId) {
-    // 清除之前的轮询
+    // 清除之前的轮询或事件流
+    stopStatusPolling();
+    
+    // 优先使用服务端推送（SSE），浏览器不支持或连接失败时退回轮询
+    if (window.EventSource) {
+        startStatusStream(processId);
+    } else {
+        startIntervalPolling(processId);
+    }
+}
+
+function stopStatusPolling() {
     if (processingInterval) {
         clearInterval(processingInterval);
+        processingInterval = null;
+    }
+    if (processingEventSource) {
+        processingEventSource.close();
+        processingEventSource = null;
+    }
+}
+
+function handleStatusData(data) {
+    if (data.success && !data.error) {
+        updateProcessingProgress(data);
+        
+        // 如果处理完成、失败或已取消，停止轮询（与 job_events.TERMINAL_STATUSES 一致）
+        if (data.status === 'completed' || data.status === 'failed' || data.status === 'cancelled') {
+            console.log('处理完成，停止轮询');
+            stopStatusPolling();
+            // 同时清除时间更新定时器
+            if (timeUpdateInterval) {
+                clearInterval(timeUpdateInterval);
+                timeUpdateInterval = null;
+            }
+            onProcessingComplete(data);
+        }
+    } else {
+        console.error('获取处理状态失败:', data.error || '未知错误');
+        if (data.error) {
+            // 如果任务不存在，停止轮询
+            if (data.error.includes('不存在')) {
+                stopStatusPolling();
+                // 同时清除时间更新定时器
+                if (timeUpdateInterval) {
+                    clearInterval(timeUpdateInterval);
+                    timeUpdateInterval = null;
+                }
+            }
+        }
     }
+}
+
+function startStatusStream(processId) {
+    // 服务端先推送完整状态(snapshot)，之后只推送变化的字段(update)和新增日志(log)
+    const source = new EventSource(`/api/v1/events/${processId}`);
+    let state = null;
+    processingEventSource = source;
     
-    // 开始新的轮询
+    source.addEventListener('snapshot', (e) => {
+        state = JSON.parse(e.data);
+        handleStatusData(state);
+    });
+    source.addEventListener('update', (e) => {
+        if (!state) return;
+        Object.assign(state, JSON.parse(e.data));
+        handleStatusData(state);
+    });
+    source.addEventListener('log', (e) => {
+        if (!state) return;
+        state.recent_logs = (state.recent_logs || []).concat([JSON.parse(e.data)]).slice(-30);
+        handleStatusData(state);
+    });
+    source.addEventListener('end', () => {
+        source.close();
+        if (processingEventSource === source) {
+            processingEventSource = null;
+        }
+    });
+    source.onerror = () => {
+        // 任务结束后服务端主动关闭连接，此时不再重连
+        if (processingEventSource !== source) {
+            source.close();
+            return;
+        }
+        console.warn('状态事件流中断，改为轮询');
+        stopStatusPolling();
+        startIntervalPolling(processId);
+    };
+}
+
+function startIntervalPolling(processId) {
     processingInterval = setInterval(async () => {
         try {
             console.log(`轮询处理状态: ${processId}`);
@@ -1782,37 +1869,7 @@ function startStatusPolling(processId) {
             const data = await response.json();
             
             console.log('API响应数据:', data);
-            
-            if (data.success && !data.error) {
-                updateProcessingProgress(data);
-                
-                // 如果处理完成或失败，停止轮询
-                if (data.status === 'completed' || data.status === 'failed') {
-                    console.log('处理完成，停止轮询');
-                    clearInterval(processingInterval);
-                    processingInterval = null;
-                    // 同时清除时间更新定时器
-                    if (timeUpdateInterval) {
-                        clearInterval(timeUpdateInterval);
-                        timeUpdateInterval = null;
-                    }
-                    onProcessingComplete(data);
-                }
-            } else {
-                console.error('获取处理状态失败:', data.error || '未知错误');
-                if (data.error) {
-                    // 如果任务不存在，停止轮询
-                    if (data.error.includes('不存在')) {
-                        clearInterval(processingInterval);
-                        processingInterval = null;
-                        // 同时清除时间更新定时器
-                        if (timeUpdateInterval) {
-                            clearInterval(timeUpdateInterval);
-                            timeUpdateInterval = null;
-                        }
-                    }
-                }
-            }
+            handleStatusData(data);
         } catch (error) {
             console.error('状态轮询错误:', error);
         }
@@ -1851,7 +1908,7 @@ function updateProcessingProgress(statusData) {
     // 检查是否进入等待编辑状态
     if (statusData.status === 'waiting_for_edit' && statusData.stage === 'waiting_for_edit') {
         // 停止轮询，显示编辑界面
-        clearInterval(processingInterval);
+        stopStatusPolling();
         processingInterval = null;
         // 同时清除时间更新定时器
         if (timeUpdateInterval) {
@@ -1865,7 +1922,7 @@ function updateProcessingProgress(statusData) {
     // 检查是否进入等待反馈编辑状态
     if (statusData.status === 'waiting_feedback') {
         // 停止轮询，显示反馈编辑界面
-        clearInterval(processingInterval);
+        stopStatusPolling();
         processingInterval = null;
         // 同时清除时间更新定时器
         if (timeUpdateInterval) {
@@ -2436,6 +2493,18 @@ function onProcessingComplete(statusData) {
             currentProcessing.button.style.backgroundColor = '#dc3545';
             currentProcessing.button.style.color = 'white';
         }
+        
+    } else if (statusData.status === 'cancelled') {
+        // 任务在其他地方（如通过API）被取消：与 cancelProcessing 一样恢复按钮并关闭状态卡片
+        if (currentProcessing && currentProcessing.button) {
+            currentProcessing.button.textContent = '开始处理';
+            currentProcessing.button.disabled = false;
+            currentProcessing.button.style.backgroundColor = '';
+            currentProcessing.button.style.color = '';
+        }
+        hideProcessingProgress();
+        currentProcessing = null;
+        showSuccess('✋ 任务已取消');
     }
     
     // 保留当前处理状态供查看结果使用
@@ -2697,10 +2766,17 @@ function retryProcessing() {
 
 async function cancelProcessing() {
     if (currentProcessing) {
-        // 停止轮询
-        if (processingInterval) {
-            clearInterval(processingInterval);
-            processingInterval = null;
+        // 停止轮询并关闭事件流（SSE模式下 processingInterval 始终为空）
+        stopStatusPolling();
+        
+        // 通知服务端取消任务，否则任务会继续在后台运行
+        const processId = currentProcessing.processId;
+        if (processId) {
+            try {
+                await fetch(`/api/v1/cancel/${processId}`, { method: 'POST' });
+            } catch (error) {
+                console.error('取消任务请求失败:', error);
+            }
         }
         
         // 同时清除时间更新定时器
@@ -4531,7 +4607,8 @@ async function submitAiEdit() {
     document.getElementById('aiEditLoading').classList.remove('hidden');
 
     try {
-        const response = await fetch('/editor/ai-edit', {
+        // 使用SSE流式接口，边生成边显示修改后的代码
+        const response = await fetch('/editor/ai-edit-stream', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -4543,20 +4620,54 @@ async function submitAiEdit() {
             })
         });
 
-        const data = await response.json();
-
-        if (data.success) {
-            aiEditState.modifiedCode = data.modified_code;
-            displayEditResult();
-        } else {
+        if (!response.ok) {
+            const data = await response.json();
             throw new Error(data.error);
         }
 
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder('utf-8');
+        let buffer = '';
+        let partialCode = '';
+        let finished = false;
+
+        while (!finished) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // SSE事件以空行分隔
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const raw of events) {
+                if (!raw.startsWith('data: ')) continue;
+                const event = JSON.parse(raw.slice(6));
+                if (event.error) {
+                    throw new Error(event.error);
+                }
+                if (event.delta) {
+                    partialCode += event.delta;
+                    aiEditState.modifiedCode = partialCode;
+                    displayEditResult();
+                }
+                if (event.done) {
+                    aiEditState.modifiedCode = event.modified_code;
+                    displayEditResult();
+                    finished = true;
+                }
+            }
+        }
+
+        if (!finished) {
+            throw new Error('连接中断，未收到完整结果');
+        }
+
     } catch (error) {
         showError(`智能体编辑失败: ${error.message}`);
         console.error('AI edit error:', error);
         
         // 返回到输入界面
+        document.getElementById('aiEditResult').classList.add('hidden');
         document.getElementById('aiEditLoading').classList.add('hidden');
         document.querySelector('.ai-edit-request').classList.remove('hidden');
     }
@@ -4,9 +4,25 @@
 import os
 import sys
 import glob
+import time
+import argparse
 import subprocess
 import shutil
+import resource
+import tempfile
+import threading
+import wave
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from audio_video_sync import parse_speech_txt
+from Paper2Video import pipeline_progress
+
+# 并行合并时保证输出不交错
+print_lock = threading.Lock()
+
+# 单次组装模式下统一的音频格式（concat滤镜要求各段音频参数一致）
+SINGLE_PASS_SAMPLE_RATE = 44100
 
 def check_ffmpeg():
     """检查ffmpeg是否安装"""
@@ -77,7 +93,8 @@ def find_matching_files(video_dir, audio_dir):
     matches = []
     
     # 获取所有mp4文件
-    video_files = glob.glob(os.path.join(video_dir, "*.mp4"))
+    # 排序保证每次运行的处理顺序和结果顺序一致
+    video_files = sorted(glob.glob(os.path.join(video_dir, "*.mp4")))
     
     for video_file in video_files:
         # 提取视频文件的基础名称（不含扩展名）
@@ -96,51 +113,74 @@ def find_matching_files(video_dir, audio_dir):
     
     return matches
 
-def merge_video_audio(video_file, audio_file, output_file):
-    """使用ffmpeg合并视频和音频"""
+def merge_and_pad(video_file, audio_file, output_file):
+    """
+    一次ffmpeg调用完成视频音频合并和apad填充
+
+    音频用静音补齐，-shortest 截到视频长度；取代了原先先合并再单独填充的两次调用，
+    省去中间文件和一次完整的解码/编码。
+
+    Returns:
+        (是否成功, 错误信息)
+    """
     cmd = [
         'ffmpeg',
         '-i', video_file,
         '-i', audio_file,
         '-map', '0:v',
         '-map', '1:a',
-        '-c:v', 'copy',
-        '-c:a', 'aac',
-        '-strict', 'experimental',
-        '-y',  # 覆盖输出文件
-        output_file
-    ]
-    
-    try:
-        print(f"🔧 正在合并: {os.path.basename(video_file)} + {os.path.basename(audio_file)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        print(f"✅ 合并成功: {os.path.basename(output_file)}")
-        return True
-    except subprocess.CalledProcessError as e:
-        print(f"❌ 合并失败: {e}")
-        print(f"   错误输出: {e.stderr}")
-        return False
-
-def pad_video(input_file, output_file):
-    """对视频进行填充处理"""
-    cmd = [
-        'ffmpeg',
-        '-i', input_file,
         '-af', 'apad',
+        '-c:a', 'aac',
         '-shortest',
         '-y',  # 覆盖输出文件
         output_file
     ]
     
     try:
-        print(f"🔧 正在填充: {os.path.basename(input_file)}")
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        print(f"✅ 填充成功: {os.path.basename(output_file)}")
-        return True
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return True, None
     except subprocess.CalledProcessError as e:
-        print(f"❌ 填充失败: {e}")
-        print(f"   错误输出: {e.stderr}")
-        return False
+        return False, f"{e}\n   错误输出: {e.stderr}"
+
+def mux_pages(matches, output_video_dir, jobs=4):
+    """
+    并行合并所有页面的视频和音频（合并+填充单次完成）
+
+    Returns:
+        与 matches 顺序一致的结果列表，每项为 {'basename', 'output_file', 'success', 'duration', 'error'}
+    """
+    total_count = len(matches)
+    results = [None] * total_count
+
+    def run(index, video_file, audio_file, basename):
+        output_file = os.path.join(output_video_dir, f"{basename}-padded.mp4")
+        start_time = time.time()
+        success, error = merge_and_pad(video_file, audio_file, output_file)
+        return index, {
+            'basename': basename,
+            'output_file': output_file,
+            'success': success,
+            'duration': time.time() - start_time,
+            'error': error,
+        }
+
+    completed = 0
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        futures = [
+            executor.submit(run, i, video_file, audio_file, basename)
+            for i, (video_file, audio_file, basename) in enumerate(matches)
+        ]
+        for future in as_completed(futures):
+            index, result = future.result()
+            results[index] = result
+            completed += 1
+            with print_lock:
+                if result['success']:
+                    print(f"[{completed}/{total_count}] ✅ 合并+填充成功: {os.path.basename(result['output_file'])} ({result['duration']:.1f}s)")
+                else:
+                    print(f"[{completed}/{total_count}] ❌ 合并失败: {result['basename']} - {result['error']}")
+
+    return results
 
 def categorize_videos(video_files):
     """按照Introduction、Method、Experiment、Conclusion分类视频文件"""
@@ -236,23 +276,182 @@ def concat_videos(filelist_path, output_dir):
         print(f"   错误输出: {e.stderr}")
         return False
 
+def probe_duration(media_file):
+    """用ffprobe读取媒体时长（秒），失败时返回None"""
+    cmd = [
+        'ffprobe', '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'default=noprint_wrappers=1:nokey=1',
+        media_file
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return float(result.stdout.strip())
+    except (subprocess.CalledProcessError, FileNotFoundError, ValueError):
+        return None
+
+def wav_duration(audio_file):
+    """读取WAV时长（秒），无法解析时返回None"""
+    try:
+        with wave.open(audio_file, 'rb') as w:
+            return w.getnframes() / float(w.getframerate())
+    except (wave.Error, EOFError, OSError):
+        return None
+
+def order_pages(matches):
+    """按 file.txt 的顺序（分类 + 分类内按填充后文件名排序）排列页面"""
+    by_padded = {f"{basename}-padded.mp4": (video_file, audio_file, basename)
+                 for video_file, audio_file, basename in matches}
+    categories = categorize_videos(list(by_padded))
+    return [by_padded[name]
+            for category in ['Introduction', 'Method', 'Experiment', 'Conclusion']
+            for name in categories[category]]
+
+def build_single_pass_command(pages, speech_durations, output_file):
+    """
+    构造一次完成所有页面合并、填充和串联的ffmpeg命令
+
+    每页长度取视频时长（与 apad + -shortest 的结果一致）；音频时长优先取 Speech.txt，
+    据此计算需要补的静音长度，音频比视频长时截断到视频长度。
+
+    Returns:
+        (ffmpeg命令列表, 每页信息列表)
+    """
+    cmd = ['ffmpeg']
+    filters = []
+    concat_inputs = []
+    page_info = []
+    for i, (video_file, audio_file, basename) in enumerate(pages):
+        cmd += ['-i', video_file, '-i', audio_file]
+        video_duration = probe_duration(video_file)
+        audio_duration = speech_durations.get(os.path.basename(audio_file)) or wav_duration(audio_file)
+
+        audio_chain = f"[{2 * i + 1}:a]aresample={SINGLE_PASS_SAMPLE_RATE},aformat=channel_layouts=mono"
+        if video_duration is not None and audio_duration is not None:
+            pad = max(0.0, video_duration - audio_duration)
+            audio_chain += f",apad=pad_dur={pad:.3f},atrim=end={video_duration:.3f}"
+        elif video_duration is not None:
+            audio_chain += f",apad,atrim=end={video_duration:.3f}"
+        else:
+            raise RuntimeError(f"无法获取视频时长: {video_file}")
+        filters.append(f"{audio_chain},asetpts=PTS-STARTPTS[a{i}]")
+        # 视频直接接入concat，保留原始帧率
+        concat_inputs.append(f"[{2 * i}:v][a{i}]")
+        page_info.append({'basename': basename, 'video_duration': video_duration, 'audio_duration': audio_duration})
+
+    filters.append(f"{''.join(concat_inputs)}concat=n={len(pages)}:v=1:a=1[outv][outa]")
+    cmd += [
+        '-filter_complex', ';'.join(filters),
+        '-map', '[outv]',
+        '-map', '[outa]',
+        '-c:a', 'aac',
+        '-y',  # 覆盖输出文件
+        output_file
+    ]
+    return cmd, page_info
+
+def assemble_single_pass(matches, audio_dir, output_dir):
+    """
+    单次ffmpeg调用直接由场景视频和WAV生成 Full.mp4，不写任何逐页中间文件
+    """
+    speech_durations = dict(parse_speech_txt(os.path.join(audio_dir, "Speech.txt"))) \
+        if os.path.exists(os.path.join(audio_dir, "Speech.txt")) else {}
+    pages = order_pages(matches)
+    output_file = os.path.join(output_dir, "Full.mp4")
+    try:
+        cmd, page_info = build_single_pass_command(pages, speech_durations, output_file)
+    except RuntimeError as e:
+        print(f"❌ 单次组装失败: {e}")
+        return False
+
+    print(f"🔧 单次组装 {len(pages)} 个页面 → Full.mp4")
+    for info in page_info:
+        audio = f"{info['audio_duration']:.2f}s" if info['audio_duration'] is not None else "未知"
+        print(f"   - {info['basename']}: 视频 {info['video_duration']:.2f}s, 音频 {audio}")
+    try:
+        subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except subprocess.CalledProcessError as e:
+        print(f"❌ 单次组装失败: {e}")
+        print(f"   错误输出: {e.stderr}")
+        return False
+    file_size = os.path.getsize(output_file) / (1024 * 1024)  # MB
+    print(f"✅ 单次组装成功: Full.mp4 ({file_size:.1f} MB)")
+    return True
+
+def assemble_multi_pass(matches, output_dir, jobs=4):
+    """现有流程（逐页合并填充 → file.txt → concat），供基准测试调用"""
+    results = mux_pages(matches, output_dir, jobs=jobs)
+    padded_videos = [r['output_file'] for r in results if r['success']]
+    if not padded_videos:
+        return False
+    categories = categorize_videos(padded_videos)
+    return generate_filelist(categories, output_dir) and \
+        concat_videos(os.path.join(output_dir, "file.txt"), output_dir)
+
+def directory_bytes(directory):
+    total = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+def benchmark_assembly(matches, audio_dir, output_video_dir, jobs=4):
+    """
+    对比现有逐页流程与单次组装的磁盘写入量和耗时
+
+    写入量统计两项：输出目录中产生的文件总大小（含逐页中间文件），以及子进程的块设备写出
+    （getrusage 的 ru_oublock，受页缓存影响可能偏小，仅供参考）。
+    """
+    modes = [
+        ('逐页合并+concat', lambda d: assemble_multi_pass(matches, d, jobs=jobs)),
+        ('单次组装', lambda d: assemble_single_pass(matches, audio_dir, d)),
+    ]
+    rows = []
+    for name, run in modes:
+        bench_dir = tempfile.mkdtemp(prefix="assembly_bench_", dir=output_video_dir)
+        print(f"\n⏱️ 基准测试: {name}")
+        blocks_before = resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock
+        start_time = time.time()
+        ok = run(bench_dir)
+        elapsed = time.time() - start_time
+        blocks = resource.getrusage(resource.RUSAGE_CHILDREN).ru_oublock - blocks_before
+        rows.append((name, ok, elapsed, directory_bytes(bench_dir), blocks * 512))
+        shutil.rmtree(bench_dir, ignore_errors=True)
+
+    print()
+    print("📊 基准测试结果:")
+    print(f"   {'模式':<16}{'成功':<6}{'耗时(s)':>10}{'写入文件(MB)':>16}{'块设备写出(MB)':>18}")
+    for name, ok, elapsed, file_bytes, block_bytes in rows:
+        print(f"   {name:<16}{'✅' if ok else '❌':<6}{elapsed:>10.1f}"
+              f"{file_bytes / (1024 * 1024):>16.1f}{block_bytes / (1024 * 1024):>18.1f}")
+    return rows
+
 def main():
     # 检查参数
-    if len(sys.argv) != 2:
+    if len(sys.argv) < 2:
         print("❌ 错误: 请提供输出目录名称")
         print("📝 使用方法: python3 video_audio_merge.py <OUTPUT_DIR>")
         print("📝 示例: python3 video_audio_merge.py ChatDev_short_output")
         print()
         print("🎯 功能说明:")
         print("   0. 复制cover目录下的音频文件到Speech_Audio目录")
-        print("   1. 合并视频和音频文件")
-        print("   2. 对合并后的视频进行填充处理")
+        print("   1-2. 并行合并视频和音频，并在同一次ffmpeg调用中进行填充处理 (--jobs N 控制并发数)")
         print("   3. 按Introduction/Method/Experiment/Conclusion分类生成file.txt")
         print("      (每个部分前面会先添加对应的cover场景视频)")
         print("   4. 串联所有视频为完整的教学视频 (Full.mp4)")
+        print("   --single-pass: 单次ffmpeg调用直接生成Full.mp4；--benchmark: 对比两种方式")
         sys.exit(1)
     
-    output_dir = sys.argv[1]
+    parser = argparse.ArgumentParser(description="合并视频和音频，生成完整教学视频")
+    parser.add_argument("output_dir", help="Paper2Video 下的输出目录名称")
+    parser.add_argument("--jobs", "-j", type=int, default=min(4, os.cpu_count() or 1),
+                        help="同时运行的ffmpeg进程数 (默认: min(4, CPU核数))")
+    parser.add_argument("--single-pass", action="store_true",
+                        help="单次ffmpeg调用由场景视频和WAV直接生成Full.mp4，不生成逐页中间文件")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="对比逐页流程与单次组装的磁盘写入量和耗时（在临时目录中运行，不影响输出）")
+    args = parser.parse_args()
+    output_dir = args.output_dir
     
     # 构建路径
     base_path = f"Paper2Video/{output_dir}/final_results"
@@ -269,8 +468,7 @@ def main():
     print()
     print("🔄 处理流程:")
     print("   Step 0: 复制cover音频文件到Speech_Audio目录")
-    print("   Step 1: 视频音频合并")
-    print("   Step 2: 视频填充处理 (apad)")
+    print(f"   Step 1-2: 视频音频合并 + 填充处理 (apad，单次ffmpeg，并发数 {args.jobs})")
     print("   Step 3: 生成文件列表 (file.txt，cover场景在各部分前面)")
     print("   Step 4: 视频串联 (Full.mp4)")
     print()
@@ -316,67 +514,47 @@ def main():
     print(f"✅ 找到 {len(matches)} 对匹配文件")
     print()
     
-    # 逐个合并文件
-    success_count = 0
-    total_count = len(matches)
+    if args.benchmark:
+        benchmark_assembly(matches, audio_dir, output_video_dir, jobs=args.jobs)
+        return
     
-    print("🎬 开始合并视频和音频...")
-    for i, (video_file, audio_file, basename) in enumerate(matches, 1):
-        print(f"\n[{i}/{total_count}] 处理文件: {basename}")
-        
-        # 构建输出文件路径
-        output_file = os.path.join(output_video_dir, f"{basename}.mp4")
-        
-        # 合并文件
-        if merge_video_audio(video_file, audio_file, output_file):
-            success_count += 1
+    if args.single_pass:
+        if assemble_single_pass(matches, audio_dir, output_video_dir):
+            print()
+            print("🎊 成功生成完整教学视频！")
+            print(f"   📁 文件路径: {os.path.join(output_video_dir, 'Full.mp4')}")
         else:
-            print(f"⚠️  跳过文件: {basename}")
+            sys.exit(1)
+        return
+    
+    # Step 1-2: 并行合并视频音频，合并与填充在同一次ffmpeg调用中完成
+    total_count = len(matches)
     
-    # 显示合并结果
+    print("🎬 开始合并视频和音频（含填充处理）...")
+    start_time = time.time()
+    results = mux_pages(matches, output_video_dir, jobs=args.jobs)
+    elapsed = time.time() - start_time
+    
+    padded_videos = [r['output_file'] for r in results if r['success']]
+    success_count = pad_success_count = len(padded_videos)
+    
+    # 显示合并结果（按页面顺序）
     print()
-    print("🎉 视频音频合并完成！")
+    print("🎉 视频音频合并与填充完成！")
     print("=" * 50)
+    print("⏱️ 各页面耗时:")
+    for r in results:
+        status = "✅" if r['success'] else "❌"
+        print(f"   {status} {r['basename']}: {r['duration']:.1f}s")
     print(f"📊 合并结果:")
     print(f"   ✅ 成功: {success_count} 个文件")
     print(f"   ❌ 失败: {total_count - success_count} 个文件")
+    print(f"   ⏱️ 总耗时: {elapsed:.1f}s")
     print(f"   📁 输出位置: {output_video_dir}")
     
-    if success_count == 0:
-        print()
-        print("❌ 没有成功合并的文件，跳过后续处理")
-        return
-    
-    # Step 2: 视频填充处理
-    print()
-    print("🔧 开始视频填充处理...")
-    
-    merged_videos = glob.glob(os.path.join(output_video_dir, "*.mp4"))
-    padded_videos = []
-    pad_success_count = 0
-    
-    for i, video_file in enumerate(merged_videos, 1):
-        basename = os.path.splitext(os.path.basename(video_file))[0]
-        padded_filename = f"{basename}-padded.mp4"
-        padded_filepath = os.path.join(output_video_dir, padded_filename)
-        
-        print(f"\n[{i}/{len(merged_videos)}] 填充处理: {basename}")
-        
-        if pad_video(video_file, padded_filepath):
-            padded_videos.append(padded_filepath)
-            pad_success_count += 1
-        else:
-            print(f"⚠️  跳过填充: {basename}")
-    
-    print()
-    print("🔧 视频填充处理完成！")
-    print(f"📊 填充结果:")
-    print(f"   ✅ 成功: {pad_success_count} 个文件")
-    print(f"   ❌ 失败: {len(merged_videos) - pad_success_count} 个文件")
-    
     if pad_success_count == 0:
         print()
-        print("❌ 没有成功填充的文件，跳过文件列表生成")
+        print("❌ 没有成功合并的文件，跳过后续处理")
         return
     
     # Step 3: 生成文件列表
@@ -471,4 +649,5 @@ def main():
         print("⚠️  文件列表生成失败，跳过视频串联")
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    with pipeline_progress.span("mux"):
+        main()